@@ -5,35 +5,86 @@ This module contains the main Flask application for Fyyur,
 which facilitates bookings between local performing artists and venues.
 """
 
-import logging
-import sys
-from datetime import datetime, time
-from logging import FileHandler, Formatter
-
-import babel
-import dateutil.parser
-from flask import Flask, flash, redirect, render_template, request, url_for
-from flask_migrate import Migrate
-from flask_moment import Moment
+import os
+from datetime import date, datetime, timedelta
+
+from flask import (Blueprint, Flask, Response, abort, current_app, flash, get_flashed_messages,
+                   jsonify, redirect, render_template, request, send_file, stream_template,
+                   stream_with_context, url_for)
 from sqlalchemy.exc import SQLAlchemyError
 
-from forms import ArtistForm, AvailabilityForm, ShowForm, VenueForm
-from models import Artist, Availability, Show, Venue, db
+import compress
+import health
+import invalidation
+import jobs
+import logs
+import metrics
+import availability
+import cache
+import export
+import listings
+import partitions
+import queries
+import ratelimit
+import shards
+import thumbnails
+from availability import (Slot, format_text_schedule, make_slot, overlaps,
+                          parse_json_schedule, parse_text_schedule, replace_schedule,
+                          slot_mask)
+from cache import (catalog_version, dashboard_cache, entity_cache, normalize_term,
+                   search_cache, search_time_bucket)
 from cli import register_commands
+from config import config_by_name
+from forms import ArtistForm, AvailabilityForm, ShowForm, VenueForm
+from models import Artist, Availability, Job, Show, Venue, db
+from search import GENRES, SearchQuery, parse_search, search_criteria
+
+bp = Blueprint('main', __name__)
 
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
 
-# Import models after app is created
+def create_app(config_name=None):
+    """
+    Create and configure the Flask application.
+
+    Args:
+        config_name (str): Key of ``config.config_by_name``. Defaults to the
+            FYYUR_CONFIG environment variable, then 'development'.
 
-db.init_app(app)
-migrate = Migrate(app, db)
-register_commands(app)
+    Returns:
+        Flask: The configured application.
+    """
+    # Only needed once there is an app to render pages for.
+    from flask_moment import Moment
+
+    config_name = config_name or os.environ.get('FYYUR_CONFIG', 'development')
+
+    app = Flask(__name__)
+    app.config.from_object(config_by_name[config_name])
+    Moment(app)
+
+    compress.init_app(app)
+    metrics.init_app(app)
+    shards.init_app(app)
+    db.init_app(app)
+    cache.init_app(app)
+    invalidation.init_app(app)
+    listings.init_app(app)
+    availability.init_app(app)
+    partitions.init_app(app)
+    thumbnails.init_app(app)
+    health.init_app(app)
+    ratelimit.init_app(app)
+    register_commands(app)
+    logs.init_app(app)
+
+    app.jinja_env.filters['datetime'] = format_datetime
+    app.register_blueprint(bp)
+
+    return app
 
 # ----------------------------------------------------------------------------#
 # Filters.
@@ -45,13 +96,18 @@ def format_datetime(value, fmt='medium'):
       Format a datetime string according to the specified format.
 
       Args:
-          value (str): The input datetime string.
+          value (str | datetime): The input datetime or datetime string.
           fmt (str): The desired output format. Can be 'full' or 'medium'.
 
       Returns:
           str: The formatted datetime string.
       """
-    date = dateutil.parser.parse(value)
+    # Imported on first use: Babel and dateutil are slow to import and are
+    # not needed by CLI commands.
+    import babel.dates
+    import dateutil.parser
+
+    date = value if isinstance(value, datetime) else dateutil.parser.parse(value)
     if fmt == 'full':
         fmt = "EEEE MMMM, d, y 'at' h:mma"
     elif fmt == 'medium':
@@ -59,28 +115,28 @@ def format_datetime(value, fmt='medium'):
     return babel.dates.format_datetime(date, fmt, locale='en')
 
 
-app.jinja_env.filters['datetime'] = format_datetime
-
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
 
-@app.route('/')
+@bp.route('/')
 def index():
     """
-    Render the home page template.
+    Render the home page with recent listings, upcoming shows and top genres.
 
     Returns:
         str: The rendered 'home.html' template.
     """
-    return render_template('pages/home.html')
+    dashboard = dashboard_cache.get_or_set(
+        ('home', catalog_version()), queries.home_dashboard)
+    return render_template('pages/home.html', dashboard=dashboard)
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@bp.route('/venues')
 def venues():
     """
     Query venues grouped by city and state.
@@ -89,8 +145,8 @@ def venues():
         dict: A dictionary containing venues grouped by location.
     """
     venues_by_location = {}
-    all_venues = Venue.query.all()
-    for venue in all_venues:
+    summaries = shards.gather(queries.venue_summaries, key=_venue_location)
+    for venue in summaries:
         location = (venue.city, venue.state)
         if location not in venues_by_location:
             venues_by_location[location] = {
@@ -99,30 +155,25 @@ def venues():
                 "venues": []
             }
 
-        # Count upcoming shows
-        upcoming_shows = db.session.query(Show).filter(
-            Show.venue_id == venue.id,
-            Show.start_time > datetime.now()
-        ).count()
-
-        venues_by_location[location]["venues"].append({
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": upcoming_shows
-        })
+        venues_by_location[location]["venues"].append(venue)
 
     # Convert to list for template
     data = list(venues_by_location.values())
     return render_template('pages/venues.html', areas=data)
 
 
-@app.route('/venues/search', methods=['POST'])
+def _venue_location(venue):
+    return venue.state, venue.city, venue.name
+
+
+@bp.route('/venues/search', methods=['POST'])
 def search_venues():
     """
     Handle POST requests for venue search.
 
     Searches for venues based on the search term provided in the request form.
-    Returns a JSON response with count of venues found and the list of venues.
+    Results are cached per normalized term and catalog version, for at
+    most a minute since they count upcoming shows.
 
     Args:
         None
@@ -131,30 +182,59 @@ def search_venues():
         dict: A dictionary containing the count of venues and the list of venues.
     """
     search_term = request.form.get('search_term', '')
-    search_results = Venue.query.filter(
-        Venue.name.ilike(f'%{search_term}%')).all()
+    term = ' '.join(search_term.split())
 
-    response = {
-        "count": len(venues),
-        "data": []
-    }
+    response = search_cache.get_or_set(
+        ('venues', normalize_term(term), catalog_version(), search_time_bucket()),
+        lambda: _search_response(_venue_search(Venue.name.ilike(f'%{term}%')))
+    )
 
-    for venue in search_results:
-        upcoming_shows = db.session.query(Show).filter(
-            Show.venue_id == venue.id,
-            Show.start_time > datetime.now()
-        ).count()
+    return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
-        response["data"].append({
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": upcoming_shows
-        })
 
-    return render_template('pages/search_venues.html', results=response, search_term=search_term)
+@bp.route('/venues/open-dates')
+def venue_open_dates():
+    """
+    Find venues in a city with free nights in a date range.
 
+    Query args: ``city``, ``state``, ``start`` and ``end`` (YYYY-MM-DD, end
+    inclusive) and optionally ``genre``. Without a city and state only the
+    search form is shown. The range may span at most OPEN_DATES_MAX_DAYS
+    nights.
 
-@app.route('/venues/<int:venue_id>')
+    Returns:
+        render_template: The 'pages/venue_open_dates.html' template.
+    """
+    args = request.args
+    city = args.get('city', '').strip()
+    state = args.get('state', '').strip().upper()
+    genre = args.get('genre', '').strip()
+    today = date.today()
+    try:
+        start = date.fromisoformat(args['start']) if args.get('start') else today
+        end = date.fromisoformat(args['end']) if args.get('end') else start + timedelta(days=6)
+    except ValueError:
+        abort(400)
+
+    search = {"city": city, "state": state, "genre": genre, "start": start, "end": end}
+    results = None
+    max_days = current_app.config['OPEN_DATES_MAX_DAYS']
+    if end < start:
+        flash('The end date must not be before the start date.')
+    elif (end - start).days >= max_days:
+        flash(f'Please pick a range of at most {max_days} nights.')
+    elif city and state:
+        query = SearchQuery(city=city.lower(), state=state,
+                            genres=(GENRES.get(genre.casefold(), genre),) if genre else ())
+        with shards.region(shards.region_for_state(state)):
+            results = queries.venue_open_dates(start, end, *search_criteria(Venue, query))
+
+    return render_template('pages/venue_open_dates.html', search=search, results=results,
+                           genres=sorted(GENRES.values()))
+
+
+@bp.route('/venues/<int:venue_id>')
+@shards.routed('venue_id')
 def show_venue(venue_id):
     """
     Display detailed information about a specific venue.
@@ -165,38 +245,12 @@ def show_venue(venue_id):
     Returns:
         dict: A dictionary containing venue information and past/upcoming shows.
     """
-    # Get venue by ID
-    venue = Venue.query.get_or_404(venue_id)
+    venue = _snapshot_or_404(Venue, venue_id)
 
-    # Get past shows
-    past_shows_query = db.session.query(Show).join(Artist).filter(
-        Show.venue_id == venue_id,
-        Show.start_time < datetime.now()
-    ).all()
-
-    past_shows = []
-    for show in past_shows_query:
-        past_shows.append({
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        })
-
-    # Get upcoming shows
-    upcoming_shows_query = db.session.query(Show).join(Artist).filter(
-        Show.venue_id == venue_id,
-        Show.start_time >= datetime.now()
-    ).all()
-
-    upcoming_shows = []
-    for show in upcoming_shows_query:
-        upcoming_shows.append({
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        })
+    now = datetime.now()
+    upcoming_shows = queries.venue_upcoming_shows(venue_id, now)
+    past_shows, cursor = queries.venue_past_shows(
+        venue_id, current_app.config['PAST_SHOWS_PAGE_SIZE'], now=now)
 
     # Format data for template
     data = {
@@ -213,18 +267,46 @@ def show_venue(venue_id):
         "seeking_description": venue.seeking_description,
         "image_link": venue.image_link,
         "past_shows": past_shows,
+        "past_shows_next": _past_shows_url('.venue_past_shows', cursor, venue_id=venue_id),
         "upcoming_shows": upcoming_shows,
-        "past_shows_count": len(past_shows),
+        "past_shows_count": queries.past_show_count(Show.venue_id, venue_id, now),
         "upcoming_shows_count": len(upcoming_shows)
     }
 
     return render_template('pages/show_venue.html', venue=data)
 
+
+@bp.route('/venues/<int:venue_id>/past-shows')
+@shards.routed('venue_id')
+def venue_past_shows(venue_id):
+    """
+    Return the next page of a venue's past shows as HTML tiles.
+
+    Query args ``before`` and ``before_id`` carry the cursor from the
+    previous page's "load more" link.
+
+    Args:
+        venue_id (int): The ID of the venue.
+
+    Returns:
+        render_template: The 'pages/venue_past_shows.html' fragment.
+
+    Raises:
+        NotFound: If there is no such venue.
+    """
+    shows, cursor = queries.venue_past_shows(
+        venue_id, current_app.config['PAST_SHOWS_PAGE_SIZE'], before=_show_cursor())
+    if not shows:
+        # Only an empty page can mean a missing venue
+        _snapshot_or_404(Venue, venue_id)
+    return render_template('pages/venue_past_shows.html', shows=shows,
+                           next_url=_past_shows_url('.venue_past_shows', cursor, venue_id=venue_id))
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
     """
     Renders the form for creating a new venue.
@@ -236,7 +318,7 @@ def create_venue_form():
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     """
     Handles the submission of a new venue creation form.
@@ -270,12 +352,13 @@ def create_venue_submission():
             seeking_description=form.seeking_description.data
         )
 
-        db.session.add(venue)
-        db.session.commit()
+        with shards.region(shards.region_for_state(venue.state)):
+            db.session.add(venue)
+            db.session.commit()
     except SQLAlchemyError:
         error = True
         db.session.rollback()
-        print(sys.exc_info())
+        current_app.logger.exception('Venue could not be created')
     finally:
         db.session.close()
 
@@ -288,71 +371,80 @@ def create_venue_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<int:venue_id>', methods=['DELETE'])
+@shards.routed('venue_id')
 def delete_venue(venue_id):
     """
-    Deletes a venue by its ID.
+    Queue the deletion of a venue and its shows.
+
+    The delete runs in a background job (see jobs.py), so a venue with a
+    long show history does not hold the request open.
 
     Args:
         venue_id (int): The ID of the venue to be deleted.
 
     Returns:
-        None
-
-    Raises:
-        Exception: If there's an error during deletion.
+        Response: The queued job's status (see ``job_status``) with status
+        202 and a Location header pointing at it, or a JSON error with
+        status 500.
     """
-    error = False
+    Venue.query.get_or_404(venue_id)
     try:
-        venue = Venue.query.get(venue_id)
-        db.session.delete(venue)
+        job = jobs.enqueue('delete_venue', venue_id=venue_id)
+        db.session.flush()
+        # Read before the commit expires the job
+        status = jobs.job_status(job)
         db.session.commit()
-    except SQLAlchemyError as e:
-        error = True
+    except SQLAlchemyError:
         db.session.rollback()
-        print(e)
-    finally:
-        db.session.close()
+        current_app.logger.exception('Venue %s could not be queued for deletion', venue_id)
+        return jsonify(error=f'Venue {venue_id} could not be deleted.'), 500
 
-    if error:
-        flash('An error occurred. Venue ' +
-              str(venue_id) + ' could not be deleted.')
-    else:
-        flash('Venue ' + str(venue_id) + ' was successfully deleted.')
+    response = jsonify(status)
+    response.status_code = 202
+    response.headers['Location'] = url_for('.job_status', job_id=status['id'])
+    return response
+
+
+@bp.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    """
+    Report the status of a background job.
+
+    Args:
+        job_id (int): The ID of the job.
 
-    return redirect(url_for('venues'))
+    Returns:
+        Response: JSON with the job's status, attempts, result and error.
+    """
+    return jsonify(jobs.job_status(db.get_or_404(Job, job_id)))
 
 #  Artists
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists')
+@bp.route('/artists')
 def artists():
     """
-    Retrieve and format a list of all artists.
+    Retrieve a list of all artists.
 
     Returns:
-        list: A list of dictionaries containing artist information.
+        Response: The artists page, streamed as the rows are read from a
+        server-side cursor.
     """
-    all_artists = Artist.query.order_by('name').all()
-    data = []
-
-    for artist in all_artists:
-        data.append({
-            "id": artist.id,
-            "name": artist.name
-        })
+    artists = shards.merge_streams(queries.artist_summaries, key=_by_name,
+                                   batch_size=current_app.config['LISTING_BATCH_SIZE'])
+    return _stream_page('pages/artists.html', artists=artists)
 
-    return render_template('pages/artists.html', artists=data)
 
-
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['POST'])
 def search_artists():
     """
     Handle POST requests for artist search.
 
     Searches for artists based on the search term provided in the request form.
-    Returns a JSON response with count of artists found and the list of artists.
+    Results are cached per normalized term and catalog version, for at
+    most a minute since they count upcoming shows.
 
     Args:
         None
@@ -362,30 +454,18 @@ def search_artists():
 
     """
     search_term = request.form.get('search_term', '')
-    search_results = Artist.query.filter(
-        Artist.name.ilike(f'%{search_term}%')).all()
-
-    response = {
-        "count": len(search_results),
-        "data": []
-    }
+    term = ' '.join(search_term.split())
 
-    for artist in search_results:
-        upcoming_shows = db.session.query(Show).filter(
-            Show.artist_id == artist.id,
-            Show.start_time > datetime.now()
-        ).count()
-
-        response["data"].append({
-            "id": artist.id,
-            "name": artist.name,
-            "num_upcoming_shows": upcoming_shows
-        })
+    response = search_cache.get_or_set(
+        ('artists', normalize_term(term), catalog_version(), search_time_bucket()),
+        lambda: _search_response(_artist_search(Artist.name.ilike(f'%{term}%')))
+    )
 
     return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 
-@app.route('/artists/<int:artist_id>')
+@bp.route('/artists/<int:artist_id>')
+@shards.routed('artist_id')
 def show_artist(artist_id):
     """
     Display detailed information about a specific artist.
@@ -396,38 +476,12 @@ def show_artist(artist_id):
     Returns:
         dict: A dictionary containing artist information and past/upcoming shows.
     """
-    # Get artist by ID
-    artist = Artist.query.get_or_404(artist_id)
+    artist = _snapshot_or_404(Artist, artist_id)
 
-    # Get past shows
-    past_shows_query = db.session.query(Show).join(Venue).filter(
-        Show.artist_id == artist_id,
-        Show.start_time < datetime.now()
-    ).all()
-
-    past_shows = []
-    for show in past_shows_query:
-        past_shows.append({
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "venue_image_link": show.venue.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        })
-
-    # Get upcoming shows
-    upcoming_shows_query = db.session.query(Show).join(Venue).filter(
-        Show.artist_id == artist_id,
-        Show.start_time >= datetime.now()
-    ).all()
-
-    upcoming_shows = []
-    for show in upcoming_shows_query:
-        upcoming_shows.append({
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "venue_image_link": show.venue.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        })
+    now = datetime.now()
+    upcoming_shows = queries.artist_upcoming_shows(artist_id, now)
+    past_shows, cursor = queries.artist_past_shows(
+        artist_id, current_app.config['PAST_SHOWS_PAGE_SIZE'], now=now)
 
     # Format data for template
     data = {
@@ -443,18 +497,48 @@ def show_artist(artist_id):
         "seeking_description": artist.seeking_description,
         "image_link": artist.image_link,
         "past_shows": past_shows,
+        "past_shows_next": _past_shows_url('.artist_past_shows', cursor, artist_id=artist_id),
         "upcoming_shows": upcoming_shows,
-        "past_shows_count": len(past_shows),
+        "past_shows_count": sum(shards.scatter(queries.past_show_count, Show.artist_id,
+                                               artist_id, now)),
         "upcoming_shows_count": len(upcoming_shows)
     }
 
     return render_template('pages/show_artist.html', artist=data)
 
+
+@bp.route('/artists/<int:artist_id>/past-shows')
+@shards.routed('artist_id')
+def artist_past_shows(artist_id):
+    """
+    Return the next page of an artist's past shows as HTML tiles.
+
+    Query args ``before`` and ``before_id`` carry the cursor from the
+    previous page's "load more" link.
+
+    Args:
+        artist_id (int): The ID of the artist.
+
+    Returns:
+        render_template: The 'pages/artist_past_shows.html' fragment.
+
+    Raises:
+        NotFound: If there is no such artist.
+    """
+    shows, cursor = queries.artist_past_shows(
+        artist_id, current_app.config['PAST_SHOWS_PAGE_SIZE'], before=_show_cursor())
+    if not shows:
+        # Only an empty page can mean a missing artist
+        _snapshot_or_404(Artist, artist_id)
+    return render_template('pages/artist_past_shows.html', shows=shows,
+                           next_url=_past_shows_url('.artist_past_shows', cursor, artist_id=artist_id))
+
 #  Update
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@shards.routed('artist_id')
 def edit_artist(artist_id):
     """
     Render the form to edit an artist with the given artist_id.
@@ -467,7 +551,7 @@ def edit_artist(artist_id):
         ArtistForm instance and the artist data.
     """
     form = ArtistForm()
-    artist = Artist.query.get_or_404(artist_id)
+    artist = _snapshot_or_404(Artist, artist_id)
 
     # Pre-fill form with existing data
     form.name.data = artist.name
@@ -480,7 +564,8 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@shards.routed('artist_id')
 def edit_artist_submission(artist_id):
     """
     Handles the submission of edits for an artist with the given artist_id.
@@ -499,6 +584,10 @@ def edit_artist_submission(artist_id):
     error = False
     artist = Artist.query.get_or_404(artist_id)
     form = ArtistForm(request.form)
+    if shards.enabled() and shards.moves_region(artist_id, form.state.data):
+        flash(f'Artists in {artist.state} cannot move to {form.state.data}, '
+              'which is served by another region.')
+        return redirect(url_for('.show_artist', artist_id=artist_id))
 
     try:
         artist.name = form.name.data
@@ -513,10 +602,11 @@ def edit_artist_submission(artist_id):
         artist.seeking_description = form.seeking_description.data
 
         db.session.commit()
+        shards.sync_artist_copies(artist_id)
     except SQLAlchemyError:
         error = True
         db.session.rollback()
-        print(sys.exc_info())
+        current_app.logger.exception('Artist %s could not be updated', artist_id)
     finally:
         db.session.close()
 
@@ -525,10 +615,11 @@ def edit_artist_submission(artist_id):
     else:
         flash('Artist was successfully updated!')
 
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    return redirect(url_for('.show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@shards.routed('venue_id')
 def edit_venue(venue_id):
     """
     Render the form to edit a venue with the given venue_id.
@@ -541,7 +632,7 @@ def edit_venue(venue_id):
         VenueForm instance and the venue data.
     """
     form = VenueForm()
-    venue = Venue.query.get_or_404(venue_id)
+    venue = _snapshot_or_404(Venue, venue_id)
 
     # Pre-fill form with existing data
     form.name.data = venue.name
@@ -559,7 +650,8 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@shards.routed('venue_id')
 def edit_venue_submission(venue_id):
     """
     Handles the submission of edits for a venue with the given venue_id.
@@ -578,6 +670,10 @@ def edit_venue_submission(venue_id):
     error = False
     venue = Venue.query.get_or_404(venue_id)
     form = VenueForm(request.form)
+    if shards.enabled() and shards.moves_region(venue_id, form.state.data):
+        flash(f'Venues in {venue.state} cannot move to {form.state.data}, '
+              'which is served by another region.')
+        return redirect(url_for('.show_venue', venue_id=venue_id))
 
     try:
         venue.name = form.name.data
@@ -596,7 +692,7 @@ def edit_venue_submission(venue_id):
     except SQLAlchemyError:
         error = True
         db.session.rollback()
-        print(sys.exc_info())
+        current_app.logger.exception('Venue %s could not be updated', venue_id)
     finally:
         db.session.close()
 
@@ -605,10 +701,10 @@ def edit_venue_submission(venue_id):
     else:
         flash('Venue was successfully updated!')
 
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    return redirect(url_for('.show_venue', venue_id=venue_id))
 
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
     """
     Renders the form for creating a new artist.
@@ -620,7 +716,7 @@ def create_artist_form():
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     """
     Handles the submission of a new artist creation form.
@@ -652,11 +748,13 @@ def create_artist_submission():
             seeking_description=form.seeking_description.data
         )
 
-        db.session.add(artist)
-        db.session.commit()
+        with shards.region(shards.region_for_state(artist.state)):
+            db.session.add(artist)
+            db.session.commit()
     except SQLAlchemyError:
         error = True
         db.session.rollback()
+        current_app.logger.exception('Artist could not be created')
     finally:
         db.session.close()
 
@@ -672,34 +770,24 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@bp.route('/shows')
 def shows():
     """
-    Retrieves and formats a list of all shows.
+    Retrieves a list of all shows.
 
     Returns:
-        list: A list of dictionaries containing show information.
+        Response: The shows page, streamed as the rows are read from a
+        server-side cursor.
 
-    This function queries the database for all shows, joins with venue and artist data,
-    and formats it into a list of dictionaries for easy rendering in the template.
+    Rows come from the denormalized show_listings table, read in start
+    time order without joining venues and artists.
     """
-    all_shows = Show.query.join(Venue).join(Artist).all()
-    data = []
+    shows = shards.merge_streams(queries.show_listings, key=_by_start_time,
+                                 batch_size=current_app.config['LISTING_BATCH_SIZE'])
+    return _stream_page('pages/shows.html', shows=shows)
 
-    for show in all_shows:
-        data.append({
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        })
 
-    return render_template('pages/shows.html', shows=data)
-
-
-@app.route('/shows/create', methods=['GET'])
+@bp.route('/shows/create', methods=['GET'])
 def create_shows():
     """
     Renders the form for creating a new show.
@@ -711,7 +799,7 @@ def create_shows():
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
     """
     Handles the submission of a new show creation form.
@@ -736,12 +824,18 @@ def create_show_submission():
             start_time=form.start_time.data
         )
 
-        db.session.add(show)
-        db.session.commit()
-    except SQLAlchemyError:
+        # The show lives with its venue; an artist from another region is
+        # copied there first (see shards.py).
+        region = shards.region_for_id(int(show.venue_id))
+        with shards.region(region):
+            if shards.enabled():
+                shards.copy_artist(int(show.artist_id), region)
+            db.session.add(show)
+            db.session.commit()
+    except (SQLAlchemyError, ValueError):
         error = True
         db.session.rollback()
-        print(sys.exc_info())
+        current_app.logger.exception('Show could not be created')
     finally:
         db.session.close()
 
@@ -753,125 +847,232 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/venues/advanced-search', methods=['POST'])
+def _show_cursor():
+    """Read a ``(start_time, id)`` past-shows cursor from the query string."""
+    before = request.args.get('before')
+    before_id = request.args.get('before_id', type=int)
+    if before is None or before_id is None:
+        return None
+    try:
+        return datetime.fromisoformat(before), before_id
+    except ValueError:
+        abort(400)
+
+
+def _past_shows_url(endpoint, cursor, **values):
+    """Build the "load more" URL for a past-shows cursor, or None on the last page."""
+    if cursor is None:
+        return None
+    start_time, show_id = cursor
+    return url_for(endpoint, before=start_time.isoformat(), before_id=show_id, **values)
+
+
+def _buffered(chunks, size):
+    """Join the small pieces a streamed template yields into chunks of about ``size`` characters."""
+    buffer, length = [], 0
+    try:
+        for chunk in chunks:
+            buffer.append(chunk)
+            length += len(chunk)
+            if length >= size:
+                yield ''.join(buffer)
+                buffer, length = [], 0
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        chunks.close()
+
+
+def _stream_page(template_name, **context):
+    """
+    Render a template as a streamed response.
+
+    The page is sent while it renders, so a row iterator in ``context`` is
+    consumed as the client receives the page instead of being held in memory.
+
+    Args:
+        template_name (str): The template to render.
+        **context: Template variables.
+
+    Returns:
+        Response: The streamed page.
+    """
+    # The layout pops flashed messages from the session, which can no longer
+    # be saved once streaming starts; pop them now so they are not shown twice.
+    get_flashed_messages()
+    chunks = stream_template(template_name, **context)
+    return Response(_buffered(chunks, current_app.config['STREAM_CHUNK_SIZE']))
+
+
+def _snapshot_or_404(model, obj_id):
+    """
+    Return the cached snapshot of a venue or artist (see ``cache.EntityCache``).
+
+    For read-only views; views that change the row load it through the session.
+
+    Raises:
+        NotFound: If there is no such venue or artist.
+    """
+    snapshot = entity_cache.get(model, obj_id, queries.entity_snapshot)
+    if snapshot is None:
+        abort(404)
+    return snapshot
+
+
+def _by_name(row):
+    return row.name, row.id
+
+
+def _by_start_time(row):
+    return row.start_time, row.show_id
+
+
+def _venue_search(*criteria, state=None):
+    """Search venues in every region, or only in ``state``'s region if given."""
+    if state:
+        with shards.region(shards.region_for_state(state)):
+            return queries.venue_search(*criteria)
+    return shards.gather(queries.venue_search, *criteria, key=_by_name)
+
+
+def _artist_search(*criteria):
+    """Search artists in every region, adding up the upcoming shows of each artist's copies."""
+    rows = shards.gather(queries.artist_search, *criteria, key=_by_name)
+    return list(shards.merge_copies(rows, counts=('num_upcoming_shows',)))
+
+
+def _search_response(rows):
+    """Shape search result rows for the search templates."""
+    return {
+        "count": len(rows),
+        "data": rows
+    }
+
+
+@bp.route('/venues/advanced-search', methods=['POST'])
 def advanced_search_venues():
     """
-    Search venues by name, city, and state.
-    Format: "Name, City, State" - each part is optional
+    Search venues by name plus exact city, state and genre facets.
+    Format: free text with optional city:, state: and genre: facets, or the
+    older "Name, City, State" form (see search.parse_search)
     Examples: 
+        - "musical city:san francisco state:CA"
+        - "genre:jazz state:NY"
         - "Musical, San Francisco, CA"
         - "San Francisco, CA"
         - "Music"
     """
     search_term = request.form.get('search_term', '')
-    parts = [part.strip() for part in search_term.split(',')]
-
-    # Initialize the query
-    query = Venue.query
-
-    # Apply filters based on parts provided
-    if len(parts) == 1:
-        # Just name
-        query = query.filter(Venue.name.ilike(f'%{parts[0]}%'))
-    elif len(parts) == 2:
-        # City and State, or Name and City
-        query = query.filter(
-            (Venue.name.ilike(f'%{parts[0]}%') & Venue.city.ilike(f'%{parts[1]}%')) |
-            (Venue.city.ilike(f'%{parts[0]}%') &
-             Venue.state.ilike(f'%{parts[1]}%'))
-        )
-    elif len(parts) >= 3:
-        # Name, City, and State
-        query = query.filter(
-            Venue.name.ilike(f'%{parts[0]}%') &
-            Venue.city.ilike(f'%{parts[1]}%') &
-            Venue.state.ilike(f'%{parts[2]}%')
-        )
-
-    search_results = query.all()
-
-    response = {
-        "count": len(search_results),
-        "data": []
-    }
+    query = parse_search(search_term)
 
-    for venue in search_results:
-        upcoming_shows = db.session.query(Show).filter(
-            Show.venue_id == venue.id,
-            Show.start_time > datetime.now()
-        ).count()
-
-        response["data"].append({
-            "id": venue.id,
-            "name": venue.name,
-            "city": venue.city,
-            "state": venue.state,
-            "num_upcoming_shows": upcoming_shows
-        })
+    response = search_cache.get_or_set(
+        ('venues-advanced', query, catalog_version(), search_time_bucket()),
+        lambda: _search_response(
+            _venue_search(*search_criteria(Venue, query), state=query.state))
+    )
 
     return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 
-@app.route('/artists/advanced-search', methods=['POST'])
+@bp.route('/artists/advanced-search', methods=['POST'])
 def advanced_search_artists():
     """
-    Search artists by name, city, and state.
-    Format: "Name, City, State" - each part is optional
+    Search artists by name plus exact city, state and genre facets.
+    Format: free text with optional city:, state: and genre: facets, or the
+    older "Name, City, State" form (see search.parse_search)
     Examples: 
+        - "band city:san francisco genre:rock n roll"
+        - "state:NY"
         - "Band, San Francisco, CA"
         - "New York, NY"
         - "Jazz"
     """
     search_term = request.form.get('search_term', '')
-    parts = [part.strip() for part in search_term.split(',')]
-
-    # Initialize the query
-    query = Artist.query
-
-    # Apply filters based on parts provided
-    if len(parts) == 1:
-        # Just name
-        query = query.filter(Artist.name.ilike(f'%{parts[0]}%'))
-    elif len(parts) == 2:
-        # City and State, or Name and City
-        query = query.filter(
-            (Artist.name.ilike(f'%{parts[0]}%') & Artist.city.ilike(f'%{parts[1]}%')) |
-            (Artist.city.ilike(f'%{parts[0]}%') &
-             Artist.state.ilike(f'%{parts[1]}%'))
-        )
-    elif len(parts) >= 3:
-        # Name, City, and State
-        query = query.filter(
-            Artist.name.ilike(f'%{parts[0]}%') &
-            Artist.city.ilike(f'%{parts[1]}%') &
-            Artist.state.ilike(f'%{parts[2]}%')
-        )
+    query = parse_search(search_term)
 
-    search_results = query.all()
+    response = search_cache.get_or_set(
+        ('artists-advanced', query, catalog_version(), search_time_bucket()),
+        lambda: _search_response(_artist_search(*search_criteria(Artist, query)))
+    )
 
-    response = {
-        "count": len(search_results),
-        "data": []
-    }
+    return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
-    for artist in search_results:
-        upcoming_shows = db.session.query(Show).filter(
-            Show.artist_id == artist.id,
-            Show.start_time > datetime.now()
-        ).count()
 
-        response["data"].append({
-            "id": artist.id,
-            "name": artist.name,
-            "city": artist.city,
-            "state": artist.state,
-            "num_upcoming_shows": upcoming_shows
-        })
+#  Export
+#  ----------------------------------------------------------------
 
-    return render_template('pages/search_artists.html', results=response, search_term=search_term)
+@bp.route('/export/<any(venues, artists, shows):entity>.<any(csv, ndjson):fmt>')
+def export_catalog(entity, fmt):
+    """
+    Stream every venue, artist or show as CSV or NDJSON.
 
+    Rows are fetched through a server-side cursor and sent as they are
+    encoded (see export.py).
 
-@app.route('/artists/<int:artist_id>/availability')
+    Args:
+        entity (str): 'venues', 'artists' or 'shows'.
+        fmt (str): 'csv' or 'ndjson'.
+
+    Returns:
+        Response: A streamed attachment.
+    """
+    chunks = export.export_chunks(entity, fmt, current_app.config['EXPORT_BATCH_SIZE'])
+    response = Response(stream_with_context(chunks), mimetype=export.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={entity}.{fmt}'
+    return response
+
+
+#  Images
+#  ----------------------------------------------------------------
+
+THUMBNAIL_MODELS = {'artist': Artist, 'venue': Venue}
+
+
+@bp.route('/img/<kind>/<int:obj_id>/<int:width>')
+def thumbnail(kind, obj_id, width):
+    """
+    Serve a resized copy of an artist's or venue's image.
+
+    Args:
+        kind (str): 'artist' or 'venue'.
+        obj_id (int): The artist or venue ID.
+        width (int): One of the THUMBNAIL_SIZES widths.
+
+    Returns:
+        Response: The JPEG thumbnail, or a redirect to the original image
+        if it could not be fetched or decoded. Links refused as unsafe (not
+        http(s), or on a private address) are not found.
+    """
+    model = THUMBNAIL_MODELS.get(kind)
+    if model is None or width not in current_app.config['THUMBNAIL_SIZES']:
+        abort(404)
+    with shards.region(shards.region_for_id(obj_id)):
+        image_link = _snapshot_or_404(model, obj_id).image_link
+    if not image_link:
+        abort(404)
+
+    try:
+        path, digest = thumbnails.get_thumbnail(image_link, width)
+    except thumbnails.UnsafeSourceError as exc:
+        current_app.logger.warning('Thumbnail of %s %s refused: %s', kind, obj_id, exc)
+        abort(404)
+    except thumbnails.ThumbnailError as exc:
+        current_app.logger.warning('Thumbnail of %s %s failed: %s', kind, obj_id, exc)
+        return redirect(image_link)
+
+    if request.args.get('v') == thumbnails.link_version(image_link):
+        # Versioned URLs change with image_link, so they can be cached forever.
+        response = send_file(path, mimetype='image/jpeg', etag=f'{digest}-{width}',
+                             max_age=365 * 24 * 3600)
+        response.cache_control.immutable = True
+    else:
+        response = send_file(path, mimetype='image/jpeg', etag=f'{digest}-{width}',
+                             max_age=300)
+    return response
+
+
+@bp.route('/artists/<int:artist_id>/availability')
+@shards.routed('artist_id')
 def artist_availability(artist_id):
     """
     Displays the availability schedule for an artist.
@@ -880,11 +1081,11 @@ def artist_availability(artist_id):
         artist_id (int): The ID of the artist whose availability is being displayed.
 
     Returns:
-        render_template: The rendered 'pages/artist_availability.html' template 
+        render_template: The rendered 'pages/artists_availabilty.html' template 
         with the artist's availability information.
     """
     # Get artist and their availability slots
-    artist = Artist.query.get_or_404(artist_id)
+    artist = _snapshot_or_404(Artist, artist_id)
     availabilities = Availability.query.filter_by(
         artist_id=artist_id).order_by('day_of_week', 'start_time').all()
 
@@ -899,11 +1100,16 @@ def artist_availability(artist_id):
     form = AvailabilityForm()
     form.artist_id.data = artist_id
 
-    return render_template('pages/artist_availability.html', artist=artist,
-                           availability_by_day=availability_by_day, form=form)
+    schedule = format_text_schedule(
+        Slot(a.day_of_week, a.start_time, a.end_time) for a in availabilities)
 
+    return render_template('pages/artists_availabilty.html', artist=artist,
+                           availability_by_day=availability_by_day, form=form,
+                           schedule=schedule)
 
-@app.route('/artists/<int:artist_id>/availability/create', methods=['POST'])
+
+@bp.route('/artists/<int:artist_id>/availability/create', methods=['POST'])
+@shards.routed('artist_id')
 def create_artist_availability(artist_id):
     """
     Creates a new availability entry for an artist.
@@ -919,25 +1125,21 @@ def create_artist_availability(artist_id):
     # Validate the form
     if form.validate_on_submit():
         try:
-            # Parse time strings to time objects
-            start_parts = form.start_time.data.split(':')
-            end_parts = form.end_time.data.split(':')
-
-            start_time = time(int(start_parts[0]), int(start_parts[1]))
-            end_time = time(int(end_parts[0]), int(end_parts[1]))
-
-            # Check if start is before end
-            if start_time >= end_time:
-                flash('Start time must be before end time.')
-                return redirect(url_for('artist_availability', artist_id=artist_id))
+            slot = make_slot(form.day_of_week.data, form.start_time.data, form.end_time.data)
+        except ValueError as exc:
+            flash(str(exc))
+            return redirect(url_for('.artist_availability', artist_id=artist_id))
+
+        # One AND against the artist's weekly bitmask instead of comparing rows.
+        # The lock makes concurrent saves check and insert one after the other.
+        artist = Artist.query.filter_by(id=artist_id).with_for_update().first_or_404()
+        if overlaps(artist.availability_mask, slot_mask(slot)):
+            flash('This slot overlaps existing availability.')
+            return redirect(url_for('.artist_availability', artist_id=artist_id))
 
+        try:
             # Create new availability
-            availability = Availability(
-                artist_id=artist_id,
-                day_of_week=int(form.day_of_week.data),
-                start_time=start_time,
-                end_time=end_time
-            )
+            availability = Availability(artist_id=artist_id, **slot._asdict())
 
             db.session.add(availability)
             db.session.commit()
@@ -948,10 +1150,59 @@ def create_artist_availability(artist_id):
     else:
         flash('Please correct the errors in the form.')
 
-    return redirect(url_for('artist_availability', artist_id=artist_id))
+    return redirect(url_for('.artist_availability', artist_id=artist_id))
+
+
+@bp.route('/artists/<int:artist_id>/availability/week', methods=['POST', 'PUT'])
+@shards.routed('artist_id')
+def replace_artist_availability(artist_id):
+    """
+    Replaces an artist's whole weekly availability in one transaction.
+
+    Accepts a JSON body ``{"slots": [...]}`` (answered with JSON) or the
+    availability page's ``schedule`` text field (answered with a redirect).
+    Only the slots that changed are deleted or inserted.
+
+    Args:
+        artist_id (int): The ID of the artist.
+
+    Returns:
+        Response: JSON with the ``inserted``, ``deleted`` and ``slots``
+        counts, or a redirect to the artist's availability page.
+    """
+    Artist.query.get_or_404(artist_id)
+    wants_json = request.is_json
+
+    try:
+        if wants_json:
+            slots = parse_json_schedule(request.get_json(silent=True))
+        else:
+            slots = parse_text_schedule(request.form.get('schedule', ''))
+    except ValueError as exc:
+        if wants_json:
+            return jsonify(error=str(exc)), 400
+        flash(f'Schedule not saved. {exc}')
+        return redirect(url_for('.artist_availability', artist_id=artist_id))
+
+    try:
+        inserted, deleted = replace_schedule(artist_id, slots)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        current_app.logger.exception('Availability of artist %s could not be saved', artist_id)
+        if wants_json:
+            return jsonify(error='Availability could not be saved.'), 500
+        flash('An error occurred. Availability could not be saved.')
+        return redirect(url_for('.artist_availability', artist_id=artist_id))
+
+    if wants_json:
+        return jsonify(inserted=inserted, deleted=deleted, slots=len(slots))
+    flash(f'Availability saved: {inserted} added, {deleted} removed.')
+    return redirect(url_for('.artist_availability', artist_id=artist_id))
 
 
-@app.route('/artists/<int:artist_id>/availability/<int:availability_id>/delete', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/availability/<int:availability_id>/delete', methods=['POST'])
+@shards.routed('artist_id')
 def delete_artist_availability(artist_id, availability_id):
     """
     Deletes an availability entry for an artist.
@@ -971,7 +1222,7 @@ def delete_artist_availability(artist_id, availability_id):
     # Verify availability belongs to the specified artist
     if availability.artist_id != artist_id:
         flash('Invalid operation.')
-        return redirect(url_for('artist_availability', artist_id=artist_id))
+        return redirect(url_for('.artist_availability', artist_id=artist_id))
 
     try:
         db.session.delete(availability)
@@ -981,11 +1232,11 @@ def delete_artist_availability(artist_id, availability_id):
         db.session.rollback()
         flash(f'An error occurred: {str(e)}')
 
-    return redirect(url_for('artist_availability', artist_id=artist_id))
+    return redirect(url_for('.artist_availability', artist_id=artist_id))
 
 
-@app.errorhandler(404)
-def not_found_error():
+@bp.app_errorhandler(404)
+def not_found_error(error):
     """
     Error handler for 404 Not Found errors.
 
@@ -998,8 +1249,8 @@ def not_found_error():
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
-def server_error():
+@bp.app_errorhandler(500)
+def server_error(error):
     """
     Error handler for 500 Internal Server Error.
 
@@ -1012,21 +1263,10 @@ def server_error():
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
@@ -0,0 +1,380 @@
+"""
+Whole-week availability schedules for artists.
+
+An artist's schedule is the set of their ``Availability`` rows. The bulk
+editor submits the complete week at once; ``replace_schedule`` diffs it
+against the stored rows and applies the difference with one DELETE and one
+INSERT, instead of a request and commit per slot.
+
+Schedules are accepted as JSON::
+
+    {"slots": [{"day_of_week": 0, "start_time": "09:00", "end_time": "12:00"}, ...]}
+
+or as text, one day per line with comma-separated ranges::
+
+    Monday 09:00-12:00, 14:00-17:00
+    Sat 10:00-16:00
+
+Slots start and end on quarter hours (an end of 23:59 means midnight) and
+may not overlap. Alongside the rows, each artist has an ``availability_mask``:
+672 bits, one per quarter hour of the week. It is rewritten whenever the
+rows change, so "is the artist free then?" and overlap checks are a single
+AND instead of a scan over rows.
+"""
+
+import re
+from datetime import datetime, time, timedelta
+from functools import reduce
+from operator import or_
+from typing import NamedTuple
+
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.orm import Session
+
+from forms import AvailabilityForm
+from models import WEEK_QUARTERS, Artist, Availability, db
+
+DAY_NAMES = [name for _, name in AvailabilityForm.DAYS_OF_WEEK]
+
+TIME_PATTERN = re.compile(r'^(\d{1,2}):(\d{2})$')
+RANGE_PATTERN = re.compile(r'^\s*(\S+)\s*-\s*(\S+)\s*$')
+
+QUARTERS_PER_DAY = 96
+QUARTER = timedelta(minutes=15)
+FULL_WEEK = (1 << WEEK_QUARTERS) - 1
+
+# Slots cannot end at 24:00 in a TIME column, so 23:59 stands for midnight.
+END_OF_DAY = time(23, 59)
+
+
+class Slot(NamedTuple):
+    """One weekly availability slot."""
+
+    day_of_week: int
+    start_time: time
+    end_time: time
+
+
+def parse_time(value):
+    """
+    Parse a 24-hour ``HH:MM`` time.
+
+    Raises:
+        ValueError: If the value is not a valid time.
+    """
+    match = TIME_PATTERN.match(value.strip())
+    if not match:
+        raise ValueError(f'Invalid time {value!r}, expected HH:MM')
+    return time(int(match.group(1)), int(match.group(2)))
+
+
+def parse_day(value):
+    """
+    Parse a day of the week given as 0-6 (Monday=0) or a day name or prefix.
+
+    Raises:
+        ValueError: If the value names no day.
+    """
+    value = str(value).strip()
+    if value.isdigit() and int(value) < len(DAY_NAMES):
+        return int(value)
+    matches = [index for index, name in enumerate(DAY_NAMES)
+               if len(value) >= 2 and name.lower().startswith(value.lower())]
+    if len(matches) != 1:
+        raise ValueError(f'Unknown day {value!r}')
+    return matches[0]
+
+
+def make_slot(day, start, end):
+    """
+    Build a validated Slot from its day and ``HH:MM`` times.
+
+    Raises:
+        ValueError: If a field is invalid or the slot ends before it starts.
+    """
+    slot = Slot(parse_day(day), parse_time(start), parse_time(end))
+    label = f'{DAY_NAMES[slot.day_of_week]} {start}-{end}'
+    if slot.start_time >= slot.end_time:
+        raise ValueError(f'{label}: start time must be before end time')
+    if slot.start_time.minute % 15 or (slot.end_time.minute % 15 and slot.end_time != END_OF_DAY):
+        raise ValueError(f'{label}: times must be on the quarter hour')
+    return slot
+
+
+def check_overlaps(slots):
+    """
+    Reject a schedule whose slots overlap.
+
+    Raises:
+        ValueError: Naming the first overlapping slot.
+    """
+    seen = 0
+    for slot in sorted(slots):
+        bits = slot_mask(slot)
+        if seen & bits:
+            raise ValueError(f"{DAY_NAMES[slot.day_of_week]} "
+                             f"{slot.start_time.strftime('%H:%M')}-"
+                             f"{slot.end_time.strftime('%H:%M')} overlaps another slot")
+        seen |= bits
+
+
+def parse_json_schedule(payload):
+    """
+    Parse a JSON schedule (see the module docstring).
+
+    Returns:
+        set: The Slots of the week.
+
+    Raises:
+        ValueError: If the payload or any slot is invalid.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get('slots'), list):
+        raise ValueError('Expected an object with a "slots" list')
+    try:
+        slots = {make_slot(slot['day_of_week'], slot['start_time'], slot['end_time'])
+                 for slot in payload['slots']}
+    except (KeyError, TypeError, AttributeError) as exc:
+        raise ValueError('Each slot needs day_of_week, start_time and end_time') from exc
+    check_overlaps(slots)
+    return slots
+
+
+def parse_text_schedule(text):
+    """
+    Parse a text schedule (see the module docstring).
+
+    Returns:
+        set: The Slots of the week.
+
+    Raises:
+        ValueError: If a line is invalid, naming the line.
+    """
+    slots = set()
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        day, _, ranges = line.partition(' ')
+        try:
+            for part in ranges.split(','):
+                match = RANGE_PATTERN.match(part)
+                if not match:
+                    raise ValueError(f'Invalid time range {part.strip()!r}')
+                slots.add(make_slot(day, match.group(1), match.group(2)))
+        except ValueError as exc:
+            raise ValueError(f'Line {number}: {exc}') from exc
+    check_overlaps(slots)
+    return slots
+
+
+def format_text_schedule(slots):
+    """Render Slots in the text format accepted by ``parse_text_schedule``."""
+    by_day = {}
+    for slot in sorted(slots):
+        by_day.setdefault(slot.day_of_week, []).append(
+            f"{slot.start_time.strftime('%H:%M')}-{slot.end_time.strftime('%H:%M')}")
+    return '\n'.join(f'{DAY_NAMES[day]} {", ".join(ranges)}'
+                     for day, ranges in sorted(by_day.items()))
+
+
+def current_schedule(artist_id):
+    """
+    Fetch an artist's stored slots.
+
+    Args:
+        artist_id (int): The artist ID.
+
+    Returns:
+        dict: Availability row ID by Slot.
+    """
+    stmt = select(Availability.id, Availability.day_of_week,
+                  Availability.start_time, Availability.end_time
+                  ).where(Availability.artist_id == artist_id)
+    return {Slot(row.day_of_week, row.start_time, row.end_time): row.id
+            for row in db.session.execute(stmt)}
+
+
+def replace_schedule(artist_id, slots):
+    """
+    Make an artist's stored availability equal to ``slots``.
+
+    Only the difference is written: one DELETE for the slots that went away
+    and one multi-row INSERT for the new ones. Runs in the current
+    transaction; the caller commits. The artist row stays locked until
+    then, so concurrent saves of one schedule run one after the other.
+
+    Args:
+        artist_id (int): The artist ID.
+        slots (set): The complete weekly schedule.
+
+    Returns:
+        tuple: Number of slots inserted and deleted.
+    """
+    # Locking the slot rows would not do: a concurrent save would not see
+    # the slots this one inserts, and an empty schedule has none to lock.
+    db.session.execute(select(Artist.id).where(Artist.id == artist_id).with_for_update())
+    existing = current_schedule(artist_id)
+    removed = [row_id for slot, row_id in existing.items() if slot not in slots]
+    added = [slot for slot in slots if slot not in existing]
+
+    if removed:
+        db.session.execute(delete(Availability).where(Availability.id.in_(removed)))
+    if added:
+        db.session.execute(insert(Availability), [
+            {"artist_id": artist_id, **slot._asdict()} for slot in added])
+    if removed or added:
+        db.session.execute(update(Artist).where(Artist.id == artist_id)
+                           .values(availability_mask=schedule_mask(slots)))
+    return len(added), len(removed)
+
+
+#----------------------------------------------------------------------------#
+# Quarter-hour bitmasks.
+#----------------------------------------------------------------------------#
+
+def _quarter(value, round_up=False):
+    """Return the quarter hour of the day at ``value`` (0-96)."""
+    if value == END_OF_DAY:
+        return QUARTERS_PER_DAY
+    minutes = value.hour * 60 + value.minute + (value.second > 0 or value.microsecond > 0)
+    return -(-minutes // 15) if round_up else minutes // 15
+
+
+def _span(first, count):
+    """Bits for ``count`` quarters from week quarter ``first``, wrapping past Sunday."""
+    if count <= 0:
+        return 0
+    if count >= WEEK_QUARTERS:
+        return FULL_WEEK
+    first %= WEEK_QUARTERS
+    bits = ((1 << count) - 1) << first
+    return (bits & FULL_WEEK) | (bits >> WEEK_QUARTERS)
+
+
+def slot_mask(slot):
+    """
+    Return the bits of the quarter hours a slot fully covers.
+
+    A slot that is not on quarter-hour boundaries (older rows) only covers
+    the whole quarters inside it.
+    """
+    first = _quarter(slot.start_time, round_up=True)
+    last = _quarter(slot.end_time)
+    return _span(slot.day_of_week * QUARTERS_PER_DAY + first, last - first)
+
+
+def schedule_mask(slots):
+    """Return the bitmask of a set of slots."""
+    return reduce(or_, map(slot_mask, slots), 0)
+
+
+def mask_slots(mask):
+    """
+    Turn a bitmask back into slots, merging adjacent quarters.
+
+    Returns:
+        list: Slots in week order; runs are split at midnight.
+    """
+    slots = []
+    for day in range(len(DAY_NAMES)):
+        bits = (mask >> (day * QUARTERS_PER_DAY)) & ((1 << QUARTERS_PER_DAY) - 1)
+        quarter = 0
+        while bits:
+            if not bits & 1:
+                skip = (bits & -bits).bit_length() - 1
+                bits >>= skip
+                quarter += skip
+                continue
+            run = (~bits & (bits + 1)).bit_length() - 1
+            end = quarter + run
+            slots.append(Slot(
+                day,
+                time(quarter // 4, quarter % 4 * 15),
+                END_OF_DAY if end == QUARTERS_PER_DAY else time(end // 4, end % 4 * 15),
+            ))
+            bits >>= run
+            quarter = end
+    return slots
+
+
+def period_mask(start, duration):
+    """
+    Return the bits of every quarter hour touched by a period.
+
+    Args:
+        start (datetime): Start of the period; its weekday and time are used.
+        duration (timedelta): Length of the period.
+    """
+    week_start = datetime.combine(start.date() - timedelta(days=start.weekday()), time())
+    first = (start - week_start) // QUARTER
+    last = -(-(start + duration - week_start) // QUARTER)
+    return _span(first, last - first)
+
+
+def covers(mask, needed):
+    """Return True if ``mask`` has every bit of ``needed`` set."""
+    return mask & needed == needed
+
+
+def overlaps(mask, other):
+    """Return True if the two masks share any quarter hour."""
+    return bool(mask & other)
+
+
+def is_available(mask, start, duration=timedelta(hours=1)):
+    """
+    Check whether an availability mask covers a whole period.
+
+    Args:
+        mask (int): An artist's ``availability_mask``.
+        start (datetime): Start of the period.
+        duration (timedelta): Length of the period.
+
+    Returns:
+        bool: True if every quarter hour the period touches is available.
+    """
+    return covers(mask, period_mask(start, duration))
+
+
+def _refresh_masks(connection, artist_ids):
+    """
+    Recompute ``availability_mask`` of the given artists from their rows.
+
+    The artist rows are locked first, so a concurrent write for the same
+    artist waits for this transaction and then reads its rows too, rather
+    than overwriting the mask with one that misses them.
+    """
+    # FOR NO KEY UPDATE: the flushed rows already hold a key-share lock on
+    # their artist, which FOR UPDATE would deadlock against.
+    connection.execute(select(Artist.id).where(Artist.id.in_(artist_ids))
+                       .order_by(Artist.id).with_for_update(key_share=True))
+    rows = connection.execute(
+        select(Availability.artist_id, Availability.day_of_week,
+               Availability.start_time, Availability.end_time)
+        .where(Availability.artist_id.in_(artist_ids))
+    ).all()
+    masks = dict.fromkeys(artist_ids, 0)
+    for row in rows:
+        masks[row.artist_id] |= slot_mask(Slot(row.day_of_week, row.start_time, row.end_time))
+    for artist_id, mask in masks.items():
+        connection.execute(update(Artist).where(Artist.id == artist_id)
+                           .values(availability_mask=mask))
+
+
+def _sync_masks_after_flush(session, flush_context):
+    artist_ids = {obj.artist_id
+                  for obj in (*session.new, *session.dirty, *session.deleted)
+                  if isinstance(obj, Availability)}
+    if artist_ids:
+        _refresh_masks(session.connection(), artist_ids)
+
+
+def init_app(app):
+    """
+    Keep ``availability_mask`` in sync with ORM writes to Availability rows.
+
+    Args:
+        app (Flask): The application being configured.
+    """
+    if not event.contains(Session, 'after_flush', _sync_masks_after_flush):
+        event.listen(Session, 'after_flush', _sync_masks_after_flush)
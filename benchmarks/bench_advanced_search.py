@@ -0,0 +1,108 @@
+"""
+Benchmark advanced venue search: legacy ILIKE filters vs structured facets.
+
+Seeds venues spread over many cities and states inside a transaction on the
+testing database (TEST_DATABASE_URL), creates the facet indexes if missing,
+times both filter styles for a few typical searches and rolls everything
+back.
+
+    python benchmarks/bench_advanced_search.py [--rows 200000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, text  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import Venue, db  # noqa: E402
+from search import parse_search, search_criteria  # noqa: E402
+
+STATES = ['CA', 'NY', 'TX', 'WA', 'IL', 'MA', 'OR', 'CO', 'GA', 'FL']
+GENRES = ['Jazz', 'Folk', 'Blues', 'Classical', 'Punk', 'Soul', 'Pop']
+
+SEARCHES = [
+    'San Francisco, CA',
+    'Hop, San Francisco, CA',
+    'City 42, TX',
+]
+
+
+def legacy_criteria(term):
+    """The comma-count ILIKE filter the advanced search used before."""
+    parts = [part.strip() for part in term.split(',')]
+    if len(parts) == 1:
+        return Venue.name.ilike(f'%{parts[0]}%')
+    if len(parts) == 2:
+        return (
+            (Venue.name.ilike(f'%{parts[0]}%') & Venue.city.ilike(f'%{parts[1]}%')) |
+            (Venue.city.ilike(f'%{parts[0]}%') & Venue.state.ilike(f'%{parts[1]}%'))
+        )
+    return (
+        Venue.name.ilike(f'%{parts[0]}%') &
+        Venue.city.ilike(f'%{parts[1]}%') &
+        Venue.state.ilike(f'%{parts[2]}%')
+    )
+
+
+def seed(rows):
+    """Insert ``rows`` venues over 500 cities in 10 states."""
+    db.session.execute(insert(Venue), [{
+        "name": "The Musical Hop" if i % 1000 == 0 else f"Venue {i}",
+        "city": "San Francisco" if i % 500 == 0 else f"City {i % 500}",
+        "state": STATES[i % len(STATES)],
+        "address": "1015 Folsom Street",
+        "genres": [GENRES[i % len(GENRES)], GENRES[(i * 3) % len(GENRES)]],
+    } for i in range(rows)])
+
+    bind = db.session.connection()
+    for index in Venue.__table__.indexes:
+        index.create(bind, checkfirst=True)
+    db.session.execute(text('ANALYZE venues'))
+
+
+def run(criterion, repeat):
+    """Return (best time in seconds, row count, top plan node) for a filter."""
+    stmt = select(Venue.id, Venue.name).where(criterion)
+    compiled = stmt.compile(db.engine, compile_kwargs={"literal_binds": True})
+    plan = db.session.execute(text(f'EXPLAIN {compiled}')).scalars().all()
+    scan = next((line.strip().lstrip('-> ') for line in plan if 'Scan' in line), plan[0])
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = db.session.execute(stmt).all()
+        timings.append(time.perf_counter() - started)
+    return min(timings), len(rows), scan.split('  ')[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        try:
+            seed(args.rows)
+            print(f"{'search':<26} {'filter':<8} {'time (ms)':>10} {'rows':>6}  plan")
+            for term in SEARCHES:
+                cases = (
+                    ('ilike', legacy_criteria(term)),
+                    ('facets', db.and_(*search_criteria(Venue, parse_search(term)))),
+                )
+                for label, criterion in cases:
+                    seconds, count, scan = run(criterion, args.repeat)
+                    print(f"{term:<26} {label:<8} {seconds * 1000:>10.2f} {count:>6}  {scan}")
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark "which artists are free then?": availability rows vs the weekly bitmask.
+
+Seeds artists with random weekly schedules inside a transaction on the
+testing database (TEST_DATABASE_URL), then times the same question asked
+of the Availability rows (EXISTS over a covering slot) and of
+artists.availability_mask (one AND per artist), plus the equivalent
+in-memory checks. Everything is rolled back afterwards.
+
+    python benchmarks/bench_availability.py [--artists 20000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, exists, insert, select, text, update  # noqa: E402
+
+import queries  # noqa: E402
+from app import create_app  # noqa: E402
+from availability import Slot, covers, period_mask, schedule_mask  # noqa: E402
+from models import Artist, Availability, db  # noqa: E402
+
+PROBES = [
+    datetime(2026, 10, 19, 10, 0),   # Monday morning
+    datetime(2026, 10, 23, 20, 30),  # Friday evening
+    datetime(2026, 10, 25, 14, 0),   # Sunday afternoon
+]
+DURATION = timedelta(hours=2)
+
+
+def random_schedule(rng):
+    """Up to three non-overlapping slots on each of a few random days."""
+    slots = set()
+    for day in rng.sample(range(7), rng.randint(2, 5)):
+        hour = rng.randint(8, 12)
+        for _ in range(rng.randint(1, 3)):
+            length = rng.randint(1, 4)
+            if hour + length > 24:
+                break
+            slots.add(Slot(day, dtime(hour), dtime(hour + length) if hour + length < 24
+                           else dtime(23, 59)))
+            hour += length + rng.randint(0, 2)
+    return slots
+
+
+def seed(count, rng):
+    """Insert ``count`` artists with schedules; return their schedules by ID."""
+    db.session.execute(insert(Artist), [{
+        "name": f"Artist {i}", "city": "San Francisco", "state": "CA", "genres": ["Jazz"],
+    } for i in range(count)])
+    artist_ids = db.session.scalars(select(Artist.id).order_by(Artist.id.desc()).limit(count)).all()
+
+    schedules = {artist_id: random_schedule(rng) for artist_id in artist_ids}
+    db.session.execute(insert(Availability), [
+        {"artist_id": artist_id, **slot._asdict()}
+        for artist_id, slots in schedules.items() for slot in slots])
+    db.session.execute(
+        update(Artist.__table__).where(Artist.__table__.c.id == bindparam('artist_id')),
+        [{"artist_id": artist_id, "availability_mask": schedule_mask(slots)}
+         for artist_id, slots in schedules.items()])
+    db.session.execute(text('ANALYZE artists, availability'))
+    return schedules
+
+
+def rows_query(start):
+    """Artists with a single availability row covering the whole period."""
+    end = start + DURATION
+    covering = exists().where(
+        Availability.artist_id == Artist.id,
+        Availability.day_of_week == start.weekday(),
+        Availability.start_time <= start.time(),
+        Availability.end_time >= end.time(),
+    )
+    return db.session.execute(select(Artist.id, Artist.name).where(covering)).all()
+
+
+def rows_check(slots, start):
+    """In-memory equivalent of rows_query for one artist."""
+    end = start + DURATION
+    return any(slot.day_of_week == start.weekday() and slot.start_time <= start.time()
+               and slot.end_time >= end.time() for slot in slots)
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--artists', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        try:
+            schedules = seed(args.artists, rng)
+            masks = {artist_id: schedule_mask(slots) for artist_id, slots in schedules.items()}
+
+            print(f"{'probe':<18} {'check':<12} {'time (ms)':>10} {'artists':>8}")
+            for probe in PROBES:
+                label = probe.strftime('%a %H:%M')
+                needed = period_mask(probe, DURATION)
+                cases = (
+                    ('sql rows', lambda: len(rows_query(probe))),
+                    ('sql mask', lambda: len(queries.available_artists(needed))),
+                    ('py rows', lambda: sum(rows_check(slots, probe)
+                                            for slots in schedules.values())),
+                    ('py mask', lambda: sum(covers(mask, needed) for mask in masks.values())),
+                )
+                for name, fn in cases:
+                    seconds, found = best_of(fn, args.repeat)
+                    print(f"{label:<18} {name:<12} {seconds * 1000:>10.2f} {found:>8}")
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark the listing-page read path: full ORM objects vs column projections.
+
+Seeds 100k artists, venues and shows inside a transaction on the testing
+database (TEST_DATABASE_URL), measures both read paths and rolls everything
+back, so the database is left untouched.
+
+    python benchmarks/bench_listing_reads.py [--rows 100000]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, text  # noqa: E402
+
+import listings  # noqa: E402
+import queries  # noqa: E402
+from app import create_app  # noqa: E402
+from partitions import create_partitions  # noqa: E402
+from models import Artist, Show, Venue, db  # noqa: E402
+
+LONG_TEXT = 'Looking for shows to perform at in the Bay Area! ' * 8
+IMAGE_LINK = ('https://images.unsplash.com/photo-1549213783-8284d0336c4f'
+              '?ixlib=rb-1.2.1&auto=format&fit=crop&w=794&q=80')
+
+
+def seed(rows):
+    """Insert ``rows`` artists, venues and shows with realistic column sizes."""
+    db.session.execute(insert(Artist), [{
+        "name": f"Artist {i}", "city": "San Francisco", "state": "CA",
+        "phone": "326-123-5000", "genres": ["Jazz", "Rock n Roll"],
+        "image_link": IMAGE_LINK, "seeking_venue": True,
+        "seeking_description": LONG_TEXT,
+    } for i in range(rows)])
+    db.session.execute(insert(Venue), [{
+        "name": f"Venue {i}", "city": f"City {i % 50}", "state": "CA",
+        "address": "1015 Folsom Street", "genres": ["Jazz"],
+        "image_link": IMAGE_LINK, "seeking_talent": True,
+        "seeking_description": LONG_TEXT,
+    } for i in range(rows)])
+
+    artist_ids = db.session.scalars(select(Artist.id)).all()
+    venue_ids = db.session.scalars(select(Venue.id)).all()
+    start = datetime(2019, 1, 1)
+    end = start + timedelta(hours=rows)
+    create_partitions(db.session.connection(), range(start.year, end.year + 1))
+    db.session.execute(insert(Show), [{
+        "artist_id": artist_ids[i], "venue_id": venue_ids[i],
+        "start_time": start + timedelta(hours=i),
+    } for i in range(rows)])
+    # Core inserts bypass the flush hooks that maintain show_listings.
+    listings.rebuild()
+
+    # Give the planner statistics for the freshly inserted rows.
+    db.session.execute(text('ANALYZE artists, venues, shows, show_listings'))
+
+
+def orm_artists():
+    return [{"id": a.id, "name": a.name} for a in Artist.query.order_by('name').all()]
+
+
+def orm_shows():
+    return [{
+        "venue_id": s.venue_id,
+        "venue_name": s.venue.name,
+        "artist_id": s.artist_id,
+        "artist_name": s.artist.name,
+        "artist_image_link": s.artist.image_link,
+        "start_time": s.start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+    } for s in Show.query.join(Venue).join(Artist).all()]
+
+
+def measure(fn, repeat):
+    """Return (best wall time in seconds, peak traced memory in bytes)."""
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    db.session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return min(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        try:
+            seed(args.rows)
+            cases = [
+                ('artists', orm_artists, queries.artist_summaries),
+                ('shows', orm_shows, queries.show_listings),
+            ]
+            print(f"{'page':<8} {'path':<6} {'time (ms)':>10} {'peak (MiB)':>11}")
+            for name, orm_fn, core_fn in cases:
+                for label, fn in (('orm', orm_fn), ('core', core_fn)):
+                    seconds, peak = measure(fn, args.repeat)
+                    print(f"{name:<8} {label:<6} {seconds * 1000:>10.1f} "
+                          f"{peak / 2 ** 20:>11.1f}")
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
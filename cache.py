@@ -0,0 +1,394 @@
+"""
+In-process caches for the Fyyur project.
+
+Each cache is a bounded, thread-safe mapping whose entries expire after a
+time-to-live. Lookups are reported to the metrics module so hit ratios show
+up at ``/metrics``.
+
+Caches of catalog data include ``catalog_version()`` in their keys. The
+version is bumped after every commit that writes a venue, artist or show, so
+stale entries are never read again and simply age out. Commits made by other
+worker processes arrive through invalidation.py.
+"""
+
+import itertools
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import metrics
+from models import Artist, Show, Venue
+
+_MISSING = object()
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class TTLCache:
+    """
+    A least-recently-used cache whose entries also expire after ``ttl`` seconds.
+
+    Attributes:
+        name (str): Name used in metrics and stats.
+        maxsize (int): Maximum number of entries kept.
+        ttl (float): Default lifetime of an entry in seconds.
+    """
+
+    def __init__(self, name, maxsize=128, ttl=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for ``key``, or ``default`` if absent or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                hit = True
+            else:
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                hit = False
+
+        metrics.record_cache_lookup(self.name, hit)
+        return entry[1] if hit else default
+
+    def set(self, key, value, ttl=None):
+        """Store ``value`` under ``key``, evicting the least recently used entry if full."""
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl=None):
+        """
+        Return the cached value for ``key``, computing and storing it on a miss.
+
+        Args:
+            key: Cache key.
+            factory (callable): Called with no arguments to build the value.
+            ttl (float): Lifetime of a newly stored entry. Defaults to ``self.ttl``.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        """Remove ``key`` from the cache if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Return hit/miss counters for this cache.
+
+        Returns:
+            dict: ``name``, ``size``, ``maxsize``, ``hits``, ``misses`` and ``hit_ratio``.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _approximate_size(value):
+    """Estimate the bytes held by a snapshot: the tuple and, recursively, its items."""
+    size = sys.getsizeof(value)
+    if isinstance(value, tuple):
+        size += sum(_approximate_size(item) for item in value)
+    return size
+
+
+class EntityCache:
+    """
+    A least-recently-used cache of venue and artist snapshots, keyed by
+    table and ID and bounded by their approximate size in bytes.
+
+    Snapshots are immutable tuples (see ``queries.entity_snapshot``), safe
+    to share between requests. Writes invalidate entries by ID, and every
+    invalidation bumps a version: a snapshot loaded while that version
+    moved might predate the write, so it is returned but not stored.
+
+    Attributes:
+        name (str): Name used in metrics and stats.
+        maxbytes (int): Approximate memory the snapshots may take.
+        ttl (float): Lifetime of an entry in seconds.
+    """
+
+    def __init__(self, name, maxbytes=4 * 1024 * 1024, ttl=600):
+        self.name = name
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self._bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def get(self, model, obj_id, loader):
+        """
+        Return the snapshot of a venue or artist, loading and storing it on a miss.
+
+        Args:
+            model: ``Venue`` or ``Artist``.
+            obj_id (int): The row's ID.
+            loader (callable): Called as ``loader(model, obj_id)``; returns
+                the snapshot, or None if there is no such row.
+
+        Returns:
+            The snapshot, or None if the row does not exist.
+        """
+        key = (model.__tablename__, obj_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+            else:
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                version = self.version
+                entry = None
+        metrics.record_cache_lookup(self.name, entry is not None)
+        if entry is not None:
+            return entry[1]
+
+        snapshot = loader(model, obj_id)
+        if snapshot is None:
+            return None
+        size = _approximate_size(snapshot)
+        with self._lock:
+            if self.version == version and size <= self.maxbytes:
+                self._pop(key)
+                self._data[key] = (now + self.ttl, snapshot, size)
+                self._bytes += size
+                while self._bytes > self.maxbytes:
+                    _, (_, _, evicted) = self._data.popitem(last=False)
+                    self._bytes -= evicted
+        return snapshot
+
+    def invalidate(self, table, ids):
+        """Drop the snapshots of rows ``ids`` of ``table``."""
+        with self._lock:
+            self.version += 1
+            for obj_id in ids:
+                self._pop((table, obj_id))
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Return hit/miss counters and memory use for this cache.
+
+        Returns:
+            dict: ``name``, ``size``, ``bytes``, ``maxbytes``, ``hits``,
+            ``misses`` and ``hit_ratio``.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "bytes": self._bytes,
+                "maxbytes": self.maxbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+#----------------------------------------------------------------------------#
+# Catalog version.
+#----------------------------------------------------------------------------#
+
+CATALOG_MODELS = (Venue, Artist, Show)
+
+_catalog_counter = itertools.count(1)
+_catalog_version = next(_catalog_counter)
+
+
+def catalog_version():
+    """Return the current catalog version."""
+    return _catalog_version
+
+
+def bump_catalog_version():
+    """
+    Invalidate every cache entry keyed on the catalog version.
+
+    Called automatically after ORM commits touching catalog models; call it
+    directly after Core-level bulk writes that bypass the session's flush.
+    """
+    global _catalog_version
+    _catalog_version = next(_catalog_counter)
+
+
+def mark_catalog_changed(session, table=None, ids=()):
+    """
+    Invalidate the caches when ``session``'s transaction commits.
+
+    Args:
+        session (Session): The session making the change.
+        table (str): 'venues', 'artists' or 'shows', if the changed rows are known.
+        ids (iterable): IDs of the changed rows of ``table``.
+    """
+    session.info['catalog_changed'] = True
+    if table is not None:
+        session.info.setdefault('changed_entities', set()).update((table, obj_id) for obj_id in ids)
+
+
+def invalidate(table, ids):
+    """
+    Evict cached data about rows changed by another process.
+
+    Called for the change notifications of invalidation.py.
+
+    Args:
+        table (str): 'venues', 'artists' or 'shows'.
+        ids (list): IDs of the changed rows.
+    """
+    entity_cache.invalidate(table, ids)
+    bump_catalog_version()
+
+
+def invalidate_all():
+    """Evict all cached catalog data, for when changes may have been missed."""
+    entity_cache.clear()
+    bump_catalog_version()
+
+
+def _track_catalog_writes(session, flush_context):
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, CATALOG_MODELS):
+            mark_catalog_changed(session, obj.__tablename__, (obj.id,))
+
+
+def _bump_after_commit(session):
+    changed = session.info.pop('changed_entities', ())
+    for table, obj_id in changed:
+        entity_cache.invalidate(table, (obj_id,))
+    if session.info.pop('catalog_changed', False):
+        bump_catalog_version()
+
+
+def _forget_after_rollback(session):
+    session.info.pop('catalog_changed', None)
+    session.info.pop('changed_entities', None)
+
+
+#----------------------------------------------------------------------------#
+# Caches.
+#----------------------------------------------------------------------------#
+
+# The home page aggregates, shared by all requests until the catalog changes
+# or DASHBOARD_CACHE_TTL seconds pass.
+dashboard_cache = TTLCache('dashboard', maxsize=2)
+
+# Search results keyed on (kind, normalized term, catalog version, minute).
+search_cache = TTLCache('search')
+
+# Seconds a search result's upcoming show counts may lag behind the clock.
+SEARCH_TIME_BUCKET = 60
+
+# Venue and artist snapshots for the detail pages, by (table, ID).
+entity_cache = EntityCache('entities')
+
+
+def search_time_bucket():
+    """
+    Return the current time bucket, part of every search cache key.
+
+    Search results count upcoming shows, which change as shows start without
+    any catalog write, so an entry is only used within SEARCH_TIME_BUCKET
+    seconds.
+    """
+    return int(time.time() // SEARCH_TIME_BUCKET)
+
+
+def normalize_term(term):
+    """
+    Normalize a name search term so equivalent searches share one cache entry.
+
+    Case is folded, runs of whitespace collapse to one space and the ends
+    are trimmed. Comma-separated parts are not sorted: the name search
+    matches the term as one string, so "smith, jones" and "jones, smith"
+    find different names. (The one order-free list, the genre facet of the
+    advanced search, is sorted by ``search.parse_search``.)
+
+    Args:
+        term (str): The raw search term.
+
+    Returns:
+        str: The normalized term.
+    """
+    collapsed = _WHITESPACE.sub(' ', term).strip()
+    folded = collapsed.casefold()
+    if folded != collapsed.lower():
+        # ILIKE folds case like lower(), which keeps 'ß' where casefold()
+        # gives 'ss'; keep both so such a term never shares the entry of a
+        # spelling the search would match differently.
+        return f'{folded}\0{collapsed.lower()}'
+    return folded
+
+
+def init_app(app):
+    """
+    Size the caches from the app config and start tracking catalog writes.
+
+    Args:
+        app (Flask): The application being configured.
+    """
+    dashboard_cache.ttl = app.config['DASHBOARD_CACHE_TTL']
+    search_cache.maxsize = app.config['SEARCH_CACHE_SIZE']
+    search_cache.ttl = app.config['SEARCH_CACHE_TTL']
+    entity_cache.maxbytes = app.config['ENTITY_CACHE_MAX_BYTES']
+    entity_cache.ttl = app.config['ENTITY_CACHE_TTL']
+
+    for name, listener in (('after_flush', _track_catalog_writes),
+                           ('after_commit', _bump_after_commit),
+                           ('after_rollback', _forget_after_rollback)):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
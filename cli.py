@@ -1,15 +1,106 @@
-from flask import Flask
+"""
+Command line interface for the Fyyur project.
+
+Commands are registered on the app by ``create_app`` and run with
+``flask <command>``. They only need the database, so heavier modules are
+imported inside the commands that use them.
+"""
+
+import click
+from flask import current_app
 from flask_migrate import Migrate
+
 from models import db
 
 
 def register_commands(app):
-    """Register Flask-Migrate commands"""
-    migrate = Migrate(app, db)
+    """Register Flask-Migrate and the project's own commands"""
+    Migrate(app, db)
+    app.cli.add_command(load_data_command)
+    app.cli.add_command(rebuild_listings_command)
+    app.cli.add_command(create_partitions_command)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(init_shards_command)
+
+
+@click.command('load-data')
+def load_data_command():
+    """Load the sample artists and shows into the database."""
+    from load_data import load_artists_and_shows
+
+    load_artists_and_shows()
+
+
+@click.command('rebuild-listings')
+def rebuild_listings_command():
+    """Rebuild the show_listings read table from shows, venues and artists."""
+    import listings
+    import shards
+
+    count = 0
+    for name in shards.regions():
+        with shards.region(name):
+            count += listings.rebuild()
+            db.session.commit()
+    click.echo(f'Rebuilt {count} show listings.')
+
+
+@click.command('create-partitions')
+@click.option('--years-ahead', default=2, show_default=True,
+              help='Create partitions up to this many years past the current one.')
+def create_partitions_command(years_ahead):
+    """Create the yearly shows partitions that do not exist yet."""
+    import partitions
+    import shards
+
+    for name in shards.regions():
+        with shards.region(name):
+            created = partitions.ensure_future_partitions(db.session.connection(), years_ahead)
+            db.session.commit()
+        where = f' in region {name}' if name else ''
+        if created:
+            click.echo(f"Created partitions{where}: "
+                       f"{', '.join(map(partitions.partition_name, created))}.")
+        else:
+            click.echo(f'All partitions already exist{where}.')
+
+
+@click.command('worker')
+@click.option('--threads', type=int, default=None,
+              help='Jobs run concurrently. Defaults to JOB_WORKER_THREADS.')
+@click.option('--burst', is_flag=True, help='Exit once no jobs are due.')
+def worker_command(threads, burst):
+    """Run queued background jobs until interrupted."""
+    from jobs import Worker
+
+    app = current_app._get_current_object()
+    threads = threads or app.config['JOB_WORKER_THREADS']
+    click.echo(f'Worker running {threads} threads.')
+    Worker(app, threads, app.config['JOB_POLL_INTERVAL']).run(burst=burst)
+
+
+@click.command('export')
+@click.argument('entity', type=click.Choice(['venues', 'artists', 'shows']))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv',
+              show_default=True)
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='File to write to. Defaults to stdout.')
+def export_command(entity, fmt, output):
+    """Write every venue, artist or show as CSV or NDJSON."""
+    from export import export_chunks
+
+    for chunk in export_chunks(entity, fmt, current_app.config['EXPORT_BATCH_SIZE']):
+        output.write(chunk)
+
 
+@click.command('init-shards')
+def init_shards_command():
+    """Point each region's ID sequences at its own block of IDs."""
+    import shards
 
-# If you want to run migrations from this file directly
-if __name__ == '__main__':
-    from app import app
-    register_commands(app)
-    print("CLI commands registered")
+    if not shards.enabled():
+        click.echo('No shards are configured.')
+        return
+    for (name, table), next_id in shards.assign_id_blocks().items():
+        click.echo(f'{name or "default"}: {table} IDs continue from {next_id}.')
@@ -0,0 +1,167 @@
+"""
+Response compression negotiated through ``Accept-Encoding``.
+
+HTML pages, JSON and the other text types in COMPRESS_MIMETYPES are sent
+brotli- or gzip-encoded, whichever the client prefers (brotli on ties, and
+only when the ``brotli`` package is installed). Everything else, notably
+images and web fonts, which are already compressed, is sent as-is.
+
+- Buffered responses smaller than COMPRESS_MIN_SIZE bytes are not worth
+  the CPU and are left alone.
+- Streamed responses (exports, streamed templates) are compressed chunk by
+  chunk, each flushed so the client receives it as soon as it is produced.
+- Static text files are compressed once per process and kept in
+  ``static_cache``, keyed by their ETag, which changes with the file.
+
+Compressed responses get ``Vary: Accept-Encoding`` and a weak ETag, so
+shared caches never mix encodings and conditional requests still match.
+"""
+
+import gzip
+import zlib
+
+from flask import current_app, request
+
+from cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+# Compressed static files by (ETag, encoding).
+static_cache = TTLCache('compressed-static', maxsize=64, ttl=24 * 3600)
+
+
+def _encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding):
+    """
+    Pick the response encoding for the client.
+
+    Args:
+        accept_encoding: The request's parsed ``Accept-Encoding`` header.
+
+    Returns:
+        str: 'br' or 'gzip', or None to send the body uncompressed.
+    """
+    return accept_encoding.best_match(_encodings())
+
+
+def compress(data, encoding, config):
+    """Compress a whole body with the configured level."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_LEVEL'], mtime=0)
+
+
+def compress_chunks(chunks, encoding, config):
+    """
+    Compress an iterable of body chunks incrementally.
+
+    Every non-empty chunk is flushed through the compressor, so each one
+    reaches the client without waiting for the rest of the body.
+
+    Args:
+        chunks: Iterable of ``bytes`` or ``str`` (encoded as UTF-8).
+        encoding (str): 'br' or 'gzip'.
+        config (dict): Application config with the compression levels.
+
+    Returns:
+        generator: The compressed body, chunk by chunk.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=config['COMPRESS_BROTLI_QUALITY'])
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        # wbits=31: a zlib stream in a gzip container
+        compressor = zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+
+        def flush():
+            return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield process(chunk) + flush()
+        yield finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _should_compress(response, config):
+    if not config['COMPRESS_ENABLED'] or request.method == 'HEAD':
+        return False
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return False
+    return not response.cache_control.no_transform
+
+
+def _static_body(response, encoding, config):
+    """Return the compressed body of a static file response, compressing it at most once."""
+    etag, _ = response.get_etag()
+    key = (etag, encoding)
+    body = static_cache.get(key) if etag else None
+    response.direct_passthrough = False
+    if body is None:
+        body = compress(response.get_data(), encoding, config)
+        if etag:
+            static_cache.set(key, body)
+    elif hasattr(response.response, 'close'):
+        response.response.close()
+    return body
+
+
+def _compress_response(response):
+    """Compress the response body for clients that accept it."""
+    config = current_app.config
+    if not _should_compress(response, config):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.direct_passthrough:
+        if (response.content_length or 0) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(_static_body(response, encoding, config))
+    elif response.is_streamed:
+        response.response = compress_chunks(response.response, encoding, config)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding, config))
+
+    response.headers['Content-Encoding'] = encoding
+    # Byte ranges would refer to the uncompressed file
+    response.headers.pop('Accept-Ranges', None)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """
+    Compress responses of ``app``.
+
+    Registered before the other response hooks so it runs last, after they
+    have finished with the uncompressed body.
+
+    Args:
+        app (Flask): The application being configured.
+    """
+    app.after_request(_compress_response)
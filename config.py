@@ -2,19 +2,173 @@
 Configuration file for Fyyur project.
 
 Contains environment-specific settings and configuration details.
+``create_app(config_name)`` picks one of the classes in ``config_by_name``.
 """
 
+import json
 import os
-SECRET_KEY = os.urandom(32)
 
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
 
-# Connect to the database
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres@localhost:5432/fyyur'
+class Config:
+    """Settings shared by every environment."""
 
-# Disable modification tracking which saves resources
-SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Set SECRET_KEY in the environment when running several workers, otherwise
+    # each process signs sessions and CSRF tokens with its own random key.
+    SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
+
+    DEBUG = False
+    TESTING = False
+
+    # Connect to the database
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyur')
+
+    # Disable modification tracking which saves resources
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Region shards as JSON, e.g. {"west": {"number": 1, "url": "postgresql://...",
+    # "states": ["CA", "OR"]}} (see shards.py); empty keeps everything in the
+    # default database. Threads per process querying the regions concurrently.
+    SHARDS = json.loads(os.environ.get('FYYUR_SHARDS', '{}'))
+    SHARD_SCATTER_THREADS = 8
+
+    # Logging: JSON lines written to a rotating file by a background thread
+    LOG_LEVEL = 'INFO'
+    LOG_FILE = os.path.join(basedir, 'error.log')
+    LOG_MAX_BYTES = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT = 5
+
+    # /readyz: seconds the database check may take, and the share of the
+    # connection pool in use at which the instance reports itself unready
+    READINESS_DB_TIMEOUT = 0.5
+    READINESS_MAX_POOL_SATURATION = 0.9
+
+    # Response compression: bodies under COMPRESS_MIN_SIZE bytes are sent
+    # as-is; gzip level 1-9 and brotli quality 0-11 (brotli is used only when
+    # the package is installed)
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
+    COMPRESS_MIMETYPES = frozenset({
+        'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+        'application/javascript', 'application/json', 'application/x-ndjson',
+        'image/svg+xml',
+    })
+
+    # Seconds the home page dashboard aggregates are cached for
+    DASHBOARD_CACHE_TTL = 30
+
+    # Search result cache: maximum entries and seconds each entry lives
+    SEARCH_CACHE_SIZE = 1024
+    SEARCH_CACHE_TTL = 300
+
+    # Venue and artist snapshots for the detail pages: approximate memory
+    # they may take per process, and seconds each lives
+    ENTITY_CACHE_MAX_BYTES = 4 * 1024 * 1024
+    ENTITY_CACHE_TTL = 600
+
+    # Listen for other workers' catalog changes (Postgres LISTEN/NOTIFY) and
+    # evict the affected cache entries; seconds between reconnection attempts
+    CACHE_NOTIFY_ENABLED = True
+    CACHE_NOTIFY_RECONNECT_DELAY = 5
+
+    # Rate limits per endpoint as (requests, seconds): each client may burst
+    # up to `requests` and is then refilled at requests/seconds per second.
+    # Buckets live in each process ('memory') or in a SQLite file shared by
+    # the workers on a host ('sqlite'). With 'memory' every Gunicorn worker
+    # counts on its own, so a client really gets the limit times the number
+    # of workers; production uses 'sqlite' unless told otherwise.
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_STORAGE = os.environ.get('RATE_LIMIT_STORAGE', 'memory')
+    RATE_LIMIT_SQLITE_PATH = os.environ.get(
+        'RATE_LIMIT_SQLITE_PATH', os.path.join(basedir, 'ratelimit.sqlite3'))
+    RATE_LIMITS = {
+        'main.search_venues': (30, 60),
+        'main.search_artists': (30, 60),
+        'main.advanced_search_venues': (30, 60),
+        'main.advanced_search_artists': (30, 60),
+        'main.venue_open_dates': (30, 60),
+        'main.export_catalog': (5, 60),
+        'main.create_venue_submission': (10, 60),
+        'main.edit_venue_submission': (20, 60),
+        'main.delete_venue': (10, 60),
+        'main.create_artist_submission': (10, 60),
+        'main.edit_artist_submission': (20, 60),
+        'main.create_show_submission': (20, 60),
+        'main.create_artist_availability': (30, 60),
+        'main.replace_artist_availability': (20, 60),
+        'main.delete_artist_availability': (30, 60),
+    }
+
+    # Background jobs (flask worker): threads per worker, seconds between
+    # polls of an empty queue, seconds before a running job is presumed
+    # abandoned and requeued, and attempts before a job is marked failed
+    JOB_WORKER_THREADS = 4
+    JOB_POLL_INTERVAL = 1.0
+    JOB_TIMEOUT = 600
+    JOB_MAX_ATTEMPTS = 3
+
+    # Rows fetched per round trip from the server-side cursor of an export
+    EXPORT_BATCH_SIZE = 1000
+
+    # Streamed listing pages (/artists, /shows): rows fetched per round trip
+    # from the server-side cursor, and characters of rendered HTML collected
+    # before a chunk is sent (small enough that the page head goes out before
+    # the first rows are read)
+    LISTING_BATCH_SIZE = 500
+    STREAM_CHUNK_SIZE = 2048
+
+    # Past shows rendered on a venue or artist page, and per "load more" page
+    PAST_SHOWS_PAGE_SIZE = 12
+
+    # Longest date range, in nights, the venue open-date finder accepts
+    OPEN_DATES_MAX_DAYS = 62
+
+    # Image thumbnails: on-disk cache, widths served (the templates use 320
+    # and 640) and limits on source images: download time and size, and
+    # decoded pixels (40 million decode to about 120 MB)
+    THUMBNAIL_DIR = os.environ.get('THUMBNAIL_DIR', os.path.join(basedir, 'thumbnails'))
+    THUMBNAIL_SIZES = (160, 320, 640)
+    THUMBNAIL_FETCH_TIMEOUT = 10
+    THUMBNAIL_MAX_SOURCE_BYTES = 20 * 1024 * 1024
+    THUMBNAIL_MAX_PIXELS = 40_000_000
+
+    # Private networks (e.g. '10.1.0.0/16' for an intranet image host) that
+    # image sources may still be fetched from; any other private, loopback,
+    # link-local or reserved address is refused
+    THUMBNAIL_ALLOWED_NETWORKS = ()
+
+
+class DevelopmentConfig(Config):
+    """Local development with the debugger and template auto-reload."""
+
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    """Settings used by wsgi.py."""
+
+    # Shared by the Gunicorn workers, so the limits hold per host
+    RATE_LIMIT_STORAGE = os.environ.get('RATE_LIMIT_STORAGE', 'sqlite')
+
+
+class TestingConfig(Config):
+    """Settings for the test suite."""
+
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    RATE_LIMIT_ENABLED = False
+    CACHE_NOTIFY_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'TEST_DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyur_test')
+
+
+config_by_name = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
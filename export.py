@@ -0,0 +1,119 @@
+"""
+Streaming CSV and NDJSON dumps of the catalog.
+
+``/export/<entity>.csv`` / ``.ndjson`` and ``flask export`` write every
+venue, artist or show as one line. Rows are read through a server-side
+cursor (``yield_per``) EXPORT_BATCH_SIZE at a time and encoded as they
+arrive, so memory stays flat however large the table is and the first
+lines go out as soon as the first batch is fetched. With region shards
+(see shards.py) every region is read and the rows merged by id.
+
+In CSV, list columns (genres) are joined with ``;``. Datetimes are ISO 8601
+in both formats.
+"""
+
+import csv
+import io
+import itertools
+import json
+from datetime import date, datetime
+from operator import itemgetter
+
+from sqlalchemy import select
+
+import queries
+import shards
+from models import Artist, Show, Venue
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Exported columns per entity; long internal columns (the availability
+# bitmask) are left out.
+ENTITIES = {
+    'venues': (Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+               Venue.genres, Venue.image_link, Venue.facebook_link, Venue.website_link,
+               Venue.seeking_talent, Venue.seeking_description, Venue.created_at),
+    'artists': (Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+                Artist.genres, Artist.image_link, Artist.facebook_link, Artist.website_link,
+                Artist.seeking_venue, Artist.seeking_description, Artist.created_at),
+    'shows': (Show.id, Show.venue_id, Show.artist_id, Show.start_time),
+}
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ';'.join(map(str, value))
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _cursor(entity, batch_size):
+    """Open a server-side cursor over ``entity`` in id order; return an iterator over its rows."""
+    columns = ENTITIES[entity]
+    stmt = select(*columns).order_by(columns[0])
+    if entity == 'artists':
+        stmt = stmt.where(shards.home_rows(Artist))
+    return queries._stream(stmt, batch_size)
+
+
+def _batches(entity, batch_size):
+    """Yield lists of rows of ``entity`` in id order, merged from every region."""
+    rows = shards.merge_streams(_cursor, entity, batch_size, key=itemgetter(0))
+    try:
+        while batch := list(itertools.islice(rows, batch_size)):
+            yield batch
+    finally:
+        rows.close()
+
+
+def _csv_chunks(entity, batch_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in ENTITIES[entity]])
+    yield buffer.getvalue()
+    for rows in _batches(entity, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(entity, batch_size):
+    keys = [column.key for column in ENTITIES[entity]]
+    for rows in _batches(entity, batch_size):
+        yield ''.join(json.dumps(dict(zip(keys, row)), default=_json_default) + '\n'
+                      for row in rows)
+
+
+def export_chunks(entity, fmt, batch_size=1000):
+    """
+    Encode every row of an entity, one batch of lines at a time.
+
+    Must be consumed inside an app context; for a streamed response wrap it
+    in ``stream_with_context``.
+
+    Args:
+        entity (str): A key of ``ENTITIES``.
+        fmt (str): A key of ``FORMATS``.
+        batch_size (int): Rows fetched from the server-side cursor at a time.
+
+    Returns:
+        generator: Strings whose concatenation is the whole dump.
+
+    Raises:
+        ValueError: If the entity or format is unknown.
+    """
+    if entity not in ENTITIES or fmt not in FORMATS:
+        raise ValueError(f'Cannot export {entity!r} as {fmt!r}')
+    chunks = _csv_chunks if fmt == 'csv' else _ndjson_chunks
+    return chunks(entity, batch_size)
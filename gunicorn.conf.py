@@ -0,0 +1,65 @@
+"""
+Gunicorn configuration for Fyyur.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden through the environment variables below.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Preforking workers, each with a small thread pool for requests blocked on
+# the database.
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import and warm the app once in the master (see wsgi.py) and share the
+# memory copy-on-write with the workers.
+preload_app = True
+
+# Recycle workers periodically to cap memory growth; jitter avoids restarting
+# them all at once.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Heartbeat files on tmpfs so a slow disk cannot stall workers.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Requests are already logged as JSON by the app (see logs.py).
+accesslog = None
+errorlog = '-'
+
+
+def on_starting(server):
+    """Clear stale multiprocess metric files left by a previous master."""
+    metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def post_fork(server, worker):
+    """Give each worker its own log listener thread and connection pools."""
+    import logs
+    from models import db
+    from wsgi import app
+
+    logs.after_fork(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that has exited."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
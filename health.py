@@ -0,0 +1,185 @@
+"""
+Liveness and readiness endpoints for the load balancer.
+
+``/healthz`` answers as long as the process can serve a request; it does no
+I/O, so a slow database never makes an instance look dead.
+
+``/readyz`` checks whether the instance should receive traffic. It checks
+out a pool connection and runs ``SELECT 1`` under a short statement timeout,
+reports connection pool occupancy and the in-process caches, and answers
+503 when the instance should be drained:
+
+- the database cannot be reached or the check takes longer than
+  READINESS_DB_TIMEOUT seconds, waiting for a pool connection or a TCP
+  connect included;
+- the pool is at least READINESS_MAX_POOL_SATURATION full, in which case
+  the database check is skipped rather than queued behind real requests.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, jsonify
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from cache import dashboard_cache, entity_cache, search_cache
+from compress import static_cache
+from models import db
+from thumbnails import failed_sources
+
+CACHES = (dashboard_cache, search_cache, entity_cache, failed_sources, static_cache)
+
+# Fill figures reported per cache; caches bounded by memory report bytes.
+CACHE_LIMITS = ('size', 'maxsize', 'bytes', 'maxbytes')
+
+# QueuePool's max_overflow unless SQLALCHEMY_ENGINE_OPTIONS sets one.
+DEFAULT_MAX_OVERFLOW = 10
+
+# Runs the database checks, so that a probe can give up on one still waiting
+# for a connection. Checks past their deadline finish in the background.
+_database_checks = ThreadPoolExecutor(2, thread_name_prefix='readyz')
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 2)
+
+
+def pool_status(pool, max_overflow=DEFAULT_MAX_OVERFLOW):
+    """
+    Describe how busy a connection pool is.
+
+    Args:
+        pool: The engine's SQLAlchemy pool.
+        max_overflow (int): The pool's configured max_overflow.
+
+    Returns:
+        dict: ``size``, ``max_overflow``, ``checked_out`` and ``saturation``
+        (checked-out share of the most connections the pool may open), or
+        just the pool class for pools without a fixed size.
+    """
+    if not hasattr(pool, 'checkedout'):
+        return {"class": type(pool).__name__}
+    # A negative max_overflow means the pool never runs out
+    capacity = pool.size() + max_overflow if max_overflow >= 0 else 0
+    checked_out = pool.checkedout()
+    return {
+        "size": pool.size(),
+        "max_overflow": max_overflow,
+        "checked_out": checked_out,
+        "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+    }
+
+
+def check_database(engine, timeout):
+    """
+    Check out a connection and run a trivial query, answering within ``timeout``.
+
+    Checking out a connection can wait for the pool (pool_timeout, 30
+    seconds by default) or a slow TCP connect, so the check runs in a
+    worker thread and is reported as failed once the deadline passes.
+
+    Args:
+        engine: The SQLAlchemy engine.
+        timeout (float): Seconds the whole check may take. On Postgres the
+            query also runs with this statement_timeout.
+
+    Returns:
+        dict: ``ok``, ``checkout_ms``, ``query_ms`` and ``error`` if it failed.
+    """
+    check = _database_checks.submit(_check_database, engine, timeout)
+    try:
+        return check.result(timeout)
+    except TimeoutError:
+        # Drop it if it has not started; otherwise it ends on its own.
+        check.cancel()
+        return {"ok": False, "error": f'no answer within {_milliseconds(timeout)} ms'}
+
+
+def _check_database(engine, timeout):
+    started = time.perf_counter()
+    result = {"ok": False}
+    try:
+        with engine.connect() as connection:
+            checked_out = time.perf_counter()
+            result["checkout_ms"] = _milliseconds(checked_out - started)
+            if connection.dialect.name == 'postgresql':
+                # Local to this transaction, which is rolled back below
+                connection.execute(text("SELECT set_config('statement_timeout', :ms, true)"),
+                                   {"ms": str(max(int(timeout * 1000), 1))})
+            connection.execute(text('SELECT 1'))
+            result["query_ms"] = _milliseconds(time.perf_counter() - checked_out)
+            connection.rollback()
+    except SQLAlchemyError as exc:
+        result["error"] = str(exc.__cause__ or exc).strip().splitlines()[0]
+        return result
+
+    elapsed = time.perf_counter() - started
+    result["ok"] = elapsed <= timeout
+    if not result["ok"]:
+        result["error"] = f'took {_milliseconds(elapsed)} ms, budget {_milliseconds(timeout)} ms'
+    return result
+
+
+def cache_status():
+    """
+    Report the in-process caches.
+
+    They live in this process, so they are always reachable; their sizes
+    show whether they are serving.
+    """
+    status = {}
+    for cache in CACHES:
+        stats = cache.stats()
+        status[cache.name] = {"ok": True, **{key: stats[key] for key in CACHE_LIMITS if key in stats}}
+    return status
+
+
+def healthz_view():
+    """
+    Liveness probe: the process is up and serving requests.
+
+    Returns:
+        Response: ``{"status": "ok"}``.
+    """
+    response = jsonify(status='ok')
+    response.cache_control.no_store = True
+    return response
+
+
+def readyz_view():
+    """
+    Readiness probe: whether this instance should receive traffic.
+
+    Returns:
+        Response: The check results, with status 200 when ready and 503 when
+        the instance should be drained.
+    """
+    config = current_app.config
+    max_overflow = config['SQLALCHEMY_ENGINE_OPTIONS'].get('max_overflow', DEFAULT_MAX_OVERFLOW)
+    pool = pool_status(db.engine.pool, max_overflow)
+
+    if pool.get("saturation", 0.0) >= config['READINESS_MAX_POOL_SATURATION']:
+        pool["ok"] = False
+        database = {"ok": False, "error": 'skipped, connection pool saturated'}
+    else:
+        pool["ok"] = True
+        database = check_database(db.engine, config['READINESS_DB_TIMEOUT'])
+
+    checks = {"database": database, "pool": pool, "caches": cache_status()}
+    ready = database["ok"] and pool["ok"]
+    response = jsonify(status='ready' if ready else 'unavailable', checks=checks)
+    response.status_code = 200 if ready else 503
+    response.cache_control.no_store = True
+    return response
+
+
+def init_app(app):
+    """
+    Register ``/healthz`` and ``/readyz``.
+
+    Args:
+        app (Flask): The application being configured.
+    """
+    app.add_url_rule('/healthz', 'healthz', healthz_view)
+    app.add_url_rule('/readyz', 'readyz', readyz_view)
@@ -0,0 +1,243 @@
+"""
+Cross-worker cache invalidation through Postgres LISTEN/NOTIFY.
+
+The in-process caches (see cache.py) only see the writes of their own
+worker. To keep the other workers coherent, every flush that writes a venue,
+artist or show also sends a ``NOTIFY`` on CHANNEL with the changed table and
+IDs. The notification rides on the flush's own transaction, so it is
+delivered when the change commits and dropped if it rolls back.
+
+Each web worker runs a ``ChangeListener`` thread with one ``LISTEN``
+connection per database (the default one and every region shard). It
+sleeps in ``select()`` until a notification arrives and then evicts the
+matching cache entries through ``cache.invalidate``, typically within a few
+milliseconds of the commit. Notifications sent by the worker itself are
+skipped; its caches were already invalidated by the commit.
+
+If a listening connection drops, notifications sent meanwhile are lost, so
+after reconnecting the listener invalidates everything once.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import os
+import select
+import socket
+import threading
+
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+import cache
+from cache import CATALOG_MODELS
+from models import db
+
+# Postgres channel carrying the change notifications.
+CHANNEL = 'fyyur_changes'
+
+# IDs per notification, keeping payloads well under Postgres' 8000 byte limit.
+IDS_PER_NOTIFICATION = 500
+
+_HOST = socket.gethostname()
+
+_start_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def origin():
+    """Identify this process in the notifications it sends."""
+    return f'{_HOST}:{os.getpid()}'
+
+
+def _payloads(table, ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), IDS_PER_NOTIFICATION):
+        yield json.dumps({"origin": origin(), "table": table,
+                          "ids": ids[start:start + IDS_PER_NOTIFICATION]})
+
+
+def _notify(connection, changes):
+    payloads = [payload for table, ids in changes.items() for payload in _payloads(table, ids)]
+    connection.execute(
+        text('SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload'),
+        {"channel": CHANNEL, "payloads": payloads})
+
+
+def publish(session, table, ids):
+    """
+    Announce a change made outside the ORM flush, such as a Core DELETE.
+
+    Sent on the session's current transaction; the local caches are
+    invalidated when it commits.
+
+    Args:
+        session (Session): The session that made the change.
+        table (str): 'venues', 'artists' or 'shows'.
+        ids (iterable): IDs of the changed rows.
+    """
+    ids = set(ids)
+    _notify(session.connection(), {table: ids})
+    cache.mark_catalog_changed(session, table, ids)
+
+
+def _publish_after_flush(session, flush_context):
+    changes = {}
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, CATALOG_MODELS) and obj.id is not None:
+            changes.setdefault(obj.__tablename__, set()).add(obj.id)
+    if changes:
+        _notify(session.connection(), changes)
+
+
+def handle(payload):
+    """
+    Evict the cache entries a notification payload names.
+
+    Args:
+        payload (str): The JSON payload of a CHANNEL notification.
+
+    Returns:
+        bool: False if the payload was skipped (sent by this process, or
+        malformed).
+    """
+    try:
+        message = json.loads(payload)
+        table, ids = message['table'], message['ids']
+    except (ValueError, KeyError, TypeError):
+        logger.warning('Ignoring malformed change notification %r', payload)
+        return False
+    if message.get('origin') == origin():
+        return False
+    cache.invalidate(table, ids)
+    return True
+
+
+class ChangeListener:
+    """
+    Background thread evicting cache entries on other workers' changes.
+
+    Attributes:
+        engines (list): Engines of the databases listened to.
+        reconnect_delay (float): Seconds between reconnection attempts.
+        pid (int): The process that started the thread.
+    """
+
+    def __init__(self, engines, reconnect_delay=5.0):
+        self.engines = engines
+        self.reconnect_delay = reconnect_delay
+        self.pid = os.getpid()
+        self.stopping = threading.Event()
+        self.listening = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='cache-invalidation', daemon=True)
+        self._connections = []
+
+    def start(self):
+        """Start listening in the background."""
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Stop the thread and close its connections."""
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def _connect(self):
+        for engine in self.engines:
+            # A connection of its own, outside the pool: it stays in LISTEN
+            # for the life of the thread.
+            proxied = engine.raw_connection()
+            proxied.detach()
+            connection = proxied.dbapi_connection
+            self._connections.append(connection)
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+
+    def _close(self):
+        for connection in self._connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        self._connections = []
+        self.listening.clear()
+
+    def _receive(self):
+        ready, _, _ = select.select(self._connections, [], [], 1.0)
+        for connection in ready:
+            connection.poll()
+            while connection.notifies:
+                notification = connection.notifies.pop(0)
+                if notification.channel == CHANNEL:
+                    handle(notification.payload)
+
+    def _run(self):
+        reconnected = False
+        while not self.stopping.is_set():
+            try:
+                if not self._connections:
+                    self._connect()
+                    if reconnected:
+                        # Anything sent while disconnected was missed.
+                        cache.invalidate_all()
+                    self.listening.set()
+                self._receive()
+            except Exception:
+                logger.exception('Cache invalidation listener lost its connection; '
+                                 'retrying in %s seconds', self.reconnect_delay)
+                self._close()
+                reconnected = True
+                self.stopping.wait(self.reconnect_delay)
+        self._close()
+
+
+def start_listener(app):
+    """
+    Start this process's listener unless it is already running.
+
+    Threads do not survive fork(), so a worker forked from a master that
+    had a listener starts its own.
+
+    Args:
+        app (Flask): The application whose databases to listen to.
+
+    Returns:
+        ChangeListener: The running listener.
+    """
+    with _start_lock:
+        listener = app.extensions.get('invalidation')
+        if listener is None or listener.pid != os.getpid():
+            engines = list({id(engine): engine for engine in db.engines.values()}.values())
+            listener = ChangeListener(engines, app.config['CACHE_NOTIFY_RECONNECT_DELAY']).start()
+            atexit.register(listener.stop)
+            app.extensions['invalidation'] = listener
+    return listener
+
+
+def _ensure_listener():
+    listener = current_app.extensions.get('invalidation')
+    if listener is None or listener.pid != os.getpid():
+        start_listener(current_app._get_current_object())
+
+
+def init_app(app):
+    """
+    Send change notifications on catalog writes and, with
+    CACHE_NOTIFY_ENABLED, listen for those of other workers.
+
+    The listener starts with the first request a process handles, so CLI
+    commands never open one and each forked worker gets its own.
+
+    Args:
+        app (Flask): The application being configured.
+    """
+    if not event.contains(Session, 'after_flush', _publish_after_flush):
+        event.listen(Session, 'after_flush', _publish_after_flush)
+
+    if app.config['CACHE_NOTIFY_ENABLED']:
+        app.before_request(_ensure_listener)
@@ -0,0 +1,298 @@
+"""
+Background jobs backed by a queue table in the database.
+
+Routes call ``enqueue()`` to add a ``Job`` row in their own transaction and
+return at once; ``flask worker`` runs the jobs. Each worker thread claims
+the oldest due job with ``SELECT ... FOR UPDATE SKIP LOCKED``, so any
+number of threads and worker processes share the queue without claiming
+the same job twice and without waiting on each other's locks.
+
+A job that raises is retried with exponential backoff up to
+JOB_MAX_ATTEMPTS times. A job still 'running' after JOB_TIMEOUT seconds is
+assumed to belong to a dead worker and queued again. Jobs can therefore run
+more than once, so tasks must be idempotent.
+
+Tasks are plain functions registered with ``@task('name')``; the job's
+payload is passed as keyword arguments and the return value, which must be
+JSON-serializable, is stored as the job's result.
+"""
+
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, select, update
+
+import invalidation
+import shards
+from models import Job, Show, Venue, db
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+# Seconds before the n-th retry is BACKOFF_BASE * 2 ** (n - 1)
+BACKOFF_BASE = 10
+
+
+def task(name):
+    """Register the decorated function as the task ``name``."""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue(kind, **payload):
+    """
+    Queue a job in the current session; the caller commits.
+
+    Args:
+        kind (str): A registered task name.
+        **payload: Keyword arguments for the task (JSON-serializable).
+
+    Returns:
+        Job: The new, pending job.
+
+    Raises:
+        ValueError: If no task is registered as ``kind``.
+    """
+    if kind not in TASKS:
+        raise ValueError(f'Unknown task {kind!r}')
+    job = Job(kind=kind, payload=payload)
+    db.session.add(job)
+    return job
+
+
+def job_status(job):
+    """
+    Describe a job for the status endpoint.
+
+    Returns:
+        dict: The job's id, kind, status, attempts, result, error and times.
+    """
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at and job.started_at.isoformat(),
+        "finished_at": job.finished_at and job.finished_at.isoformat(),
+    }
+
+
+def claim():
+    """
+    Take the oldest due job off the queue and mark it running.
+
+    Jobs locked by another worker's claim are skipped, not waited for.
+
+    Returns:
+        tuple: The job's ``(id, kind, payload)``, or None if nothing is due.
+    """
+    now = datetime.utcnow()
+    job = db.session.scalars(
+        select(Job)
+        .where(Job.status == 'queued', Job.run_at <= now)
+        .order_by(Job.run_at, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+    if job is None:
+        db.session.rollback()
+        return None
+    job.status = 'running'
+    job.attempts += 1
+    job.started_at = now
+    claimed = (job.id, job.kind, dict(job.payload))
+    db.session.commit()
+    return claimed
+
+
+def _finish(job_id, **values):
+    db.session.execute(update(Job).where(Job.id == job_id).values(**values))
+    db.session.commit()
+
+
+def run(job_id, kind, payload):
+    """
+    Run a claimed job and record its outcome.
+
+    Args:
+        job_id (int): The job ID.
+        kind (str): The task name.
+        payload (dict): The task's keyword arguments.
+
+    Returns:
+        bool: True if the task succeeded.
+    """
+    try:
+        result = TASKS[kind](**payload)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        logger.exception('Job %s (%s) failed', job_id, kind)
+        attempts = db.session.scalar(select(Job.attempts).where(Job.id == job_id))
+        now = datetime.utcnow()
+        error = traceback.format_exc(limit=5)
+        if attempts < current_app.config['JOB_MAX_ATTEMPTS']:
+            _finish(job_id, status='queued', error=error,
+                    run_at=now + timedelta(seconds=BACKOFF_BASE * 2 ** (attempts - 1)))
+        else:
+            _finish(job_id, status='failed', error=error, finished_at=now)
+        return False
+
+    _finish(job_id, status='done', result=result, error=None, finished_at=datetime.utcnow())
+    return True
+
+
+def run_next():
+    """
+    Claim and run one job.
+
+    Returns:
+        bool: False if the queue had no due job.
+    """
+    claimed = claim()
+    if claimed is None:
+        return False
+    run(*claimed)
+    return True
+
+
+def requeue_stale(timeout):
+    """
+    Queue again the jobs that have been running for longer than ``timeout`` seconds.
+
+    Returns:
+        int: Number of jobs requeued.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+    result = db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.started_at < cutoff)
+        .values(status='queued', run_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+class Worker:
+    """
+    Runs queued jobs on a pool of threads until stopped.
+
+    Attributes:
+        app (Flask): The application whose database holds the queue.
+        threads (int): Number of jobs run concurrently.
+        poll_interval (float): Seconds an idle thread waits before polling again.
+    """
+
+    def __init__(self, app, threads=4, poll_interval=1.0):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+
+    def _loop(self, burst):
+        with self.app.app_context():
+            try:
+                while not self.stopping.is_set():
+                    try:
+                        if run_next():
+                            continue
+                    except Exception:
+                        # Lost the database; back off and try again
+                        db.session.rollback()
+                        logger.exception('Worker could not claim a job')
+                    if burst:
+                        return
+                    self.stopping.wait(self.poll_interval)
+            finally:
+                db.session.remove()
+
+    def run(self, burst=False):
+        """
+        Run jobs until ``stop()`` is called (or Ctrl-C).
+
+        Stale jobs are requeued on start and then every JOB_TIMEOUT / 10
+        seconds.
+
+        Args:
+            burst (bool): Return once the queue has no due jobs instead of
+                polling for more.
+        """
+        timeout = self.app.config['JOB_TIMEOUT']
+        with ThreadPoolExecutor(self.threads, thread_name_prefix='fyyur-worker') as pool:
+            self._requeue_stale(timeout)
+            last_requeue = time.monotonic()
+            futures = [pool.submit(self._loop, burst) for _ in range(self.threads)]
+            try:
+                while not self.stopping.wait(self.poll_interval):
+                    if all(future.done() for future in futures):
+                        break
+                    if time.monotonic() - last_requeue >= timeout / 10:
+                        self._requeue_stale(timeout)
+                        last_requeue = time.monotonic()
+            except KeyboardInterrupt:
+                # Let the running jobs finish; stop taking new ones.
+                self.stopping.set()
+        for future in futures:
+            future.result()
+
+    def _requeue_stale(self, timeout):
+        with self.app.app_context():
+            requeued = requeue_stale(timeout)
+        if requeued:
+            logger.warning('Requeued %d stale jobs', requeued)
+
+    def stop(self):
+        """Stop claiming new jobs; running jobs finish first."""
+        self.stopping.set()
+
+
+#----------------------------------------------------------------------------#
+# Tasks.
+#----------------------------------------------------------------------------#
+
+@task('delete_venue')
+def delete_venue(venue_id):
+    """
+    Delete a venue and all of its shows.
+
+    The shows go in one set-based DELETE (their ``show_listings`` rows
+    follow through the cascading foreign key) instead of being loaded and
+    deleted one by one through the ORM relationship.
+    """
+    with shards.region(shards.region_for_id(venue_id)):
+        shows = db.session.execute(delete(Show).where(Show.venue_id == venue_id)).rowcount
+        venues = db.session.execute(delete(Venue).where(Venue.id == venue_id)).rowcount
+        invalidation.publish(db.session, 'venues', [venue_id])
+    return {"venues": venues, "shows": shows}
+
+
+@task('rebuild_listings')
+def rebuild_listings():
+    """Rebuild the show_listings read table of every region."""
+    import listings
+
+    count = 0
+    for name in shards.regions():
+        with shards.region(name):
+            count += listings.rebuild()
+    return {"listings": count}
+
+
+@task('load_data')
+def load_data():
+    """Load the sample artists and shows."""
+    from load_data import load_artists_and_shows
+
+    load_artists_and_shows()
+    return {}
@@ -0,0 +1,110 @@
+"""
+Maintenance of the denormalized ``show_listings`` read table.
+
+The shows page and the home page list shows with their venue name, artist
+name and artist image. Instead of joining three tables on every request they
+read ``ShowListing`` rows, which this module keeps in step with the source
+tables from inside each ORM flush:
+
+- a new show, or a show whose venue, artist or start time changed, has its
+  row (re)built from the joined source rows;
+- a venue rename, or an artist rename or new image, is copied onto that
+  venue's or artist's rows;
+- deleting a show removes its row through the ``ON DELETE CASCADE`` foreign key.
+
+Because the rows are written on the flush's own connection they commit or
+roll back together with the change that caused them. Core-level bulk writes
+bypass the flush; run ``rebuild()`` (``flask rebuild-listings``) after them.
+"""
+
+from sqlalchemy import delete, event, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models import Artist, Show, ShowListing, Venue, db
+
+LISTING_COLUMNS = ('show_id', 'venue_id', 'venue_name', 'artist_id',
+                   'artist_name', 'artist_image_link', 'start_time')
+
+
+def _listing_source():
+    """Select show rows joined to their venue and artist, shaped like ShowListing."""
+    return (
+        select(
+            Show.id,
+            Show.venue_id,
+            Venue.name,
+            Show.artist_id,
+            Artist.name,
+            Artist.image_link,
+            Show.start_time,
+        )
+        .join(Venue, Show.venue_id == Venue.id)
+        .join(Artist, Show.artist_id == Artist.id)
+    )
+
+
+def _changed(obj, *attributes):
+    """Return True if any of ``attributes`` has pending changes on ``obj``."""
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+def _sync_after_flush(session, flush_context):
+    show_ids, venue_ids, artist_ids = set(), set(), set()
+    for obj in session.new:
+        if isinstance(obj, Show):
+            show_ids.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Show) and _changed(obj, 'venue_id', 'artist_id', 'start_time'):
+            show_ids.add(obj.id)
+        elif isinstance(obj, Venue) and _changed(obj, 'name'):
+            venue_ids.add(obj.id)
+        elif isinstance(obj, Artist) and _changed(obj, 'name', 'image_link'):
+            artist_ids.add(obj.id)
+
+    if not (show_ids or venue_ids or artist_ids):
+        return
+
+    connection = session.connection()
+    if show_ids:
+        connection.execute(delete(ShowListing).where(ShowListing.show_id.in_(show_ids)))
+        connection.execute(insert(ShowListing).from_select(
+            LISTING_COLUMNS, _listing_source().where(Show.id.in_(show_ids))))
+    if venue_ids:
+        connection.execute(
+            update(ShowListing)
+            .where(ShowListing.venue_id == Venue.id, Venue.id.in_(venue_ids))
+            .values(venue_name=Venue.name)
+        )
+    if artist_ids:
+        connection.execute(
+            update(ShowListing)
+            .where(ShowListing.artist_id == Artist.id, Artist.id.in_(artist_ids))
+            .values(artist_name=Artist.name, artist_image_link=Artist.image_link)
+        )
+
+
+def rebuild():
+    """
+    Repopulate ``show_listings`` from the source tables.
+
+    Runs in the current session's transaction; the caller commits.
+
+    Returns:
+        int: Number of listing rows written.
+    """
+    db.session.execute(delete(ShowListing))
+    result = db.session.execute(
+        insert(ShowListing).from_select(LISTING_COLUMNS, _listing_source()))
+    return result.rowcount
+
+
+def init_app(app):
+    """
+    Start keeping ``show_listings`` in sync with ORM writes.
+
+    Args:
+        app (Flask): The application being configured.
+    """
+    if not event.contains(Session, 'after_flush', _sync_after_flush):
+        event.listen(Session, 'after_flush', _sync_after_flush)
@@ -0,0 +1,157 @@
+"""
+Logging setup for the Fyyur project.
+
+Log records are formatted as JSON lines in the request thread and handed to a
+queue; a background QueueListener thread performs the (rotating) file I/O so
+request threads never block on disk.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import current_app, g, has_request_context, request
+from flask.logging import default_handler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Request attributes copied onto every record emitted during a request.
+REQUEST_FIELDS = ('request_id', 'route', 'method', 'path', 'status',
+                  'duration_ms', 'query_count')
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format log records as single-line JSON objects.
+
+    Request-scoped fields (see REQUEST_FIELDS) are included when present,
+    either passed through ``extra=`` or picked up from the active request.
+    """
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        if has_request_context():
+            data["request_id"] = g.get('request_id')
+            data["route"] = request.endpoint
+            data["method"] = request.method
+            data["path"] = request.path
+
+        for field in REQUEST_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(data, default=str)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    """Count SQL statements issued while handling the current request."""
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def _start_request():
+    """Assign a request id and start the request timer."""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+    g.query_count = 0
+
+
+def _log_request(response):
+    """Emit one structured access record per request."""
+    duration = time.perf_counter() - g.get('request_started', time.perf_counter())
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    current_app.logger.info(
+        'request',
+        extra={
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 2),
+            "query_count": g.get('query_count', 0),
+        }
+    )
+    return response
+
+
+def init_app(app):
+    """
+    Configure non-blocking JSON logging for the given Flask app.
+
+    Outside debug and testing mode records are written to a rotating file configured by
+    LOG_FILE, LOG_MAX_BYTES and LOG_BACKUP_COUNT by a QueueListener thread.
+
+    Args:
+        app (Flask): The application to configure.
+
+    Returns:
+        QueueListener: The started listener, or None in debug/testing mode.
+    """
+    app.before_request(_start_request)
+    app.after_request(_log_request)
+
+    if not event.contains(Engine, 'before_cursor_execute', _count_query):
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+
+    app.logger.setLevel(app.config.get('LOG_LEVEL', logging.INFO))
+
+    if app.debug or app.testing:
+        return None
+
+    file_handler = RotatingFileHandler(
+        app.config['LOG_FILE'],
+        maxBytes=app.config.get('LOG_MAX_BYTES', 0),
+        backupCount=app.config.get('LOG_BACKUP_COUNT', 0),
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    # The QueueHandler renders the JSON line in the request thread (where the
+    # request context is available); the listener thread only writes it out.
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(JsonFormatter())
+    queue_handler.setLevel(app.config.get('LOG_LEVEL', logging.INFO))
+    app.logger.addHandler(queue_handler)
+    app.logger.removeHandler(default_handler)
+
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    app.extensions['logs'] = listener
+
+    return listener
+
+
+def after_fork(app):
+    """
+    Restart the log listener thread in a freshly forked worker.
+
+    Threads do not survive fork(), so a listener started in a preforking
+    server's master must be replaced in every worker or records would queue
+    up without ever being written.
+
+    Args:
+        app (Flask): The application whose listener should be restarted.
+    """
+    listener = app.extensions.get('logs')
+    if listener is None:
+        return
+
+    listener = QueueListener(listener.queue, *listener.handlers,
+                             respect_handler_level=listener.respect_handler_level)
+    listener.start()
+    atexit.register(listener.stop)
+    app.extensions['logs'] = listener
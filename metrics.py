@@ -0,0 +1,168 @@
+"""
+Prometheus metrics for the Fyyur project.
+
+Exposes per-endpoint request counters and latency histograms, SQLAlchemy
+connection pool gauges, cache hit/miss and rate-limit counters and template
+render time at ``/metrics``.
+
+When the PROMETHEUS_MULTIPROC_DIR environment variable is set (it must be set
+before this module is imported), prometheus_client keeps every value in
+per-process mmap-backed files and the endpoint aggregates them, so the numbers
+are correct behind a preforking server with several workers.
+"""
+
+import os
+import time
+
+from flask import Response, before_render_template, g, request, template_rendered
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+from sqlalchemy.pool import QueuePool
+
+#----------------------------------------------------------------------------#
+# Metrics.
+#----------------------------------------------------------------------------#
+
+REQUEST_COUNT = Counter(
+    'fyyur_requests_total', 'HTTP requests handled.',
+    ['endpoint', 'method', 'status']
+)
+REQUEST_LATENCY = Histogram(
+    'fyyur_request_duration_seconds', 'HTTP request latency.',
+    ['endpoint']
+)
+TEMPLATE_RENDER_TIME = Histogram(
+    'fyyur_template_render_seconds', 'Jinja template render time.',
+    ['template']
+)
+CACHE_LOOKUPS = Counter(
+    'fyyur_cache_lookups_total', 'Cache lookups by cache and result (hit/miss).',
+    ['cache', 'result']
+)
+RATE_LIMITED = Counter(
+    'fyyur_rate_limited_total', 'Requests rejected by the rate limiter.',
+    ['endpoint']
+)
+POOL_CHECKED_OUT = Gauge(
+    'fyyur_db_pool_checked_out', 'Connections currently checked out of the pool.',
+    multiprocess_mode='livesum'
+)
+POOL_OVERFLOW = Gauge(
+    'fyyur_db_pool_overflow', 'Connections currently open beyond pool_size.',
+    multiprocess_mode='livesum'
+)
+POOL_WAIT_TIME = Histogram(
+    'fyyur_db_pool_wait_seconds', 'Time spent waiting to check out a pool connection.'
+)
+
+
+def record_cache_lookup(cache, hit):
+    """
+    Count a cache lookup.
+
+    Args:
+        cache (str): Name of the cache.
+        hit (bool): Whether the lookup was served from the cache.
+    """
+    CACHE_LOOKUPS.labels(cache=cache, result='hit' if hit else 'miss').inc()
+
+
+def record_rate_limited(endpoint):
+    """
+    Count a request rejected by the rate limiter.
+
+    Args:
+        endpoint (str): The endpoint that was limited.
+    """
+    RATE_LIMITED.labels(endpoint=endpoint).inc()
+
+
+#----------------------------------------------------------------------------#
+# Connection pool.
+#----------------------------------------------------------------------------#
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports checkout wait time and pool occupancy."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT_TIME.observe(time.perf_counter() - started)
+            self._update_gauges()
+
+    def _do_return_conn(self, record):
+        try:
+            super()._do_return_conn(record)
+        finally:
+            self._update_gauges()
+
+    def _update_gauges(self):
+        POOL_CHECKED_OUT.set(self.checkedout())
+        POOL_OVERFLOW.set(max(self.overflow(), 0))
+
+
+#----------------------------------------------------------------------------#
+# Request hooks.
+#----------------------------------------------------------------------------#
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+    started = g.get('metrics_started')
+    if started is not None:
+        REQUEST_LATENCY.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+    REQUEST_COUNT.labels(endpoint=endpoint, method=request.method,
+                         status=response.status_code).inc()
+    return response
+
+
+def _template_started(sender, template, context, **extra):
+    g.setdefault('template_timers', []).append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    timers = g.get('template_timers')
+    if timers:
+        TEMPLATE_RENDER_TIME.labels(template=template.name).observe(
+            time.perf_counter() - timers.pop())
+
+
+def metrics_view():
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    Returns:
+        Response: The metrics payload.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    """
+    Register the metrics hooks and the ``/metrics`` endpoint.
+
+    Must be called before ``db.init_app(app)`` so the engine is created with
+    the instrumented connection pool.
+
+    Args:
+        app (Flask): The application to instrument.
+    """
+    engine_options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    engine_options.setdefault('poolclass', InstrumentedQueuePool)
+
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,28 @@
+"""Add created_at and start_time indexes for the home page
+
+Revision ID: 3c1f8a2b7d4e
+Revises: 86f6ba57931e
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f8a2b7d4e'
+down_revision = '86f6ba57931e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_venues_created_at'), 'venues', ['created_at'], unique=False)
+    op.create_index(op.f('ix_artists_created_at'), 'artists', ['created_at'], unique=False)
+    op.create_index(op.f('ix_shows_start_time'), 'shows', ['start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_shows_start_time'), table_name='shows')
+    op.drop_index(op.f('ix_artists_created_at'), table_name='artists')
+    op.drop_index(op.f('ix_venues_created_at'), table_name='venues')
@@ -0,0 +1,89 @@
+"""Partition shows by year of start_time
+
+Revision ID: 5d0f7a2c8e13
+Revises: e4b81c3f9a62
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0f7a2c8e13'
+down_revision = 'e4b81c3f9a62'
+branch_labels = None
+depends_on = None
+
+# Partitions created past the current year; `flask create-partitions` adds more.
+YEARS_AHEAD = 2
+
+
+def _shows_columns():
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('shows_id_seq')"),
+                  nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ),
+        sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ),
+    ]
+
+
+def _copy_shows(source):
+    op.execute(f"INSERT INTO shows (id, artist_id, venue_id, start_time) "
+               f"SELECT id, artist_id, venue_id, start_time FROM {source}")
+    # Keep the id sequence when the old table is dropped.
+    op.execute("ALTER SEQUENCE shows_id_seq OWNED BY shows.id")
+    op.drop_table(source)
+
+
+def upgrade():
+    # A partitioned table's unique keys must include the partition key, so
+    # show_listings now references (id, start_time).
+    op.drop_constraint('show_listings_show_id_fkey', 'show_listings', type_='foreignkey')
+    op.drop_index('ix_shows_start_time', table_name='shows')
+    op.rename_table('shows', 'shows_unpartitioned')
+    op.execute("ALTER TABLE shows_unpartitioned RENAME CONSTRAINT shows_pkey "
+               "TO shows_unpartitioned_pkey")
+
+    op.create_table('shows', *_shows_columns(),
+                    sa.PrimaryKeyConstraint('id', 'start_time'),
+                    postgresql_partition_by='RANGE (start_time)')
+    op.create_index('ix_shows_start_time', 'shows', ['start_time'], unique=False)
+
+    # One partition per year from the oldest show to YEARS_AHEAD years out.
+    first, last = op.get_bind().execute(sa.text(
+        "SELECT CAST(extract(year FROM min(start_time)) AS integer), "
+        "CAST(extract(year FROM max(start_time)) AS integer) FROM shows_unpartitioned"
+    )).one()
+    current = datetime.now().year
+    for year in range(min(first or current, current - 1),
+                      max(last or current, current + YEARS_AHEAD) + 1):
+        op.execute(f"CREATE TABLE shows_{year} PARTITION OF shows "
+                   f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')")
+
+    _copy_shows('shows_unpartitioned')
+    op.create_foreign_key('show_listings_show_id_start_time_fkey', 'show_listings', 'shows',
+                          ['show_id', 'start_time'], ['id', 'start_time'],
+                          ondelete='CASCADE', onupdate='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('show_listings_show_id_start_time_fkey', 'show_listings',
+                       type_='foreignkey')
+    op.drop_index('ix_shows_start_time', table_name='shows')
+    op.rename_table('shows', 'shows_partitioned')
+    op.execute("ALTER TABLE shows_partitioned RENAME CONSTRAINT shows_pkey "
+               "TO shows_partitioned_pkey")
+
+    op.create_table('shows', *_shows_columns(), sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_shows_start_time', 'shows', ['start_time'], unique=False)
+
+    # Dropping the partitioned table drops its yearly partitions too.
+    _copy_shows('shows_partitioned')
+    op.create_foreign_key('show_listings_show_id_fkey', 'show_listings', 'shows',
+                          ['show_id'], ['id'], ondelete='CASCADE')
@@ -0,0 +1,32 @@
+"""Add city/state and genre indexes for the advanced search facets
+
+Revision ID: a7d29e4c51b0
+Revises: 3c1f8a2b7d4e
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d29e4c51b0'
+down_revision = '3c1f8a2b7d4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.create_index(f'ix_{table}_lower_city_state', table,
+                        [sa.text('lower(city)'), 'state'], unique=False)
+        op.create_index(f'ix_{table}_state', table, ['state'], unique=False)
+        op.create_index(f'ix_{table}_genres', table, ['genres'], unique=False,
+                        postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_index(f'ix_{table}_genres', table_name=table)
+        op.drop_index(f'ix_{table}_state', table_name=table)
+        op.drop_index(f'ix_{table}_lower_city_state', table_name=table)
@@ -0,0 +1,55 @@
+"""Add the weekly availability bitmask to artists
+
+Revision ID: c2a5e8f71d30
+Revises: 9b3e6d1f4a27
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2a5e8f71d30'
+down_revision = '9b3e6d1f4a27'
+branch_labels = None
+depends_on = None
+
+# One bit per quarter hour of the week, Monday 00:00 first.
+WEEK_QUARTERS = 7 * 96
+
+
+def upgrade():
+    op.add_column('artists', sa.Column(
+        'availability_mask', postgresql.BIT(WEEK_QUARTERS), nullable=False,
+        server_default=sa.text(f"CAST(repeat('0', {WEEK_QUARTERS}) AS bit({WEEK_QUARTERS}))")))
+
+    # Set the bit of every whole quarter hour inside each existing slot
+    # (23:59 counts as midnight, as in availability.py).
+    op.execute(f"""
+        UPDATE artists SET availability_mask = masks.mask
+        FROM (
+            SELECT artist_id,
+                   CAST(string_agg(CASE WHEN covered THEN '1' ELSE '0' END, ''
+                                   ORDER BY quarter) AS bit({WEEK_QUARTERS})) AS mask
+            FROM (
+                SELECT artist_ids.artist_id, quarter, bool_or(
+                    availability.day_of_week * 96 + CAST(ceil(extract(epoch FROM availability.start_time) / 900) AS integer) <= quarter
+                    AND quarter < availability.day_of_week * 96 + CASE
+                        WHEN availability.end_time = '23:59' THEN 96
+                        ELSE CAST(floor(extract(epoch FROM availability.end_time) / 900) AS integer) END
+                ) AS covered
+                FROM (SELECT DISTINCT artist_id FROM availability) AS artist_ids
+                CROSS JOIN generate_series(0, {WEEK_QUARTERS - 1}) AS quarter
+                JOIN availability ON availability.artist_id = artist_ids.artist_id
+                GROUP BY artist_ids.artist_id, quarter
+            ) AS quarters
+            GROUP BY artist_id
+        ) AS masks
+        WHERE artists.id = masks.artist_id
+    """)
+
+
+def downgrade():
+    op.drop_column('artists', 'availability_mask')
@@ -0,0 +1,51 @@
+"""Add the denormalized show_listings read table
+
+Revision ID: e4b81c3f9a62
+Revises: a7d29e4c51b0
+Create Date: 2026-10-19 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b81c3f9a62'
+down_revision = 'a7d29e4c51b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('show_listings',
+    sa.Column('show_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('venue_name', sa.String(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('artist_name', sa.String(), nullable=False),
+    sa.Column('artist_image_link', sa.String(length=500), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['show_id'], ['shows.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('show_id')
+    )
+    op.create_index('ix_show_listings_start_time', 'show_listings', ['start_time', 'show_id'], unique=False)
+    op.create_index('ix_show_listings_venue_id', 'show_listings', ['venue_id'], unique=False)
+    op.create_index('ix_show_listings_artist_id', 'show_listings', ['artist_id'], unique=False)
+
+    # Backfill from the existing shows.
+    op.execute("""
+        INSERT INTO show_listings (show_id, venue_id, venue_name, artist_id,
+                                   artist_name, artist_image_link, start_time)
+        SELECT shows.id, shows.venue_id, venues.name, shows.artist_id,
+               artists.name, artists.image_link, shows.start_time
+        FROM shows
+        JOIN venues ON venues.id = shows.venue_id
+        JOIN artists ON artists.id = shows.artist_id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_show_listings_artist_id', table_name='show_listings')
+    op.drop_index('ix_show_listings_venue_id', table_name='show_listings')
+    op.drop_index('ix_show_listings_start_time', table_name='show_listings')
+    op.drop_table('show_listings')
@@ -5,11 +5,73 @@ This module defines the database models for venues, artists, and shows.
 It uses SQLAlchemy for object-relational mapping and Flask-Migrate for database migrations.
 """
 
+from contextvars import ContextVar
 from datetime import datetime
 
+import sqlalchemy as sa
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.types import TypeDecorator
 
-db = SQLAlchemy()
+# Region shard (a SQLALCHEMY_BINDS key) that reads and writes go to; None is
+# the default database. Set it with ``shards.region()``.
+current_region = ContextVar('current_region', default=None)
+
+# Tables kept only in the default database, whatever the current region.
+UNSHARDED_TABLES = frozenset({'jobs'})
+
+
+class RegionSession(Session):
+    """
+    ``db.session`` class that sends catalog statements to ``current_region``.
+
+    Statements on UNSHARDED_TABLES, and every statement while no region is
+    set, use Flask-SQLAlchemy's usual bind selection.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        region = current_region.get()
+        if bind is None and region is not None and not _is_unsharded(mapper, clause):
+            return self._db.engines[region]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_unsharded(mapper, clause):
+    if mapper is not None:
+        return sa.inspect(mapper).local_table.name in UNSHARDED_TABLES
+    if isinstance(clause, sa.Table):
+        return clause.name in UNSHARDED_TABLES
+    if isinstance(clause, sa.UpdateBase) and isinstance(clause.table, sa.Table):
+        return clause.table.name in UNSHARDED_TABLES
+    return False
+
+
+db = SQLAlchemy(session_options={'class_': RegionSession})
+
+# Quarter-hours in a week, Monday 00:00 first.
+WEEK_QUARTERS = 7 * 96
+
+
+class WeekMask(TypeDecorator):
+    """
+    A week of quarter-hours stored as ``BIT(672)`` and used as a Python int.
+
+    Bit ``k`` of the int is quarter-hour ``k`` of the week, i.e. character
+    ``k`` of the stored bit string.
+    """
+    impl = BIT(WEEK_QUARTERS)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return format(value, f'0{WEEK_QUARTERS}b')[::-1]
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return int(value[::-1], 2)
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -35,6 +97,12 @@ Attributes:
     created_at (datetime): Timestamp when the venue was created.
 """
     __tablename__ = 'venues'
+    __table_args__ = (
+        # Exact-match facets used by the advanced search
+        db.Index('ix_venues_lower_city_state', db.text('lower(city)'), 'state'),
+        db.Index('ix_venues_state', 'state'),
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -48,7 +116,7 @@ Attributes:
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # Relationships
     shows = db.relationship('Show', backref='venue', lazy=True, cascade="all, delete-orphan")
@@ -74,8 +142,16 @@ class Artist(db.Model):
         seeking_venue (bool): Whether the artist is currently looking for venues.
         seeking_description (str): Description of what kind of venues the artist is seeking.
         created_at (datetime): Timestamp when the artist was created.
+        availability_mask (int): The artist's weekly availability as quarter-hour
+            bits, kept in step with the Availability rows (see availability.py).
     """
     __tablename__ = 'artists'
+    __table_args__ = (
+        # Exact-match facets used by the advanced search
+        db.Index('ix_artists_lower_city_state', db.text('lower(city)'), 'state'),
+        db.Index('ix_artists_state', 'state'),
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -88,7 +164,10 @@ class Artist(db.Model):
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    availability_mask = db.Column(
+        WeekMask, nullable=False, default=0,
+        server_default=db.text(f"CAST(repeat('0', {WEEK_QUARTERS}) AS bit({WEEK_QUARTERS}))"))
 
     # Relationships
     shows = db.relationship('Show', backref='artist',
@@ -108,18 +187,68 @@ class Show(db.Model):
         artist_id (int): Foreign key referencing the Artist model.
         venue_id (int): Foreign key referencing the Venue model.
         start_time (DateTime): Start time of the show.
+
+    The table is range-partitioned by year of ``start_time`` (see
+    partitions.py), so its primary key has to include ``start_time``. The
+    mapper still identifies shows by ``id`` alone.
     """
     __tablename__ = 'shows'
+    __table_args__ = (
+        # Per-venue and per-artist show history, paged by (start_time, id)
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time', 'id'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time', 'id'),
+        {'postgresql_partition_by': 'RANGE (start_time)'},
+    )
 
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
+    start_time = db.Column(db.DateTime, primary_key=True, index=True)
+
+    __mapper_args__ = {'primary_key': [id]}
 
     def __repr__(self):
         return f'<Show {self.id}, Artist {self.artist_id}, Venue {self.venue_id}>'
 
 
+class ShowListing(db.Model):
+    """
+    Denormalized copy of a show with the venue and artist fields listings render.
+
+    Rows are maintained by ``listings.py`` whenever a show, venue or artist is
+    written, so the shows page reads one table in ``start_time`` order.
+
+    Attributes:
+        show_id (int): The show this row mirrors; deleted along with it.
+        venue_id (int): Venue of the show.
+        venue_name (str): Copy of ``Venue.name``.
+        artist_id (int): Artist of the show.
+        artist_name (str): Copy of ``Artist.name``.
+        artist_image_link (str): Copy of ``Artist.image_link``.
+        start_time (DateTime): Start time of the show.
+    """
+    __tablename__ = 'show_listings'
+    __table_args__ = (
+        # shows is partitioned, so its unique key (and this reference) is (id, start_time)
+        db.ForeignKeyConstraint(['show_id', 'start_time'], ['shows.id', 'shows.start_time'],
+                                ondelete='CASCADE', onupdate='CASCADE'),
+        db.Index('ix_show_listings_start_time', 'start_time', 'show_id'),
+        db.Index('ix_show_listings_venue_id', 'venue_id'),
+        db.Index('ix_show_listings_artist_id', 'artist_id'),
+    )
+
+    show_id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, nullable=False)
+    venue_name = db.Column(db.String, nullable=False)
+    artist_id = db.Column(db.Integer, nullable=False)
+    artist_name = db.Column(db.String, nullable=False)
+    artist_image_link = db.Column(db.String(500))
+    start_time = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ShowListing {self.show_id}, {self.artist_name} at {self.venue_name}>'
+
+
 class Availability(db.Model):
     """
     Represents availability information for an artist in the Fyyur database.
@@ -142,3 +271,43 @@ class Availability(db.Model):
     
     def __repr__(self):
         return f'<Availability {self.id}, Artist: {self.artist_id}, Day: {self.day_of_week}>'
+
+
+class Job(db.Model):
+    """
+    A unit of background work, queued by the web app and run by ``flask worker``.
+
+    Attributes:
+        id (int): Unique identifier for the job.
+        kind (str): Name of the task to run (see jobs.py).
+        payload (dict): Keyword arguments for the task.
+        status (str): 'queued', 'running', 'done' or 'failed'.
+        attempts (int): How many times the job has been started.
+        result (dict): What the task returned, once done.
+        error (str): The last error, if an attempt failed.
+        created_at (datetime): When the job was queued.
+        run_at (datetime): Earliest time the job may (re)start.
+        started_at (datetime): When the current or last attempt started.
+        finished_at (datetime): When the job finished or finally failed.
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers claim the oldest due job; only queued jobs are indexed
+        db.Index('ix_jobs_queued', 'run_at', 'id', postgresql_where=db.text("status = 'queued'")),
+        db.Index('ix_jobs_running', 'started_at', postgresql_where=db.text("status = 'running'")),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(16), nullable=False, default='queued', server_default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
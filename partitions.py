@@ -0,0 +1,106 @@
+"""
+Yearly range partitions of the ``shows`` table.
+
+``shows`` is partitioned by ``start_time`` into one table per calendar year
+(``shows_2024``, ``shows_2025``, ...). Queries that filter on ``start_time``,
+such as the upcoming/past split on the detail pages, are pruned to the
+partitions covering that range.
+
+There is no default partition, so a show can only be inserted once the
+partition for its year exists. Run ``flask create-partitions`` regularly
+(e.g. daily from cron) to keep partitions created ahead of time.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import event, text
+
+from models import Show
+
+PARENT_TABLE = 'shows'
+
+# Partitions kept ahead of the current year by default.
+YEARS_AHEAD = 2
+
+
+def partition_name(year):
+    """Return the name of the partition holding shows starting in ``year``."""
+    return f'{PARENT_TABLE}_{year}'
+
+
+def existing_partitions(connection):
+    """
+    List the years that already have a partition.
+
+    Args:
+        connection: A SQLAlchemy connection.
+
+    Returns:
+        list: Sorted years.
+    """
+    rows = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": PARENT_TABLE}).scalars()
+    prefix = f'{PARENT_TABLE}_'
+    return sorted(int(name[len(prefix):]) for name in rows
+                  if name.startswith(prefix) and name[len(prefix):].isdigit())
+
+
+def create_partitions(connection, years):
+    """
+    Create the yearly partitions for ``years``.
+
+    Years that already have a partition are skipped.
+
+    Args:
+        connection: A SQLAlchemy connection.
+        years (iterable): Years to cover.
+
+    Returns:
+        list: Years whose partition was created.
+    """
+    existing = set(existing_partitions(connection))
+    created = []
+    for year in sorted(set(years) - existing):
+        connection.execute(text(
+            f"CREATE TABLE {partition_name(year)} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        ))
+        created.append(year)
+    return created
+
+
+def ensure_future_partitions(connection, years_ahead=YEARS_AHEAD):
+    """
+    Make sure partitions exist from the current year to ``years_ahead`` years out.
+
+    Args:
+        connection: A SQLAlchemy connection.
+        years_ahead (int): How many years past the current one to cover.
+
+    Returns:
+        list: Years whose partition was created.
+    """
+    year = datetime.now().year
+    return create_partitions(connection, range(year, year + years_ahead + 1))
+
+
+def _partition_after_create(table, connection, **kw):
+    # Tables made with create_all (tests, benchmarks) start with the usual
+    # partitions, plus the previous year for recent past shows.
+    if connection.dialect.name == 'postgresql':
+        year = datetime.now().year
+        create_partitions(connection, range(year - 1, year + YEARS_AHEAD + 1))
+
+
+def init_app(app):
+    """
+    Create the current partitions whenever ``db.create_all()`` creates ``shows``.
+
+    Args:
+        app (Flask): The application being configured.
+    """
+    if not event.contains(Show.__table__, 'after_create', _partition_after_create):
+        event.listen(Show.__table__, 'after_create', _partition_after_create)
@@ -0,0 +1,558 @@
+"""
+Read-only queries for the Fyyur listing pages.
+
+These select only the columns a page renders and return SQLAlchemy ``Row``
+objects (named tuples) instead of ORM instances. That skips the identity
+map, attribute instrumentation and the long text columns such as
+``seeking_description`` that listings never show.
+"""
+
+import heapq
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import Date, cast, exists, func, select, true, tuple_, union_all
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+import shards
+from models import Artist, Show, ShowListing, Venue, WeekMask, db
+
+GenreCount = namedtuple('GenreCount', 'genre listings')
+
+# Columns of the venue and artist snapshots served from cache.entity_cache;
+# the artist's availability bitmask is left out.
+SNAPSHOT_COLUMNS = {
+    Venue: tuple(Venue.__table__.columns),
+    Artist: tuple(column for column in Artist.__table__.columns
+                  if column.key != 'availability_mask'),
+}
+_SNAPSHOT_TYPES = {
+    model: namedtuple(f'{model.__name__}Snapshot', [column.key for column in columns])
+    for model, columns in SNAPSHOT_COLUMNS.items()
+}
+
+
+def _stream(stmt, batch_size):
+    """
+    Run ``stmt`` on a server-side cursor now; return an iterator fetching
+    ``batch_size`` rows at a time.
+    """
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    return _rows(result)
+
+
+def _rows(result):
+    try:
+        yield from result
+    finally:
+        result.close()
+
+
+def artist_summaries(batch_size=None):
+    """
+    Fetch every artist's id and name, ordered by name and id.
+
+    Copies of artists from other regions (see shards.py) are left out.
+
+    Args:
+        batch_size (int): Stream the rows from a server-side cursor this
+            many at a time instead of fetching them all.
+
+    Returns:
+        list | iterator: Rows with ``id`` and ``name``; an iterator when
+        ``batch_size`` is given.
+    """
+    stmt = (select(Artist.id, Artist.name)
+            .where(shards.home_rows(Artist))
+            .order_by(Artist.name, Artist.id))
+    if batch_size:
+        return _stream(stmt, batch_size)
+    return db.session.execute(stmt).all()
+
+
+def venue_summaries(now=None):
+    """
+    Fetch every venue with its number of upcoming shows in a single query.
+
+    Args:
+        now (datetime): Cut-off between past and upcoming shows. Defaults to
+            the current time.
+
+    Returns:
+        list: Rows with ``id``, ``name``, ``city``, ``state`` and
+        ``num_upcoming_shows``, ordered by state, city and name.
+    """
+    now = now or datetime.now()
+    stmt = (
+        select(
+            Venue.id,
+            Venue.name,
+            Venue.city,
+            Venue.state,
+            func.count(Show.id).label('num_upcoming_shows'),
+        )
+        .outerjoin(Show, (Show.venue_id == Venue.id) & (Show.start_time > now))
+        .group_by(Venue.id)
+        .order_by(Venue.state, Venue.city, Venue.name)
+    )
+    return db.session.execute(stmt).all()
+
+
+def venue_search(*criteria, now=None):
+    """
+    Fetch venues matching every criterion, with their upcoming show counts.
+
+    Args:
+        *criteria: SQL expressions on ``Venue`` columns.
+        now (datetime): Cut-off for upcoming shows. Defaults to the current time.
+
+    Returns:
+        list: Rows with ``id``, ``name``, ``city``, ``state`` and
+        ``num_upcoming_shows``, ordered by name and id.
+    """
+    now = now or datetime.now()
+    stmt = (
+        select(
+            Venue.id,
+            Venue.name,
+            Venue.city,
+            Venue.state,
+            func.count(Show.id).label('num_upcoming_shows'),
+        )
+        .outerjoin(Show, (Show.venue_id == Venue.id) & (Show.start_time > now))
+        .where(*criteria)
+        .group_by(Venue.id)
+        .order_by(Venue.name, Venue.id)
+    )
+    return db.session.execute(stmt).all()
+
+
+def artist_search(*criteria, now=None):
+    """
+    Fetch artists matching every criterion, with their upcoming show counts.
+
+    Args:
+        *criteria: SQL expressions on ``Artist`` columns.
+        now (datetime): Cut-off for upcoming shows. Defaults to the current time.
+
+    Returns:
+        list: Rows with ``id``, ``name``, ``city``, ``state`` and
+        ``num_upcoming_shows``, ordered by name and id.
+    """
+    now = now or datetime.now()
+    stmt = (
+        select(
+            Artist.id,
+            Artist.name,
+            Artist.city,
+            Artist.state,
+            func.count(Show.id).label('num_upcoming_shows'),
+        )
+        .outerjoin(Show, (Show.artist_id == Artist.id) & (Show.start_time > now))
+        .where(*criteria)
+        .group_by(Artist.id)
+        .order_by(Artist.name, Artist.id)
+    )
+    return db.session.execute(stmt).all()
+
+
+def _show_listing_select():
+    """Select the show tile columns from the denormalized show_listings table."""
+    return select(
+        ShowListing.show_id,
+        ShowListing.venue_id,
+        ShowListing.venue_name,
+        ShowListing.artist_id,
+        ShowListing.artist_name,
+        ShowListing.artist_image_link,
+        ShowListing.start_time,
+    )
+
+
+def show_listings(batch_size=None):
+    """
+    Fetch every show with the venue and artist fields the shows page renders.
+
+    Reads ``show_listings`` in index order, so there is no join.
+
+    Args:
+        batch_size (int): Stream the rows from a server-side cursor this
+            many at a time instead of fetching them all.
+
+    Returns:
+        list | iterator: Rows with ``show_id``, ``venue_id``, ``venue_name``,
+        ``artist_id``, ``artist_name``, ``artist_image_link`` and
+        ``start_time``, ordered by start time; an iterator when
+        ``batch_size`` is given.
+    """
+    stmt = _show_listing_select().order_by(ShowListing.start_time, ShowListing.show_id)
+    if batch_size:
+        return _stream(stmt, batch_size)
+    return db.session.execute(stmt).all()
+
+
+def _listing_key(row):
+    return row.start_time, row.show_id
+
+
+def entity_snapshot(model, obj_id):
+    """
+    Fetch a venue or artist as an immutable snapshot.
+
+    Args:
+        model: ``Venue`` or ``Artist``.
+        obj_id (int): The row's ID.
+
+    Returns:
+        tuple: A named tuple of the SNAPSHOT_COLUMNS values, with lists
+        (genres) turned into tuples, or None if there is no such row.
+    """
+    row = db.session.execute(
+        select(*SNAPSHOT_COLUMNS[model]).where(model.id == obj_id)).first()
+    if row is None:
+        return None
+    return _SNAPSHOT_TYPES[model](*(tuple(value) if isinstance(value, list) else value
+                                    for value in row))
+
+
+def _venue_show_select():
+    """Select the show and artist columns rendered on a venue's show tiles."""
+    return (
+        select(
+            Show.id,
+            Show.artist_id,
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link'),
+            Show.start_time,
+        )
+        .join(Artist, Show.artist_id == Artist.id)
+    )
+
+
+def _artist_show_select():
+    """Select the show and venue columns rendered on an artist's show tiles."""
+    return (
+        select(
+            Show.id,
+            Show.venue_id,
+            Venue.name.label('venue_name'),
+            Venue.image_link.label('venue_image_link'),
+            Show.start_time,
+        )
+        .join(Venue, Show.venue_id == Venue.id)
+    )
+
+
+def _show_key(row):
+    return row.start_time, row.id
+
+
+def _upcoming(stmt, now):
+    """Restrict a show select to upcoming shows, soonest first."""
+    stmt = stmt.where(Show.start_time >= now).order_by(Show.start_time, Show.id)
+    return db.session.execute(stmt).all()
+
+
+def _past_page(stmt, limit, before, now):
+    """
+    Fetch one page of past shows, most recent first.
+
+    Pages are keyed on ``(start_time, id)`` rather than an offset, so each
+    page is an index range scan no matter how deep into the history it is.
+
+    Returns:
+        tuple: The rows, and the ``(start_time, id)`` cursor of the next page
+        or None if this is the last one.
+    """
+    stmt = stmt.where(Show.start_time < now)
+    if before is not None:
+        stmt = stmt.where(tuple_(Show.start_time, Show.id) < tuple_(*before))
+    stmt = stmt.order_by(Show.start_time.desc(), Show.id.desc()).limit(limit + 1)
+
+    rows = db.session.execute(stmt).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].start_time, rows[-1].id)
+
+
+def _merge_past_pages(pages, limit):
+    """Combine the ``_past_page`` results of several regions into one page."""
+    if len(pages) == 1:
+        return pages[0]
+    rows = list(heapq.merge(*(rows for rows, _ in pages), key=_show_key, reverse=True))
+    if len(rows) <= limit and all(cursor is None for _, cursor in pages):
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].start_time, rows[-1].id)
+
+
+def past_show_count(owner_column, owner_id, now=None):
+    """
+    Count the past shows of a venue or artist.
+
+    Args:
+        owner_column: ``Show.venue_id`` or ``Show.artist_id``.
+        owner_id (int): The venue or artist ID.
+        now (datetime): Cut-off between past and upcoming shows. Defaults to
+            the current time.
+
+    Returns:
+        int: The number of past shows.
+    """
+    now = now or datetime.now()
+    stmt = select(func.count()).where(owner_column == owner_id, Show.start_time < now)
+    return db.session.scalar(stmt)
+
+
+def venue_upcoming_shows(venue_id, now=None):
+    """
+    Fetch a venue's upcoming shows with their artist.
+
+    Returns:
+        list: Rows with ``id``, ``artist_id``, ``artist_name``,
+        ``artist_image_link`` and ``start_time``, soonest first.
+    """
+    return _upcoming(_venue_show_select().where(Show.venue_id == venue_id),
+                     now or datetime.now())
+
+
+def venue_past_shows(venue_id, limit, before=None, now=None):
+    """
+    Fetch a page of a venue's past shows with their artist.
+
+    Args:
+        venue_id (int): The venue ID.
+        limit (int): Page size.
+        before (tuple): ``(start_time, id)`` cursor returned with the previous
+            page, or None for the most recent page.
+        now (datetime): Cut-off for past shows. Defaults to the current time.
+
+    Returns:
+        tuple: Rows shaped like ``venue_upcoming_shows()``, most recent first,
+        and the cursor of the next page or None.
+    """
+    return _past_page(_venue_show_select().where(Show.venue_id == venue_id),
+                      limit, before, now or datetime.now())
+
+
+def artist_upcoming_shows(artist_id, now=None):
+    """
+    Fetch an artist's upcoming shows with their venue.
+
+    Shows are kept in their venue's region, so every region is asked.
+
+    Returns:
+        list: Rows with ``id``, ``venue_id``, ``venue_name``,
+        ``venue_image_link`` and ``start_time``, soonest first.
+    """
+    return shards.gather(_upcoming, _artist_show_select().where(Show.artist_id == artist_id),
+                         now or datetime.now(), key=_show_key)
+
+
+def artist_past_shows(artist_id, limit, before=None, now=None):
+    """
+    Fetch a page of an artist's past shows with their venue, from every region.
+
+    Args:
+        artist_id (int): The artist ID.
+        limit (int): Page size.
+        before (tuple): ``(start_time, id)`` cursor returned with the previous
+            page, or None for the most recent page.
+        now (datetime): Cut-off for past shows. Defaults to the current time.
+
+    Returns:
+        tuple: Rows shaped like ``artist_upcoming_shows()``, most recent first,
+        and the cursor of the next page or None.
+    """
+    pages = shards.scatter(_past_page, _artist_show_select().where(Show.artist_id == artist_id),
+                           limit, before, now or datetime.now())
+    return _merge_past_pages(pages, limit)
+
+
+def available_artists(needed):
+    """
+    Fetch the artists whose weekly availability covers every bit of ``needed``.
+
+    The check is one bitwise AND on ``artists.availability_mask`` per artist,
+    with no join to the availability rows.
+
+    Args:
+        needed (int): A quarter-hour mask, e.g. from ``availability.period_mask``.
+
+    Returns:
+        list: Rows with ``id`` and ``name``, ordered by name.
+    """
+    mask = Artist.availability_mask
+    stmt = (
+        select(Artist.id, Artist.name)
+        .where(shards.home_rows(Artist), mask.op('&', return_type=WeekMask())(needed) == needed)
+        .order_by(Artist.name)
+    )
+    return db.session.execute(stmt).all()
+
+
+def venue_open_dates(first_night, last_night, *criteria):
+    """
+    Find the venues that have no show on some of the nights in a date range.
+
+    One statement pairs every matching venue with every night of the range
+    and keeps the pairs with no show that night (a NOT EXISTS anti-join,
+    answered from the ``shows(venue_id, start_time)`` index and only the
+    partitions covering the range), then gathers each venue's free nights
+    into an array.
+
+    Args:
+        first_night (date): First night of the range.
+        last_night (date): Last night of the range, inclusive.
+        *criteria: Venue filters, e.g. from ``search.search_criteria``.
+
+    Returns:
+        list: Rows with ``id``, ``name``, ``city``, ``state`` and
+        ``open_dates`` (sorted dates), ordered by name. Venues booked every
+        night are left out.
+    """
+    day = timedelta(days=1)
+    range_start = datetime.combine(first_night, datetime.min.time())
+    range_end = datetime.combine(last_night, datetime.min.time()) + day
+    nights = (func.generate_series(range_start, range_end - day, day)
+              .table_valued('night').render_derived())
+    night = nights.c.night
+
+    booked = exists().where(
+        Show.venue_id == Venue.id,
+        # Constant bounds let the planner prune to the range's partitions
+        Show.start_time >= range_start,
+        Show.start_time < range_end,
+        Show.start_time >= night,
+        Show.start_time < night + day,
+    )
+    open_night = cast(night, Date)
+    stmt = (
+        select(
+            Venue.id,
+            Venue.name,
+            Venue.city,
+            Venue.state,
+            func.array_agg(aggregate_order_by(open_night, open_night)).label('open_dates'),
+        )
+        .join(nights, true())
+        .where(*criteria, ~booked)
+        .group_by(Venue.id)
+        .order_by(Venue.name, Venue.id)
+    )
+    return db.session.execute(stmt).all()
+
+
+def recent_venues(limit=5):
+    """
+    Fetch the most recently listed venues (uses the created_at index).
+
+    Args:
+        limit (int): Maximum number of venues.
+
+    Returns:
+        list: Rows with ``id``, ``name``, ``city``, ``state`` and ``created_at``.
+    """
+    stmt = (
+        select(Venue.id, Venue.name, Venue.city, Venue.state, Venue.created_at)
+        .where(Venue.created_at.isnot(None))
+        .order_by(Venue.created_at.desc())
+        .limit(limit)
+    )
+    return db.session.execute(stmt).all()
+
+
+def recent_artists(limit=5):
+    """
+    Fetch the most recently listed artists (uses the created_at index).
+
+    Args:
+        limit (int): Maximum number of artists.
+
+    Returns:
+        list: Rows with ``id``, ``name``, ``city``, ``state`` and ``created_at``.
+    """
+    stmt = (
+        select(Artist.id, Artist.name, Artist.city, Artist.state, Artist.created_at)
+        .where(Artist.created_at.isnot(None), shards.home_rows(Artist))
+        .order_by(Artist.created_at.desc())
+        .limit(limit)
+    )
+    return db.session.execute(stmt).all()
+
+
+def next_shows(limit=6, now=None):
+    """
+    Fetch the next upcoming shows across all cities (uses the start_time index).
+
+    Args:
+        limit (int): Maximum number of shows.
+        now (datetime): Cut-off for upcoming shows. Defaults to the current time.
+
+    Returns:
+        list: Rows shaped like ``show_listings()``.
+    """
+    now = now or datetime.now()
+    stmt = (
+        _show_listing_select()
+        .where(ShowListing.start_time >= now)
+        .order_by(ShowListing.start_time, ShowListing.show_id)
+        .limit(limit)
+    )
+    return db.session.execute(stmt).all()
+
+
+def _genre_counts(limit):
+    genres = union_all(
+        select(func.unnest(Artist.genres).label('genre')).where(shards.home_rows(Artist)),
+        select(func.unnest(Venue.genres).label('genre')),
+    ).subquery()
+    listings = func.count().label('listings')
+    stmt = (
+        select(genres.c.genre, listings)
+        .group_by(genres.c.genre)
+        .order_by(listings.desc(), genres.c.genre)
+        .limit(limit)
+    )
+    return db.session.execute(stmt).all()
+
+
+def top_genres(limit=8):
+    """
+    Count how many artists and venues list each genre.
+
+    Args:
+        limit (int): Maximum number of genres.
+
+    Returns:
+        list: Rows with ``genre`` and ``listings``, most common first.
+    """
+    # Each region counts every genre; the totals are added up here.
+    results = shards.scatter(_genre_counts, None if shards.enabled() else limit)
+    if len(results) == 1:
+        return results[0]
+    counts = Counter()
+    for rows in results:
+        counts.update(dict(rows))
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [GenreCount(genre, listings) for genre, listings in ranked[:limit]]
+
+
+def _newest(row):
+    return row.created_at
+
+
+def home_dashboard():
+    """
+    Gather everything the home page shows, from every region.
+
+    Returns:
+        dict: ``recent_venues``, ``recent_artists``, ``next_shows`` and ``top_genres``.
+    """
+    return {
+        "recent_venues": shards.gather(recent_venues, 5, key=_newest, reverse=True, limit=5),
+        "recent_artists": shards.gather(recent_artists, 5, key=_newest, reverse=True, limit=5),
+        "next_shows": shards.gather(next_shows, 6, key=_listing_key, limit=6),
+        "top_genres": top_genres(),
+    }
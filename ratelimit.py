@@ -0,0 +1,198 @@
+"""
+Token-bucket rate limiting for the expensive routes.
+
+Each (route, client) pair has a bucket of ``requests`` tokens that refills
+at ``requests / seconds`` tokens per second, as set per endpoint in
+``RATE_LIMITS``. A request takes one token; with the bucket empty it gets a
+429 with a ``Retry-After`` header instead. Short bursts up to the bucket
+size pass, sustained traffic is held to the configured rate.
+
+Clients are keyed by IP address (``request.remote_addr``; behind a reverse
+proxy wrap the app in werkzeug's ``ProxyFix``). Buckets are kept by one of
+two backends, chosen with ``RATE_LIMIT_STORAGE``:
+
+- ``memory``: a bounded dict in each process. Every worker enforces the
+  budget on its own, so the effective limit is multiplied by the number of
+  workers.
+- ``sqlite``: one SQLite file (``RATE_LIMIT_SQLITE_PATH``) shared by every
+  worker on the host, updated in a short write transaction per request.
+
+A backend that fails lets requests through rather than failing them.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, render_template, request
+from werkzeug.exceptions import TooManyRequests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def take_token(tokens, updated, capacity, rate, now):
+    """
+    Refill a bucket for the time since it was last updated and take a token.
+
+    Args:
+        tokens (float): Tokens left at ``updated``, or None for a new bucket.
+        updated (float): When the bucket was last updated, in seconds.
+        capacity (int): Bucket size.
+        rate (float): Tokens added per second.
+        now (float): The current time, on the same clock as ``updated``.
+
+    Returns:
+        tuple: Tokens left, and seconds until a token is available (0 if
+        one was taken).
+    """
+    if tokens is None:
+        tokens = float(capacity)
+    else:
+        tokens = min(float(capacity), tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBackend:
+    """
+    Buckets in a dict local to the process.
+
+    The least recently used buckets are dropped beyond ``maxsize``; a dropped
+    bucket had been refilling and would usually be full again anyway.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """Take a token from ``key``'s bucket; return the seconds to wait, 0 if taken."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (None, now))
+            tokens, retry_after = take_token(tokens, updated, capacity, rate, now)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+class SQLiteBackend:
+    """
+    Buckets in a SQLite file shared by the processes on one host.
+
+    Each process and thread opens its own connection. A take is one
+    ``BEGIN IMMEDIATE`` transaction, so concurrent workers serialize on the
+    file lock and never lose an update.
+    """
+
+    # Delete buckets idle for this long every PRUNE_EVERY takes; they are
+    # full again by then (buckets refill within their period).
+    PRUNE_AFTER = 3600
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # Connections must not be shared with a forked child.
+            local.connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.execute('PRAGMA synchronous=OFF')
+            local.connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            local.pid = os.getpid()
+        return local.connection
+
+    def take(self, key, capacity, rate):
+        """Take a token from ``key``'s bucket; return the seconds to wait, 0 if taken."""
+        connection = self._connection()
+        # Wall-clock time, since the buckets are shared between processes
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, retry_after = take_token(*(row or (None, now)), capacity, rate, now)
+            connection.execute(
+                'INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, '
+                'updated = excluded.updated', (key, tokens, now))
+            self._takes += 1
+            if self._takes % self.PRUNE_EVERY == 0:
+                connection.execute('DELETE FROM buckets WHERE updated < ?',
+                                   (now - self.PRUNE_AFTER,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return retry_after
+
+
+def _client_key():
+    return request.remote_addr or 'unknown'
+
+
+def _check_rate_limit():
+    config = current_app.config
+    if not config['RATE_LIMIT_ENABLED'] or request.endpoint not in config['RATE_LIMITS']:
+        return None
+
+    requests, seconds = config['RATE_LIMITS'][request.endpoint]
+    backend = current_app.extensions['ratelimit']
+    try:
+        retry_after = backend.take(f'{request.endpoint}:{_client_key()}',
+                                   requests, requests / seconds)
+    except sqlite3.Error:
+        logger.warning('rate limit backend failed, letting the request through',
+                       exc_info=True)
+        return None
+    if retry_after:
+        metrics.record_rate_limited(request.endpoint)
+        raise TooManyRequests(retry_after=math.ceil(retry_after))
+    return None
+
+
+def _too_many_requests(error):
+    response = current_app.make_response(
+        (render_template('errors/429.html', retry_after=error.retry_after), 429))
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def init_app(app):
+    """
+    Create the configured backend and start limiting the RATE_LIMITS routes.
+
+    Args:
+        app (Flask): The application being configured.
+
+    Raises:
+        ValueError: If RATE_LIMIT_STORAGE names no backend.
+    """
+    storage = app.config['RATE_LIMIT_STORAGE']
+    if storage == 'memory':
+        backend = MemoryBackend()
+    elif storage == 'sqlite':
+        backend = SQLiteBackend(app.config['RATE_LIMIT_SQLITE_PATH'])
+    else:
+        raise ValueError(f'Unknown RATE_LIMIT_STORAGE {storage!r}')
+    app.extensions['ratelimit'] = backend
+
+    app.before_request(_check_rate_limit)
+    app.register_error_handler(TooManyRequests, _too_many_requests)
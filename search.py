@@ -0,0 +1,119 @@
+"""
+Structured search for the Fyyur advanced search routes.
+
+A search term is free text (matched against names) plus optional facets:
+
+    hop city:san francisco state:CA genre:jazz,folk
+    "Musical, San Francisco, CA"     (legacy "Name, City, State" form)
+
+City, state and genre facets are exact-match filters, backed by the
+``lower(city), state``, ``state`` and GIN ``genres`` indexes. Only the name
+falls through to ``ILIKE`` text search.
+"""
+
+import re
+from typing import NamedTuple
+
+from sqlalchemy import cast, func
+
+from forms import VenueForm
+
+FACET_PATTERN = re.compile(r'\b(city|state|genre):', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+# Genres are stored with their canonical spelling from the form choices.
+GENRES = {value.casefold(): value for value, _ in VenueForm.genres.kwargs['choices']}
+
+
+class SearchQuery(NamedTuple):
+    """A parsed search: free text for the name plus exact-match facets."""
+
+    name: str = ''
+    city: str = ''
+    state: str = ''
+    genres: tuple = ()
+
+
+def _clean(value):
+    return WHITESPACE.sub(' ', value).strip()
+
+
+def _parse_positional(term):
+    """Parse the legacy comma-separated "Name, City, State" form."""
+    parts = [_clean(part) for part in term.split(',')]
+    if len(parts) == 1:
+        return SearchQuery(name=parts[0].lower())
+    if len(parts) == 2:
+        # "City, ST" when the last part looks like a state code, else "Name, City"
+        if len(parts[1]) == 2 and parts[1].isalpha():
+            return SearchQuery(city=parts[0].lower(), state=parts[1].upper())
+        return SearchQuery(name=parts[0].lower(), city=parts[1].lower())
+    return SearchQuery(name=parts[0].lower(), city=parts[1].lower(),
+                       state=parts[2].upper())
+
+
+def parse_search(term):
+    """
+    Parse a search term into a normalized SearchQuery.
+
+    Facet values run until the next facet; quote them to follow them with
+    more free text (``city:"new york" jazz club``). Several genres can be
+    given comma-separated and must all match.
+
+    Args:
+        term (str): The raw search term.
+
+    Returns:
+        SearchQuery: Lower-cased name and city (as SQL ``lower()`` does;
+        ``casefold()`` would turn 'ß' into 'ss'), upper-case state and
+        canonical, sorted genres. Equivalent searches compare equal, so the
+        result is usable as a cache key.
+    """
+    matches = list(FACET_PATTERN.finditer(term))
+    if not matches:
+        return _parse_positional(term)
+
+    free_text = [term[:matches[0].start()]]
+    facets = {}
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(term)
+        value = term[match.end():end].strip()
+        if value.startswith('"'):
+            value, _, rest = value[1:].partition('"')
+            free_text.append(rest)
+        facets[match.group(1).lower()] = _clean(value)
+
+    genres = {GENRES.get(genre.casefold(), genre)
+              for genre in (_clean(g) for g in facets.get('genre', '').split(','))
+              if genre}
+
+    return SearchQuery(
+        name=_clean(' '.join(free_text)).lower(),
+        city=facets.get('city', '').lower(),
+        state=facets.get('state', '').upper(),
+        genres=tuple(sorted(genres)),
+    )
+
+
+def search_criteria(model, query):
+    """
+    Build the SQL filters for a parsed search.
+
+    Args:
+        model: ``Venue`` or ``Artist``.
+        query (SearchQuery): The parsed search.
+
+    Returns:
+        list: Filter expressions to AND together.
+    """
+    criteria = []
+    if query.name:
+        criteria.append(model.name.ilike(f'%{query.name}%'))
+    if query.city:
+        criteria.append(func.lower(model.city) == query.city)
+    if query.state:
+        criteria.append(model.state == query.state)
+    if query.genres:
+        # Array containment (@>), which the GIN index on genres supports
+        criteria.append(model.genres.op('@>')(cast(list(query.genres), model.genres.type)))
+    return criteria
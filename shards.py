@@ -0,0 +1,390 @@
+"""
+Optional sharding of the catalog across regional databases, keyed by state.
+
+Each region is a complete Fyyur database (run ``flask db upgrade`` against
+it like the default one) listed in SHARDS::
+
+    SHARDS = {
+        'west': {'number': 1, 'url': 'postgresql://.../fyyur_west', 'states': ['CA', 'OR']},
+        'east': {'number': 2, 'url': 'postgresql://.../fyyur_east', 'states': ['NY', 'NJ']},
+    }
+
+- A venue and its shows live in the region of the venue's state, an artist
+  and its availability in the region of the artist's state. States that no
+  region lists, and the jobs queue, stay in the default database.
+- Every region hands out IDs from its own block of ID_BLOCK values
+  (``flask init-shards`` sets up the sequences), so a venue, artist or show
+  ID alone tells which region holds it.
+- A show's artist may live in another region. Before the show is written,
+  the artist row is copied into the venue's region (``copy_artist``), so
+  foreign keys, the show_listings sync and the venue pages work within one
+  database; edits to the artist are copied along (``sync_artist_copies``).
+- Views about one venue or artist run in its region (``routed``). Listings
+  spanning regions query every region concurrently and merge the ordered
+  results (``gather``, ``merge_streams``); artist rows met more than once,
+  a home row and its copies, are folded together (``merge_copies``).
+
+Rows are not moved between regions, so assign a state to a region before
+any of its venues or artists are listed. With SHARDS empty (the default)
+every helper runs its query once, on the default database.
+"""
+
+import functools
+import heapq
+import itertools
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import select, text, true
+from sqlalchemy.orm import Session
+
+from models import Artist, current_region, db
+
+# IDs per region: region n allocates IDs n * ID_BLOCK to (n + 1) * ID_BLOCK - 1,
+# the default database being region 0. 21 regions fit a 32-bit ID.
+ID_BLOCK = 100_000_000
+MAX_REGIONS = (2 ** 31 - 1) // ID_BLOCK
+
+# Tables whose IDs are allocated per region.
+SEQUENCE_TABLES = ('venues', 'artists', 'shows', 'availability')
+
+# Artist columns copied into other regions. The availability mask stays with
+# the home row, like the availability rows it summarizes.
+COPIED_ARTIST_COLUMNS = tuple(column for column in Artist.__table__.columns
+                              if column.key != 'availability_mask')
+
+
+class ShardMap:
+    """
+    The validated SHARDS setting.
+
+    Attributes:
+        names (list): Region names, in SHARDS order.
+        numbers (dict): Region number by name.
+        by_state (dict): Region name by state.
+        executor (ThreadPoolExecutor): Runs the per-region queries of ``scatter``.
+    """
+
+    def __init__(self, shards, threads):
+        self.names = list(shards)
+        self.numbers = {}
+        self.by_state = {}
+        for name, shard in shards.items():
+            number = shard['number']
+            if not 1 <= number < MAX_REGIONS or number in self.numbers.values():
+                raise ValueError(f'Shard {name!r} needs a unique number from 1 to '
+                                 f'{MAX_REGIONS - 1}, not {number!r}')
+            self.numbers[name] = number
+            for state in shard['states']:
+                if state in self.by_state:
+                    raise ValueError(f'State {state} is in shards {self.by_state[state]!r} '
+                                     f'and {name!r}')
+                self.by_state[state] = name
+        self.by_number = {number: name for name, number in self.numbers.items()}
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='shards') if shards else None
+
+
+def _map():
+    return current_app.extensions['shards']
+
+
+def enabled():
+    """Return True if the catalog is split over region shards."""
+    return bool(_map().names)
+
+
+def regions():
+    """List every region: None (the default database) first, then the shards."""
+    return [None, *_map().names]
+
+
+def region_for_state(state):
+    """Return the region holding venues and artists of ``state`` (None for the default database)."""
+    return _map().by_state.get(state)
+
+
+def region_for_id(obj_id):
+    """Return the region whose ID block ``obj_id`` (a venue, artist or show ID) is in."""
+    return _map().by_number.get(obj_id // ID_BLOCK)
+
+
+def moves_region(obj_id, state):
+    """Return True if changing the venue or artist ``obj_id`` to ``state`` would need another region."""
+    return region_for_state(state) != region_for_id(obj_id)
+
+
+def home_rows(model):
+    """
+    Return a criterion keeping the rows the current region is home to.
+
+    Leaves out artist copies (whose IDs are in another region's block).
+    Always true when sharding is off.
+
+    Args:
+        model: ``Artist`` or ``Venue``.
+    """
+    if not enabled():
+        return true()
+    number = _map().numbers.get(current_region.get(), 0)
+    return model.id.between(number * ID_BLOCK, (number + 1) * ID_BLOCK - 1)
+
+
+@contextmanager
+def region(name):
+    """Send ``db.session``'s catalog statements to region ``name`` inside the block."""
+    token = current_region.set(name)
+    try:
+        yield
+    finally:
+        current_region.reset(token)
+
+
+def routed(argument):
+    """
+    Run a view in the region of the ID passed as its ``argument`` keyword.
+
+    The whole view, commit included, runs in that region, so the ORM reads
+    and writes the right database without further changes.
+
+    Args:
+        argument (str): Name of the view argument holding a venue or artist ID.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with region(region_for_id(kwargs[argument])):
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+#----------------------------------------------------------------------------#
+# Scatter-gather reads.
+#----------------------------------------------------------------------------#
+
+def _call_in_region(app, name, fn, args, kwargs):
+    with app.app_context(), region(name):
+        return fn(*args, **kwargs)
+
+
+def scatter(fn, *args, **kwargs):
+    """
+    Call a read function in every region concurrently.
+
+    Each call runs in a worker thread with its own app context and session,
+    so ``fn`` must return plain rows rather than ORM objects.
+
+    Returns:
+        list: The result of each call, in ``regions()`` order.
+    """
+    if not enabled():
+        return [fn(*args, **kwargs)]
+    app = current_app._get_current_object()
+    futures = [_map().executor.submit(_call_in_region, app, name, fn, args, kwargs)
+               for name in regions()]
+    return [future.result() for future in futures]
+
+
+def gather(fn, *args, key, reverse=False, limit=None, **kwargs):
+    """
+    Call a read function in every region and merge its ordered rows.
+
+    Args:
+        fn (callable): Returns rows sorted by ``key``.
+        *args: Arguments for ``fn``.
+        key (callable): Sort key of a row, matching the SQL ORDER BY.
+        reverse (bool): True if the rows are in descending order.
+        limit (int): Keep only the first ``limit`` merged rows.
+        **kwargs: Keyword arguments for ``fn``.
+
+    Returns:
+        list: The merged rows.
+    """
+    results = scatter(fn, *args, **kwargs)
+    if len(results) == 1:
+        return results[0]
+    return list(itertools.islice(heapq.merge(*results, key=key, reverse=reverse), limit))
+
+
+def _merged(streams, key):
+    try:
+        yield from heapq.merge(*streams, key=key)
+    finally:
+        for stream in streams:
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+
+
+def merge_streams(fn, *args, key, **kwargs):
+    """
+    Open a streaming read in every region and merge the rows as they arrive.
+
+    Used for the streamed listings: ``fn`` opens a server-side cursor and
+    returns an iterator over it, so memory stays flat however many regions
+    and rows there are.
+
+    Returns:
+        iterator: Rows from every region in ``key`` order.
+    """
+    if not enabled():
+        return fn(*args, **kwargs)
+    streams = []
+    for name in regions():
+        with region(name):
+            streams.append(fn(*args, **kwargs))
+    return _merged(streams, key)
+
+
+@functools.lru_cache(maxsize=None)
+def _row_type(fields):
+    return namedtuple('Row', fields)
+
+
+def merge_copies(rows, counts=()):
+    """
+    Fold adjacent rows of the same artist (its home row and copies) into one.
+
+    Args:
+        rows (iterable): Rows with an ``id``, merged so that rows of one
+            artist are adjacent.
+        counts (tuple): Names of count columns to add up over the rows.
+
+    Returns:
+        iterator: One row per artist.
+    """
+    if not enabled():
+        return iter(rows)
+    return _fold_copies(rows, counts)
+
+
+def _fold_copies(rows, counts):
+    for _, group in itertools.groupby(rows, key=lambda row: row.id):
+        first = next(group)
+        rest = list(group)
+        if not rest or not counts:
+            yield first
+            continue
+        values = first._asdict()
+        for name in counts:
+            values[name] += sum(getattr(row, name) for row in rest)
+        yield _row_type(tuple(values))(**values)
+
+
+#----------------------------------------------------------------------------#
+# Artist copies.
+#----------------------------------------------------------------------------#
+
+def _home_artist(artist_id):
+    with region(region_for_id(artist_id)):
+        row = db.session.execute(
+            select(*COPIED_ARTIST_COLUMNS).where(Artist.id == artist_id)).first()
+    return row._asdict() if row is not None else None
+
+
+def _write_copy(name, values, create=True):
+    # A session of its own: copies share their home row's ID, which must not
+    # meet the home row in db.session's identity map.
+    with Session(bind=db.engines[name]) as session:
+        if not create and session.get(Artist, values['id']) is None:
+            return False
+        session.merge(Artist(**values))
+        session.commit()
+    return True
+
+
+def copy_artist(artist_id, name):
+    """
+    Make sure region ``name`` has a row for the artist, copied from its home region.
+
+    Args:
+        artist_id (int): The artist ID.
+        name (str): The region the artist is about to have a show in.
+
+    Returns:
+        bool: False if the artist does not exist in its home region.
+    """
+    if region_for_id(artist_id) == name:
+        # Already home; the show's foreign key checks that it exists.
+        return True
+    values = _home_artist(artist_id)
+    if values is None:
+        return False
+    return _write_copy(name, values)
+
+
+def sync_artist_copies(artist_id):
+    """
+    Copy an artist's current home row over its copies in the other regions.
+
+    Renames and new images reach those regions' show listings through the
+    usual flush hook.
+
+    Args:
+        artist_id (int): The artist ID.
+    """
+    if not enabled():
+        return
+    home = region_for_id(artist_id)
+    values = _home_artist(artist_id)
+    if values is None:
+        return
+    for name in regions():
+        if name != home:
+            _write_copy(name, values, create=False)
+
+
+#----------------------------------------------------------------------------#
+# Setup.
+#----------------------------------------------------------------------------#
+
+def assign_id_blocks():
+    """
+    Point each region's ID sequences at that region's block.
+
+    Safe to run again; a sequence never moves backwards.
+
+    Returns:
+        dict: The first ID each region will hand out next, by region
+        (None for the default database) and table.
+    """
+    next_ids = {}
+    for name in regions():
+        number = _map().numbers.get(name, 0)
+        first, last = max(number * ID_BLOCK, 1), (number + 1) * ID_BLOCK - 1
+        with db.engines[name].begin() as connection:
+            for table in SEQUENCE_TABLES:
+                sequence = connection.scalar(
+                    text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table})
+                used = connection.scalar(text(f'SELECT max(id) FROM {table}')) or 0
+                issued = connection.execute(
+                    text(f'SELECT last_value, is_called FROM {sequence}')).one()
+                next_id = max(first, used + 1, issued.last_value + issued.is_called)
+                if next_id > last:
+                    raise ValueError(f'{table} in region {name or "default"} has IDs past its block')
+                connection.execute(text(
+                    f'ALTER SEQUENCE {sequence} MINVALUE {first} MAXVALUE {last} '
+                    f'START WITH {first} RESTART WITH {next_id}'))
+                next_ids[(name, table)] = next_id
+    return next_ids
+
+
+def init_app(app):
+    """
+    Register the region shards as Flask-SQLAlchemy binds.
+
+    Must be called before ``db.init_app(app)`` so the binds get engines.
+
+    Args:
+        app (Flask): The application being configured.
+
+    Raises:
+        ValueError: If two shards share a number or a state.
+    """
+    shards = app.config['SHARDS']
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for name, shard in shards.items():
+        binds.setdefault(name, shard['url'])
+    app.extensions['shards'] = ShardMap(shards, app.config['SHARD_SCATTER_THREADS'])
@@ -0,0 +1,218 @@
+"""
+Shared fixtures for the Fyyur test suite.
+
+The tests run against the Postgres database named by TEST_DATABASE_URL (the
+schema uses ARRAY, BIT and partitioned tables, so SQLite will not do). Its
+tables are dropped and recreated once per session and reseeded before each
+test that uses the ``client`` or ``seed`` fixture. Tests needing the
+database are skipped when it cannot be reached.
+
+Route timings can be saved as a baseline and checked against later runs:
+
+    pytest --save-timings=timings.json
+    pytest --compare-timings=timings.json [--timing-tolerance=2.0]
+"""
+
+import json
+import os
+from datetime import datetime, time, timedelta
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from app import create_app
+from cache import bump_catalog_version, dashboard_cache, entity_cache, search_cache
+from models import Artist, Availability, Show, Venue, db
+from thumbnails import failed_sources
+
+TABLES = ('jobs', 'availability', 'show_listings', 'shows', 'artists', 'venues')
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('fyyur timings')
+    group.addoption('--save-timings', metavar='PATH',
+                    help='Write the median time of each route benchmark to PATH.')
+    group.addoption('--compare-timings', metavar='PATH',
+                    help='Fail route benchmarks slower than the baseline in PATH.')
+    group.addoption('--timing-tolerance', type=float, default=2.0,
+                    help='Allowed slowdown against the baseline (default 2.0x).')
+
+
+#----------------------------------------------------------------------------#
+# Application and database.
+#----------------------------------------------------------------------------#
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    application = create_app('testing')
+    application.config['THUMBNAIL_DIR'] = str(tmp_path_factory.mktemp('thumbnails'))
+    with application.app_context():
+        try:
+            db.session.execute(text('SELECT 1'))
+        except OperationalError as exc:
+            pytest.skip(f'Test database unavailable: {exc.orig}')
+        db.drop_all()
+        db.create_all()
+        yield application
+        db.session.remove()
+
+
+@pytest.fixture
+def seed(app):
+    """
+    Reset the database to the standard fixture data.
+
+    Returns:
+        dict: Lists of the seeded ``venues``, ``artists``, ``shows`` and
+        ``availability`` IDs.
+    """
+    db.session.remove()
+    db.session.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+    db.session.commit()
+    ids = seed_catalog(venues=6, artists=6, shows_per_venue=7)
+    for cache in (dashboard_cache, search_cache, entity_cache, failed_sources):
+        cache.clear()
+    bump_catalog_version()
+    return ids
+
+
+def seed_catalog(venues, artists, shows_per_venue):
+    """
+    Add venues in two cities, artists with a weekly schedule, and shows.
+
+    Each venue gets ``shows_per_venue`` shows, the first half in the past
+    and the rest upcoming, spread over the artists.
+
+    Returns:
+        dict: Lists of the new ``venues``, ``artists``, ``shows`` and
+        ``availability`` IDs.
+    """
+    cities = [('San Francisco', 'CA'), ('New York', 'NY')]
+    genres = [['Jazz', 'Folk'], ['Rock n Roll'], ['Classical', 'Jazz']]
+
+    new_venues = [
+        Venue(name=f'Venue {i}', city=cities[i % 2][0], state=cities[i % 2][1],
+              address=f'{i} Main St', phone='555-555-5555', genres=genres[i % 3],
+              image_link=f'http://images.invalid/venue-{i}.jpg',
+              seeking_talent=bool(i % 2), seeking_description='Looking for bands')
+        for i in range(venues)
+    ]
+    new_artists = [
+        Artist(name=f'Artist {i}', city=cities[i % 2][0], state=cities[i % 2][1],
+               phone='555-555-5555', genres=genres[i % 3],
+               image_link=f'http://images.invalid/artist-{i}.jpg',
+               seeking_venue=bool(i % 2), seeking_description='Looking for gigs')
+        for i in range(artists)
+    ]
+    db.session.add_all(new_venues + new_artists)
+    db.session.flush()
+
+    now = datetime.now().replace(hour=20, minute=0, second=0, microsecond=0)
+    new_shows = []
+    for v, venue in enumerate(new_venues):
+        for s in range(shows_per_venue):
+            offset = s - shows_per_venue // 2
+            new_shows.append(Show(venue_id=venue.id,
+                                  artist_id=new_artists[(v + s) % artists].id,
+                                  start_time=now + timedelta(days=offset * 3 + (offset >= 0))))
+    new_availability = [
+        Availability(artist_id=artist.id, day_of_week=day,
+                     start_time=time(18), end_time=time(23, 59))
+        for artist in new_artists for day in (4, 5)
+    ]
+    db.session.add_all(new_shows + new_availability)
+    db.session.flush()
+    ids = {
+        "venues": [venue.id for venue in new_venues],
+        "artists": [artist.id for artist in new_artists],
+        "shows": [show.id for show in new_shows],
+        "availability": [slot.id for slot in new_availability],
+    }
+    db.session.commit()
+    # Hold no transaction open while the routes run
+    db.session.remove()
+    return ids
+
+
+@pytest.fixture
+def add_rows(seed):
+    """Return ``seed_catalog``, to add rows on top of the standard data."""
+    return seed_catalog
+
+
+@pytest.fixture
+def client(app, seed):
+    return app.test_client()
+
+
+#----------------------------------------------------------------------------#
+# Measurements.
+#----------------------------------------------------------------------------#
+
+class QueryCounter:
+    """Collects the SQL statements an engine executes while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def report(self):
+        return '\n'.join(f'{n}: {sql.splitlines()[0][:120]}'
+                         for n, sql in enumerate(self.statements, start=1))
+
+
+@pytest.fixture
+def count_queries(app):
+    """Return a context manager counting the statements run inside it."""
+    return QueryCounter(db.engine)
+
+
+class Timings:
+    """Median route timings, saved to and compared against a JSON baseline."""
+
+    def __init__(self, baseline, tolerance):
+        self.baseline = baseline
+        self.tolerance = tolerance
+        self.results = {}
+
+    def record(self, name, seconds):
+        self.results[name] = seconds
+
+    def check(self, name, seconds):
+        """Fail if ``name`` got slower than the baseline allows (with 5 ms of slack)."""
+        expected = self.baseline.get(name)
+        if expected is not None and seconds > expected * self.tolerance + 0.005:
+            pytest.fail(f'{name} took {seconds * 1000:.1f} ms, baseline '
+                        f'{expected * 1000:.1f} ms (x{self.tolerance} allowed)')
+
+
+@pytest.fixture(scope='session')
+def timings(request):
+    compare = request.config.getoption('--compare-timings')
+    baseline = {}
+    if compare and os.path.exists(compare):
+        with open(compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    recorder = Timings(baseline, request.config.getoption('--timing-tolerance'))
+    yield recorder
+
+    save = request.config.getoption('--save-timings')
+    if save:
+        with open(save, 'w') as timings_file:
+            json.dump(dict(sorted(recorder.results.items())), timings_file, indent=2)
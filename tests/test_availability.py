@@ -0,0 +1,96 @@
+"""
+Saving availability slots and schedules, and the mask kept alongside them.
+"""
+
+import threading
+from datetime import time
+
+from sqlalchemy import delete, select
+
+from availability import Slot, current_schedule, replace_schedule, schedule_mask
+from models import Artist, Availability, db
+
+
+def test_concurrent_saves_run_one_after_the_other(app, seed):
+    artist_id = seed['artists'][0]
+    db.session.execute(delete(Availability).where(Availability.artist_id == artist_id))
+    db.session.commit()
+    first = {Slot(0, time(9), time(12))}
+    second = {Slot(0, time(10), time(13)), Slot(2, time(18), time(20))}
+
+    # The first save holds its transaction open while the second one runs.
+    replace_schedule(artist_id, first)
+
+    def save_second():
+        with app.app_context():
+            replace_schedule(artist_id, second)
+            db.session.commit()
+
+    thread = threading.Thread(target=save_second)
+    thread.start()
+    thread.join(0.5)
+    assert thread.is_alive(), 'the second save did not wait for the first'
+    db.session.commit()
+    thread.join(5)
+    db.session.remove()
+
+    assert set(current_schedule(artist_id)) == second
+    mask = db.session.scalar(select(Artist.availability_mask).where(Artist.id == artist_id))
+    assert mask == schedule_mask(second)
+    db.session.remove()
+
+
+def _mask(artist_id):
+    mask = db.session.scalar(select(Artist.availability_mask).where(Artist.id == artist_id))
+    db.session.remove()
+    return mask
+
+
+def test_concurrent_slot_writes_keep_the_mask_whole(app, seed):
+    artist_id = seed['artists'][0]
+    first, second = Slot(0, time(9), time(12)), Slot(1, time(9), time(12))
+    stored = set(current_schedule(artist_id))
+    db.session.remove()
+
+    # The first write's transaction is still open while the second one runs.
+    db.session.add(Availability(artist_id=artist_id, **first._asdict()))
+    db.session.flush()
+
+    def write_second():
+        with app.app_context():
+            db.session.add(Availability(artist_id=artist_id, **second._asdict()))
+            db.session.commit()
+
+    thread = threading.Thread(target=write_second)
+    thread.start()
+    thread.join(0.5)
+    db.session.commit()
+    thread.join(5)
+    db.session.remove()
+
+    assert _mask(artist_id) == schedule_mask(stored | {first, second})
+
+
+def test_concurrent_overlapping_slots_are_refused(app, client, seed):
+    artist_id = seed['artists'][0]
+    slot = {"artist_id": artist_id, "day_of_week": '0', "start_time": '09:00', "end_time": '12:00'}
+    responses = []
+
+    # A first save of the slot, holding the artist's lock until it commits.
+    db.session.execute(select(Artist.id).where(Artist.id == artist_id).with_for_update())
+    db.session.add(Availability(artist_id=artist_id, day_of_week=0,
+                                start_time=time(9), end_time=time(12)))
+    db.session.flush()
+
+    thread = threading.Thread(target=lambda: responses.append(client.post(
+        f'/artists/{artist_id}/availability/create', data=slot, follow_redirects=True)))
+    thread.start()
+    thread.join(0.5)
+    assert thread.is_alive(), 'the second save did not wait for the first'
+    db.session.commit()
+    thread.join(5)
+    db.session.remove()
+
+    assert 'overlaps existing availability' in responses[0].get_data(as_text=True)
+    assert len([s for s in current_schedule(artist_id) if s.day_of_week == 0]) == 1
+    db.session.remove()
@@ -0,0 +1,84 @@
+"""
+Response compression negotiated through Accept-Encoding.
+"""
+
+import gzip
+
+import pytest
+
+import compress
+
+
+def _decode(response):
+    data = b''.join(response.response) if response.is_streamed else response.data
+    if response.headers.get('Content-Encoding') == 'br':
+        return compress.brotli.decompress(data)
+    return gzip.decompress(data)
+
+
+@pytest.mark.parametrize('path', ['/shows', '/artists'])
+def test_pages_are_gzipped(client, path):
+    plain = client.get(path)
+    response = client.get(path, headers={'Accept-Encoding': 'gzip, deflate'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert len(response.data) < len(plain.data)
+    assert _decode(response) == plain.data
+
+
+@pytest.mark.skipif(compress.brotli is None, reason='brotli is not installed')
+def test_brotli_is_preferred_unless_ranked_lower(client):
+    assert client.get('/shows', headers={'Accept-Encoding': 'gzip, br'}
+                      ).headers['Content-Encoding'] == 'br'
+    assert client.get('/shows', headers={'Accept-Encoding': 'br;q=0.5, gzip'}
+                      ).headers['Content-Encoding'] == 'gzip'
+
+
+@pytest.mark.parametrize('accept', [None, 'identity', 'gzip;q=0'])
+def test_uncompressed_unless_accepted(client, accept):
+    headers = {'Accept-Encoding': accept} if accept else {}
+    response = client.get('/shows', headers=headers)
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_small_responses_are_not_compressed(client, app):
+    response = client.get('/healthz', headers={'Accept-Encoding': 'gzip'})
+    assert len(response.data) < app.config['COMPRESS_MIN_SIZE']
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_streamed_export_is_compressed(client):
+    plain = client.get('/export/shows.csv')
+    response = client.get('/export/shows.csv', headers={'Accept-Encoding': 'gzip'},
+                          buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert _decode(response) == plain.data
+
+
+def test_static_text_is_compressed_once(client):
+    compress.static_cache.clear()
+    hits = compress.static_cache.hits
+    path = '/static/css/bootstrap.css'
+    first = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    second = client.get(path, headers={'Accept-Encoding': 'gzip'})
+
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert first.data == second.data
+    assert compress.static_cache.hits == hits + 1
+    assert first.get_etag()[1], 'the ETag of a compressed body must be weak'
+
+    revalidated = client.get(path, headers={'Accept-Encoding': 'gzip',
+                                            'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+@pytest.mark.parametrize('path', ['/static/img/front-splash.jpg',
+                                  '/static/fonts/fontawesome-webfont.woff'])
+def test_compressed_formats_are_sent_as_is(client, path):
+    response = client.get(path, headers={'Accept-Encoding': 'gzip, br'})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    response.close()
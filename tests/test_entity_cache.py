@@ -0,0 +1,86 @@
+"""
+The venue and artist snapshot cache behind the detail pages.
+"""
+
+import pytest
+
+import cache
+import queries
+from cache import EntityCache, entity_cache
+from models import Artist, Venue
+
+
+def test_detail_page_reuses_the_snapshot(client, seed, count_queries):
+    venue_id = seed['venues'][0]
+    with count_queries as queries_run:
+        client.get(f'/venues/{venue_id}')
+    cold = queries_run.count
+    with count_queries as queries_run:
+        client.get(f'/venues/{venue_id}')
+
+    assert queries_run.count == cold - 1
+    assert not any('FROM venues' in sql for sql in queries_run.statements)
+
+
+def test_snapshots_are_immutable(app, seed):
+    snapshot = entity_cache.get(Artist, seed['artists'][0], queries.entity_snapshot)
+    assert isinstance(snapshot.genres, tuple)
+    with pytest.raises(AttributeError):
+        snapshot.name = 'Changed'
+    assert not hasattr(snapshot, 'availability_mask')
+
+
+def test_edit_invalidates_the_snapshot(client, seed):
+    artist_id = seed['artists'][0]
+    client.get(f'/artists/{artist_id}')
+    client.post(f'/artists/{artist_id}/edit', data={
+        "name": 'Renamed Artist', "city": 'New York', "state": 'NY',
+        "phone": '555-555-5555', "genres": ['Jazz']})
+
+    assert 'Renamed Artist' in client.get(f'/artists/{artist_id}').get_data(as_text=True)
+
+
+def test_other_workers_changes_drop_the_snapshot(app, seed):
+    venue_id = seed['venues'][0]
+    entity_cache.get(Venue, venue_id, queries.entity_snapshot)
+    cache.invalidate('venues', [venue_id])
+    misses = entity_cache.misses
+    entity_cache.get(Venue, venue_id, queries.entity_snapshot)
+    assert entity_cache.misses == misses + 1
+
+
+def test_missing_rows_are_not_found(client):
+    assert client.get('/venues/999999').status_code == 404
+    assert client.get('/artists/999999/edit').status_code == 404
+    assert client.get('/venues/999999/past-shows').status_code == 404
+    assert client.get('/artists/999999/past-shows').status_code == 404
+
+
+def test_past_shows_of_a_venue_without_any_are_found(client, seed):
+    assert client.get(f"/venues/{seed['venues'][0]}/past-shows?before=2000-01-01T00:00:00"
+                      '&before_id=1').status_code == 200
+
+
+class _Model:
+    __tablename__ = 'things'
+
+
+def test_memory_bound_evicts_least_recently_used():
+    things = EntityCache('things', maxbytes=2000)
+    for obj_id in range(50):
+        things.get(_Model, obj_id, lambda model, obj_id: ('x' * 100, obj_id))
+    stats = things.stats()
+    assert 0 < stats['bytes'] <= 2000
+    assert stats['size'] < 50
+    assert things.get(_Model, 49, lambda *args: None) is not None
+
+
+def test_snapshot_loaded_during_a_write_is_not_stored():
+    things = EntityCache('things')
+
+    def racing_loader(model, obj_id):
+        things.invalidate('things', [obj_id])
+        return ('stale',)
+
+    assert things.get(_Model, 1, racing_loader) == ('stale',)
+    assert things.get(_Model, 1, lambda model, obj_id: ('fresh',)) == ('fresh',)
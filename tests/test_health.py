@@ -0,0 +1,41 @@
+"""
+The /healthz and /readyz probes.
+"""
+
+import time
+
+from sqlalchemy import create_engine
+
+import health
+from config import TestingConfig
+
+
+def test_ready(client, seed):
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.json['checks']['database']['ok']
+
+
+def test_database_check_does_not_wait_for_the_pool(app):
+    engine = create_engine(TestingConfig.SQLALCHEMY_DATABASE_URI,
+                           pool_size=1, max_overflow=0, pool_timeout=10)
+    try:
+        with engine.connect():
+            started = time.perf_counter()
+            result = health.check_database(engine, 0.2)
+            assert time.perf_counter() - started < 1
+        assert not result['ok']
+        assert 'no answer' in result['error']
+    finally:
+        engine.dispose()
+
+
+def test_pool_saturation_counts_configured_overflow(app):
+    engine = create_engine(TestingConfig.SQLALCHEMY_DATABASE_URI, pool_size=2, max_overflow=2)
+    try:
+        with engine.connect(), engine.connect():
+            status = health.pool_status(engine.pool, 2)
+        assert status['checked_out'] == 2
+        assert status['saturation'] == 0.5
+    finally:
+        engine.dispose()
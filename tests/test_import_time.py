@@ -0,0 +1,60 @@
+"""
+Import-time budget for the app and CLI modules.
+
+``flask db upgrade``, ``flask worker`` and one-off scripts import these
+modules without serving pages, so libraries only the pages or the image
+route need must stay out of the import, and the whole import must stay
+fast. Measured with ``python -X importtime`` in a fresh interpreter, and
+compared with the time Flask itself took in the same import, so that a
+slow or busy machine does not fail the budget.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import time as a multiple of importing flask; about twice the ratio
+# measured on a development machine (3.5 to 3.7), so only a real regression
+# (a heavy new import) fails.
+BUDGETS = {'cli': 8, 'app': 8}
+
+# Imported on first use only.
+LAZY_MODULES = {'dateutil', 'flask_moment', 'PIL'}
+
+
+def import_times(module):
+    """
+    Import ``module`` in a fresh interpreter under ``-X importtime``.
+
+    Returns:
+        dict: Cumulative import time in seconds of each imported module.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+@pytest.mark.parametrize('module', sorted(BUDGETS))
+def test_import_stays_within_budget(module):
+    times = import_times(module)
+    ratio = times[module] / times['flask']
+    assert ratio <= BUDGETS[module], (
+        f'import {module} took {times[module]:.2f}s, {ratio:.1f} times flask '
+        f'({times["flask"]:.2f}s; budget {BUDGETS[module]} times)')
+
+
+@pytest.mark.parametrize('module', sorted(BUDGETS))
+def test_page_only_libraries_are_imported_lazily(module):
+    imported = {name.split('.')[0] for name in import_times(module)}
+    assert not LAZY_MODULES & imported
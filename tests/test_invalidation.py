@@ -0,0 +1,102 @@
+"""
+Cross-worker cache invalidation through Postgres LISTEN/NOTIFY.
+"""
+
+import json
+import select
+import time
+
+import pytest
+from sqlalchemy import text
+
+import invalidation
+from cache import catalog_version
+from models import Venue, db
+
+
+@pytest.fixture
+def listening(app):
+    """A raw connection LISTENing on the change channel; returns a receiver."""
+    proxied = db.engine.raw_connection()
+    connection = proxied.dbapi_connection
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f'LISTEN {invalidation.CHANNEL}')
+
+    def receive(timeout=2.0):
+        select.select([connection], [], [], timeout)
+        connection.poll()
+        messages = [json.loads(n.payload) for n in connection.notifies]
+        connection.notifies.clear()
+        return messages
+
+    yield receive
+    with connection.cursor() as cursor:
+        cursor.execute('UNLISTEN *')
+    connection.autocommit = False
+    proxied.close()
+
+
+@pytest.fixture
+def listener(app):
+    running = invalidation.start_listener(app)
+    assert running.listening.wait(5)
+    yield running
+    running.stop()
+    app.extensions.pop('invalidation', None)
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _notify_from_elsewhere(payload):
+    with db.engine.begin() as connection:
+        connection.execute(text('SELECT pg_notify(:channel, :payload)'),
+                           {"channel": invalidation.CHANNEL, "payload": json.dumps(payload)})
+
+
+def test_commit_notifies_changed_rows(client, seed, listening):
+    venue_id = seed['venues'][0]
+    client.post(f'/venues/{venue_id}/edit', data={
+        "name": 'Renamed Hall', "city": 'San Francisco', "state": 'CA',
+        "address": '1 Main St', "phone": '555-555-5555', "genres": ['Jazz']})
+
+    messages = listening()
+    assert [(m['table'], m['ids']) for m in messages] == [('venues', [venue_id])]
+    assert messages[0]['origin'] == invalidation.origin()
+
+
+def test_rollback_notifies_nothing(client, seed, listening):
+    db.session.get(Venue, seed['venues'][0]).name = 'Never Saved'
+    db.session.flush()
+    db.session.rollback()
+    db.session.remove()
+    assert listening(timeout=0.2) == []
+
+
+def test_other_workers_changes_evict_caches(client, listener):
+    before = catalog_version()
+    _notify_from_elsewhere({"origin": 'elsewhere:1', "table": 'shows', "ids": [1]})
+    assert _wait_for(lambda: catalog_version() != before)
+
+
+def test_own_notifications_are_skipped(client, listener):
+    before = catalog_version()
+    assert not invalidation.handle(json.dumps(
+        {"origin": invalidation.origin(), "table": 'shows', "ids": [1]}))
+    assert not invalidation.handle('not json')
+    assert catalog_version() == before
+
+
+def test_notifications_are_split_under_the_payload_limit():
+    ids = range(1, 2 * invalidation.IDS_PER_NOTIFICATION + 2)
+    payloads = list(invalidation._payloads('shows', ids))
+    assert len(payloads) == 3
+    assert all(len(payload) < 8000 for payload in payloads)
+    assert sum(len(json.loads(payload)['ids']) for payload in payloads) == len(ids)
@@ -0,0 +1,30 @@
+"""
+Venue deletion through the background job queue.
+"""
+
+from sqlalchemy.exc import OperationalError
+
+import jobs
+
+
+def test_delete_answers_with_the_job_and_leaves_no_flash(client, seed):
+    response = client.delete(f"/venues/{seed['venues'][0]}")
+
+    assert response.status_code == 202
+    assert response.json['kind'] == 'delete_venue'
+    assert response.headers['Location'] == f"/jobs/{response.json['id']}"
+    with client.session_transaction() as session:
+        assert '_flashes' not in session
+
+
+def test_delete_that_cannot_be_queued_is_a_json_error(client, seed, monkeypatch):
+    def fail(kind, **payload):
+        raise OperationalError('INSERT INTO jobs', {}, Exception('database is down'))
+
+    monkeypatch.setattr(jobs, 'enqueue', fail)
+    response = client.delete(f"/venues/{seed['venues'][0]}")
+
+    assert response.status_code == 500
+    assert response.json == {"error": f"Venue {seed['venues'][0]} could not be deleted."}
+    with client.session_transaction() as session:
+        assert '_flashes' not in session
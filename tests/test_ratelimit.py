@@ -0,0 +1,48 @@
+"""
+Token-bucket rate limiting, with the limiter switched on for the test app.
+"""
+
+import time
+
+import pytest
+
+from ratelimit import MemoryBackend, SQLiteBackend
+
+
+@pytest.fixture
+def limited(app, monkeypatch):
+    """Limit venue searches to a burst of two, refilled at one per 30 seconds."""
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATE_LIMITS', {'main.search_venues': (2, 60)})
+    monkeypatch.setitem(app.extensions, 'ratelimit', MemoryBackend())
+
+
+def test_request_after_the_burst_is_refused(client, seed, limited):
+    for _ in range(2):
+        assert client.post('/venues/search', data={"search_term": 'venue'}).status_code == 200
+    response = client.post('/venues/search', data={"search_term": 'venue'})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    # Other routes and clients have buckets of their own
+    assert client.get('/venues').status_code == 200
+    assert client.post('/venues/search', data={"search_term": 'venue'},
+                       environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+
+
+def test_tokens_refill_over_time():
+    backend = MemoryBackend()
+    assert backend.take('client', 1, 20) == 0
+    assert 0 < backend.take('client', 1, 20) <= 0.05
+    time.sleep(0.06)
+    assert backend.take('client', 1, 20) == 0
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    path = str(tmp_path / 'ratelimit.sqlite3')
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+
+    assert first.take('client', 2, 1 / 60) == 0
+    assert second.take('client', 2, 1 / 60) == 0
+    assert first.take('client', 2, 1 / 60) > 0
+    assert second.take('other', 2, 1 / 60) == 0
@@ -0,0 +1,205 @@
+"""
+Per-route benchmarks with SQL statement budgets.
+
+Every route is requested against the seeded database with cold caches.
+The number of SQL statements it runs must stay within its budget, and the
+median time over a few runs is recorded (see conftest.py for saving and
+comparing timing baselines). A new N+1 query or a lost cache shows up here
+as a failed budget.
+"""
+
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import pytest
+
+from cache import bump_catalog_version, dashboard_cache, entity_cache, search_cache
+
+VENUE_FORM = {
+    'name': 'The Benchmark Room', 'city': 'San Francisco', 'state': 'CA',
+    'address': '1 Test St', 'phone': '555-555-5555', 'genres': ['Jazz'],
+    'image_link': 'http://images.invalid/new.jpg', 'facebook_link': '',
+    'website_link': '', 'seeking_talent': 'y', 'seeking_description': 'Bands',
+}
+ARTIST_FORM = {
+    'name': 'The Benchmarks', 'city': 'New York', 'state': 'NY',
+    'phone': '555-555-5555', 'genres': ['Jazz', 'Folk'],
+    'image_link': 'http://images.invalid/new.jpg', 'facebook_link': '',
+    'website_link': '', 'seeking_venue': 'y', 'seeking_description': 'Gigs',
+}
+
+
+# A new show's start, always in the future and within the show partitions
+SHOW_START = (datetime.now() + timedelta(days=30)).replace(hour=21, minute=0, second=0,
+                                                          microsecond=0)
+
+
+class Route(NamedTuple):
+    """A request to benchmark and the most SQL statements it may run."""
+
+    name: str
+    method: str
+    path: str
+    budget: int
+    status: int = 200
+    data: dict = None
+    json: dict = None
+    # Write routes change what the next run would do, so they run once.
+    repeat: int = 5
+
+
+ROUTES = [
+    # Home and listings
+    Route('home', 'GET', '/', budget=4),
+    Route('venues', 'GET', '/venues', budget=1),
+    Route('artists', 'GET', '/artists', budget=1),
+    Route('shows', 'GET', '/shows', budget=1),
+    # Search
+    Route('search_venues', 'POST', '/venues/search', budget=1,
+          data={'search_term': 'venue'}),
+    Route('search_artists', 'POST', '/artists/search', budget=1,
+          data={'search_term': 'artist'}),
+    Route('advanced_search_venues', 'POST', '/venues/advanced-search', budget=1,
+          data={'search_term': 'city:san francisco state:CA genre:jazz'}),
+    Route('advanced_search_artists', 'POST', '/artists/advanced-search', budget=1,
+          data={'search_term': 'New York, NY'}),
+    Route('venue_open_dates', 'GET',
+          '/venues/open-dates?city=San+Francisco&state=CA&genre=Jazz', budget=1),
+    # Detail pages
+    Route('show_venue', 'GET', '/venues/{venue}', budget=4),
+    Route('venue_past_shows', 'GET', '/venues/{venue}/past-shows', budget=1),
+    Route('show_artist', 'GET', '/artists/{artist}', budget=4),
+    Route('artist_past_shows', 'GET', '/artists/{artist}/past-shows', budget=1),
+    Route('artist_availability', 'GET', '/artists/{artist}/availability', budget=2),
+    # Forms
+    Route('create_venue_form', 'GET', '/venues/create', budget=0),
+    Route('create_artist_form', 'GET', '/artists/create', budget=0),
+    Route('create_show_form', 'GET', '/shows/create', budget=0),
+    Route('edit_venue', 'GET', '/venues/{venue}/edit', budget=1),
+    Route('edit_artist', 'GET', '/artists/{artist}/edit', budget=1),
+    # Writes; each catalog write also sends one NOTIFY (see invalidation.py)
+    Route('create_venue_submission', 'POST', '/venues/create', budget=2,
+          data=VENUE_FORM, repeat=1),
+    Route('edit_venue_submission', 'POST', '/venues/{venue}/edit', budget=4,
+          status=302, data=VENUE_FORM, repeat=1),
+    Route('delete_venue', 'DELETE', '/venues/{venue}', budget=2, status=202, repeat=1),
+    Route('create_artist_submission', 'POST', '/artists/create', budget=2,
+          data=ARTIST_FORM, repeat=1),
+    Route('edit_artist_submission', 'POST', '/artists/{artist}/edit', budget=4,
+          status=302, data=ARTIST_FORM, repeat=1),
+    Route('create_show_submission', 'POST', '/shows/create', budget=4,
+          data={'artist_id': '{artist}', 'venue_id': '{venue}',
+                'start_time': str(SHOW_START)}, repeat=1),
+    # Single-slot writes lock the artist before its mask is recomputed
+    Route('create_artist_availability', 'POST', '/artists/{artist}/availability/create',
+          budget=5, status=302, repeat=1,
+          data={'artist_id': '{artist}', 'day_of_week': '0',
+                'start_time': '09:00', 'end_time': '12:00'}),
+    # One more for locking the artist row while its schedule is replaced
+    Route('replace_artist_availability', 'PUT', '/artists/{artist}/availability/week',
+          budget=6, repeat=1,
+          json={'slots': [{'day_of_week': 4, 'start_time': '18:00', 'end_time': '23:59'},
+                          {'day_of_week': 6, 'start_time': '12:00', 'end_time': '16:00'}]}),
+    Route('delete_artist_availability', 'POST',
+          '/artists/{artist}/availability/{availability}/delete',
+          budget=5, status=302, repeat=1),
+    # Operations
+    Route('job_status', 'GET', '/jobs/{job}', budget=1),
+    Route('export_shows', 'GET', '/export/shows.csv', budget=1),
+    Route('healthz', 'GET', '/healthz', budget=0),
+    Route('readyz', 'GET', '/readyz', budget=2),
+]
+
+
+def _fill(value, ids):
+    if isinstance(value, str):
+        return value.format(**ids)
+    if isinstance(value, dict):
+        return {key: _fill(item, ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, ids) for item in value]
+    return value
+
+
+def _cold_caches():
+    for cache in (dashboard_cache, search_cache, entity_cache):
+        cache.clear()
+    bump_catalog_version()
+
+
+def _request(client, route, ids):
+    return client.open(_fill(route.path, ids), method=route.method,
+                       data=_fill(route.data, ids), json=_fill(route.json, ids))
+
+
+@pytest.fixture
+def route_ids(client, seed):
+    """Format values for the route paths: the first seeded venue, artist, slot and a job."""
+    client.delete(f"/venues/{seed['venues'][-1]}")
+    return {
+        "venue": seed['venues'][0],
+        "artist": seed['artists'][0],
+        "availability": seed['availability'][0],
+        "job": 1,
+    }
+
+
+@pytest.mark.parametrize('route', ROUTES, ids=[route.name for route in ROUTES])
+def test_route_budget(client, route_ids, count_queries, timings, route):
+    _cold_caches()
+    with count_queries as queries:
+        response = _request(client, route, route_ids)
+        response.get_data()
+    assert response.status_code == route.status
+    assert queries.count <= route.budget, (
+        f'{route.name} ran {queries.count} statements (budget {route.budget}):\n'
+        f'{queries.report()}')
+
+    durations = []
+    for _ in range(route.repeat):
+        _cold_caches()
+        started = time.perf_counter()
+        _request(client, route, route_ids).get_data()
+        durations.append(time.perf_counter() - started)
+    median = statistics.median(durations)
+    timings.record(route.name, median)
+    timings.check(route.name, median)
+
+
+def test_every_route_is_benchmarked(app):
+    benchmarked = {route.path.split('?')[0] for route in ROUTES}
+    rules = {rule.rule for rule in app.url_map.iter_rules()
+             if rule.endpoint.startswith('main.') and rule.endpoint != 'main.thumbnail'}
+    normalized = {
+        rule.replace('<int:venue_id>', '{venue}').replace('<int:artist_id>', '{artist}')
+            .replace('<int:availability_id>', '{availability}')
+            .replace('<int:job_id>', '{job}')
+            .replace('<any(venues, artists, shows):entity>.<any(csv, ndjson):fmt>', 'shows.csv')
+        for rule in rules
+    }
+    assert normalized <= benchmarked, f'Routes without a benchmark: {normalized - benchmarked}'
+
+
+# Listing routes whose statement count must not depend on how many rows they show.
+LISTINGS = ['home', 'venues', 'artists', 'shows', 'search_venues', 'search_artists',
+            'advanced_search_venues', 'venue_open_dates', 'show_venue', 'show_artist',
+            'export_shows']
+
+
+@pytest.mark.parametrize('name', LISTINGS)
+def test_listing_queries_do_not_grow_with_rows(client, route_ids, count_queries, add_rows, name):
+    route = next(route for route in ROUTES if route.name == name)
+    _cold_caches()
+    with count_queries as before:
+        _request(client, route, route_ids).get_data()
+
+    add_rows(venues=20, artists=20, shows_per_venue=10)
+    _cold_caches()
+    with count_queries as after:
+        _request(client, route, route_ids).get_data()
+
+    assert after.count == before.count, (
+        f'{name}: {before.count} statements before adding rows, {after.count} after:\n'
+        f'{after.report()}')
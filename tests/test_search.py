@@ -0,0 +1,55 @@
+"""
+The venue and artist name searches and their result cache.
+"""
+
+from cache import normalize_term, search_cache
+from models import Venue, db
+
+
+def _search(client, term):
+    page = client.post('/venues/search', data={"search_term": term})
+    return page.get_data(as_text=True)
+
+
+def test_term_keeps_its_punctuation(client, seed):
+    db.session.get(Venue, seed['venues'][0]).name = 'Smith, Jones & Co'
+    db.session.commit()
+
+    assert 'Smith, Jones &amp; Co' in _search(client, 'smith, jones')
+    assert 'Smith, Jones &amp; Co' not in _search(client, 'smith,jones')
+
+
+def test_case_and_spacing_share_a_cache_entry(client, seed, monkeypatch):
+    monkeypatch.setattr('app.search_time_bucket', lambda: 0)
+    db.session.get(Venue, seed['venues'][0]).name = 'Smith, Jones & Co'
+    db.session.commit()
+
+    _search(client, 'smith, jones')
+    hits = search_cache.hits
+    assert 'Smith, Jones &amp; Co' in _search(client, '  SMITH,   Jones ')
+    assert search_cache.hits == hits + 1
+
+
+def test_normalized_terms():
+    assert normalize_term('  Jazz\tCLUB ') == normalize_term('jazz club')
+    assert normalize_term('smith, jones') != normalize_term('jones, smith')
+    # casefold() and ILIKE disagree on 'ß', so it keeps an entry of its own
+    assert normalize_term('Straße') != normalize_term('STRASSE')
+
+
+def test_upcoming_counts_are_recomputed_every_minute(client, seed, monkeypatch):
+    monkeypatch.setattr('app.search_time_bucket', lambda: 0)
+    _search(client, 'venue')
+    misses = search_cache.misses
+    monkeypatch.setattr('app.search_time_bucket', lambda: 1)
+    _search(client, 'venue')
+    assert search_cache.misses == misses + 1
+
+
+def test_city_facet_matches_like_sql_lower(client, seed):
+    venue = db.session.get(Venue, seed['venues'][0])
+    venue.name, venue.city = 'Hafenbar', 'Straße'
+    db.session.commit()
+
+    page = client.post('/venues/advanced-search', data={"search_term": 'city:STRAßE'})
+    assert 'Hafenbar' in page.get_data(as_text=True)
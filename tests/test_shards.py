@@ -0,0 +1,209 @@
+"""
+Region shards, with three local Postgres databases: the default one, west
+(CA) and east (NY). They are created next to TEST_DATABASE_URL's database;
+the tests are skipped if that is not allowed.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+import queries
+import shards
+from app import create_app
+from cache import bump_catalog_version, dashboard_cache, entity_cache, search_cache
+from config import TestingConfig
+from models import Artist, Venue, db
+
+REGIONS = {
+    'west': {'number': 1, 'states': ['CA']},
+    'east': {'number': 2, 'states': ['NY']},
+}
+
+
+def _create_databases(base, urls):
+    engine = create_engine(base, isolation_level='AUTOCOMMIT')
+    try:
+        with engine.connect() as connection:
+            for url in urls:
+                exists = connection.scalar(text('SELECT 1 FROM pg_database WHERE datname = :name'),
+                                           {"name": url.database})
+                if not exists:
+                    connection.execute(text(f'CREATE DATABASE "{url.database}"'))
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture(scope='module')
+def sharded_app(tmp_path_factory):
+    base = make_url(TestingConfig.SQLALCHEMY_DATABASE_URI)
+    urls = {name: base.set(database=f'{base.database}_{name}')
+            for name in ('default', *REGIONS)}
+    try:
+        _create_databases(base, urls.values())
+    except (OperationalError, ProgrammingError) as exc:
+        pytest.skip(f'Cannot create the region databases: {exc.orig}')
+
+    def url(name):
+        return urls[name].render_as_string(hide_password=False)
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', url('default'))
+        patch.setattr(TestingConfig, 'SHARDS',
+                      {name: {**shard, 'url': url(name)} for name, shard in REGIONS.items()})
+        application = create_app('testing')
+    application.config['THUMBNAIL_DIR'] = str(tmp_path_factory.mktemp('thumbnails'))
+    with application.app_context():
+        for name in shards.regions():
+            db.metadata.drop_all(db.engines[name])
+            db.metadata.create_all(db.engines[name])
+        shards.assign_id_blocks()
+        yield application
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def _add(obj):
+    with shards.region(shards.region_for_state(obj.state)):
+        db.session.add(obj)
+        db.session.commit()
+        obj_id = obj.id
+    db.session.remove()
+    return obj_id
+
+
+def _venue(name, city, state):
+    return _add(Venue(name=name, city=city, state=state, address='1 Main St',
+                      phone='555-555-5555', genres=['Jazz'], seeking_talent=False))
+
+
+def _artist(name, city, state, genres):
+    return _add(Artist(name=name, city=city, state=state, phone='555-555-5555',
+                       genres=genres, seeking_venue=False))
+
+
+@pytest.fixture
+def catalog(sharded_app):
+    """Empty every region; add a venue per region and two artists."""
+    db.session.remove()
+    for name in shards.regions():
+        with db.engines[name].begin() as connection:
+            connection.execute(text('TRUNCATE jobs, availability, show_listings, shows, '
+                                    'artists, venues CASCADE'))
+    for cache in (dashboard_cache, search_cache, entity_cache):
+        cache.clear()
+    bump_catalog_version()
+    return {
+        "bay_hall": _venue('Bay Hall', 'San Francisco', 'CA'),
+        "harbor_room": _venue('Harbor Room', 'New York', 'NY'),
+        "lone_star": _venue('Lone Star', 'Austin', 'TX'),
+        "coast_trio": _artist('Coast Trio', 'San Francisco', 'CA', ['Jazz']),
+        "subway_band": _artist('Subway Band', 'New York', 'NY', ['Rock n Roll']),
+    }
+
+
+@pytest.fixture
+def sharded_client(sharded_app, catalog):
+    return sharded_app.test_client()
+
+
+def _add_show(client, artist_id, venue_id, days):
+    start = (datetime.now() + timedelta(days=days)).replace(microsecond=0)
+    response = client.post('/shows/create', data={
+        "artist_id": artist_id, "venue_id": venue_id, "start_time": str(start)})
+    assert 'Show was successfully listed!' in response.get_data(as_text=True)
+
+
+def _count(region, model, obj_id):
+    with db.engines[region].connect() as connection:
+        return connection.scalar(select(func.count()).select_from(model)
+                                 .where(model.id == obj_id))
+
+
+def test_rows_go_to_their_state_region(catalog):
+    assert shards.region_for_id(catalog['bay_hall']) == 'west'
+    assert shards.region_for_id(catalog['harbor_room']) == 'east'
+    assert shards.region_for_id(catalog['lone_star']) is None
+    assert shards.region_for_id(catalog['subway_band']) == 'east'
+    assert _count('west', Venue, catalog['bay_hall']) == 1
+    assert _count('east', Venue, catalog['bay_hall']) == 0
+    assert _count(None, Venue, catalog['bay_hall']) == 0
+
+
+def test_show_copies_artist_into_venue_region(sharded_client, catalog):
+    _add_show(sharded_client, catalog['subway_band'], catalog['bay_hall'], days=3)
+
+    assert _count('west', Artist, catalog['subway_band']) == 1
+    page = sharded_client.get(f"/venues/{catalog['bay_hall']}").get_data(as_text=True)
+    assert 'Subway Band' in page
+
+
+def test_listings_merge_every_region(sharded_client, catalog):
+    _add_show(sharded_client, catalog['subway_band'], catalog['bay_hall'], days=5)
+    _add_show(sharded_client, catalog['coast_trio'], catalog['harbor_room'], days=2)
+    _add_show(sharded_client, catalog['subway_band'], catalog['harbor_room'], days=9)
+
+    artists = sharded_client.get('/artists').get_data(as_text=True)
+    assert artists.count('Subway Band') == 1
+    assert artists.index('Coast Trio') < artists.index('Subway Band')
+
+    shows = sharded_client.get('/shows').get_data(as_text=True)
+    assert shows.index('Harbor Room') < shows.index('Bay Hall')
+    assert shows.count('playing at') == 3
+
+    venues = sharded_client.get('/venues').get_data(as_text=True)
+    assert all(name in venues for name in ('Bay Hall', 'Harbor Room', 'Lone Star'))
+
+    export = sharded_client.get('/export/artists.csv').get_data(as_text=True)
+    assert export.count('Subway Band') == 1
+    assert 'Subway Band' in sharded_client.get('/').get_data(as_text=True)
+
+
+def test_artist_search_folds_copies(sharded_client, catalog):
+    _add_show(sharded_client, catalog['subway_band'], catalog['bay_hall'], days=4)
+    _add_show(sharded_client, catalog['subway_band'], catalog['harbor_room'], days=6)
+
+    page = sharded_client.post('/artists/search', data={"search_term": 'subway'})
+    assert '"subway": 1' in page.get_data(as_text=True)
+
+    rows = shards.gather(queries.artist_search, Artist.name.ilike('%subway%'),
+                         key=lambda row: (row.name, row.id))
+    merged = list(shards.merge_copies(rows, counts=('num_upcoming_shows',)))
+    assert [(row.name, row.num_upcoming_shows) for row in merged] == [('Subway Band', 2)]
+
+
+def test_artist_page_lists_shows_from_every_region(sharded_client, catalog):
+    _add_show(sharded_client, catalog['subway_band'], catalog['bay_hall'], days=1)
+    _add_show(sharded_client, catalog['subway_band'], catalog['harbor_room'], days=8)
+    _add_show(sharded_client, catalog['subway_band'], catalog['harbor_room'], days=-3)
+
+    page = sharded_client.get(f"/artists/{catalog['subway_band']}").get_data(as_text=True)
+    assert page.index('Bay Hall') < page.index('Harbor Room')
+    assert page.count('Harbor Room') == 2
+
+
+def test_artist_edit_reaches_copies(sharded_client, catalog):
+    _add_show(sharded_client, catalog['subway_band'], catalog['bay_hall'], days=2)
+    sharded_client.post(f"/artists/{catalog['subway_band']}/edit", data={
+        "name": 'Metro Band', "city": 'New York', "state": 'NY', "phone": '555-555-5555',
+        "genres": ['Rock n Roll']})
+
+    page = sharded_client.get(f"/venues/{catalog['bay_hall']}").get_data(as_text=True)
+    assert 'Metro Band' in page
+    assert 'Metro Band' in sharded_client.get('/shows').get_data(as_text=True)
+
+
+def test_move_to_another_region_is_refused(sharded_client, catalog):
+    venue_id = catalog['bay_hall']
+    response = sharded_client.post(f'/venues/{venue_id}/edit', data={
+        "name": 'Bay Hall', "city": 'Brooklyn', "state": 'NY', "address": '1 Main St',
+        "phone": '555-555-5555', "genres": ['Jazz']}, follow_redirects=True)
+
+    assert 'served by another region' in response.get_data(as_text=True)
+    with shards.region('west'):
+        assert db.session.get(Venue, venue_id).state == 'CA'
+    db.session.remove()
@@ -0,0 +1,29 @@
+"""
+Listing pages streamed from a server-side cursor.
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize('path, marker', [('/artists', 'Artist 5'), ('/shows', 'playing at')])
+def test_listing_is_streamed_in_chunks(client, app, path, marker):
+    app.config['STREAM_CHUNK_SIZE'], size = 256, app.config['STREAM_CHUNK_SIZE']
+    try:
+        response = client.get(path, buffered=False)
+        assert response.is_streamed
+        chunks = list(response.response)
+        response.close()
+    finally:
+        app.config['STREAM_CHUNK_SIZE'] = size
+
+    assert len(chunks) > 1
+    page = b''.join(chunks).decode()
+    assert marker in page
+    assert page.rstrip().endswith('</html>')
+
+
+def test_flashed_message_is_shown_once(client):
+    with client.session_transaction() as session:
+        session['_flashes'] = [('message', 'Listed once')]
+    assert 'Listed once' in client.get('/shows').get_data(as_text=True)
+    assert 'Listed once' not in client.get('/shows').get_data(as_text=True)
@@ -0,0 +1,230 @@
+"""
+The /img thumbnail route, with a local HTTP server as the image origin.
+"""
+
+import io
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+import thumbnails
+from models import Artist, Venue, db
+
+
+def _png(width, height, color=(200, 40, 40)):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(output, 'PNG')
+    return output.getvalue()
+
+
+class ImageOrigin:
+    """Serves fixed bodies or redirects by path and counts the requests for each."""
+
+    def __init__(self):
+        self.files = {}
+        self.redirects = {}
+        self.hits = {}
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                origin.hits[self.path] = origin.hits.get(self.path, 0) + 1
+                if self.path in origin.redirects:
+                    self.send_response(302)
+                    self.send_header('Location', origin.redirects[self.path])
+                    self.end_headers()
+                    return
+                body = origin.files.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+
+@pytest.fixture(scope='module')
+def origin():
+    server = ImageOrigin()
+    server.files['/wide.png'] = _png(1200, 800)
+    server.files['/copy.png'] = server.files['/wide.png']
+    server.files['/small.png'] = _png(100, 50)
+    server.files['/large.png'] = _png(1600, 1200, color=(20, 80, 200))
+    server.files['/broken.png'] = b'not an image'
+    server.files['/private.png'] = _png(100, 50)
+    server.redirects['/to-metadata.png'] = 'http://169.254.169.254/latest/meta-data/'
+    server.redirects['/to-ftp.png'] = 'ftp://127.0.0.1/image.png'
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def loopback_origin(app, monkeypatch):
+    """Thumbnails refuse loopback sources; allow the test origin's."""
+    monkeypatch.setitem(app.config, 'THUMBNAIL_ALLOWED_NETWORKS', ('127.0.0.1/32',))
+
+
+@pytest.fixture
+def artist_with_image(client, seed, origin):
+    """Point the first seeded artist's image at the origin; return a setter."""
+    artist_id = seed['artists'][0]
+
+    def set_image(path):
+        link = origin.url(path)
+        db.session.get(Artist, artist_id).image_link = link
+        db.session.commit()
+        return artist_id, link
+
+    return set_image
+
+
+def _thumbnail(client, kind, obj_id, link, width):
+    return client.get(f'/img/{kind}/{obj_id}/{width}?v={thumbnails.link_version(link)}')
+
+
+def test_resizes_and_caches_forever(client, artist_with_image, origin):
+    artist_id, link = artist_with_image('/wide.png')
+    response = _thumbnail(client, 'artist', artist_id, link, 320)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert response.cache_control.max_age == 365 * 24 * 3600
+    assert response.cache_control.immutable
+    with Image.open(io.BytesIO(response.data)) as image:
+        assert image.format == 'JPEG'
+        assert image.size == (320, 213)
+
+
+def test_source_is_fetched_once_for_every_width(client, artist_with_image, origin, app):
+    artist_id, link = artist_with_image('/wide.png')
+    before = origin.hits.get('/wide.png', 0)
+    for width in app.config['THUMBNAIL_SIZES']:
+        assert _thumbnail(client, 'artist', artist_id, link, width).status_code == 200
+    assert origin.hits.get('/wide.png', 0) - before <= 1
+
+
+def test_same_bytes_share_thumbnails(client, artist_with_image, origin, seed):
+    artist_id, link = artist_with_image('/wide.png')
+    _thumbnail(client, 'artist', artist_id, link, 160)
+
+    venue_id = seed['venues'][0]
+    copy = origin.url('/copy.png')
+    db.session.get(Venue, venue_id).image_link = copy
+    db.session.commit()
+    response = _thumbnail(client, 'venue', venue_id, copy, 160)
+
+    assert response.status_code == 200
+    assert response.get_etag()[0] == _thumbnail(client, 'artist', artist_id, link, 160).get_etag()[0]
+
+
+def test_never_upscales(client, artist_with_image):
+    artist_id, link = artist_with_image('/small.png')
+    response = _thumbnail(client, 'artist', artist_id, link, 640)
+    with Image.open(io.BytesIO(response.data)) as image:
+        assert image.size == (100, 50)
+
+
+def test_unversioned_url_is_cached_briefly(client, artist_with_image):
+    artist_id, link = artist_with_image('/wide.png')
+    response = client.get(f'/img/artist/{artist_id}/320')
+    assert response.status_code == 200
+    assert response.cache_control.max_age == 300
+    assert not response.cache_control.immutable
+
+
+@pytest.mark.parametrize('path', ['/missing.png', '/broken.png'])
+def test_bad_source_redirects_to_original(client, artist_with_image, path):
+    artist_id, link = artist_with_image(path)
+    response = _thumbnail(client, 'artist', artist_id, link, 320)
+    assert response.status_code == 302
+    assert response.location == link
+
+
+def test_undecodable_source_is_fetched_once(client, artist_with_image, origin):
+    artist_id, link = artist_with_image('/broken.png')
+    before = origin.hits.get('/broken.png', 0)
+    for _ in range(2):
+        assert _thumbnail(client, 'artist', artist_id, link, 320).status_code == 302
+    assert origin.hits['/broken.png'] - before == 1
+
+
+def test_oversized_source_is_refused(client, artist_with_image, app):
+    artist_id, link = artist_with_image('/large.png')
+    limit = app.config['THUMBNAIL_MAX_SOURCE_BYTES']
+    app.config['THUMBNAIL_MAX_SOURCE_BYTES'] = 1000
+    try:
+        response = _thumbnail(client, 'artist', artist_id, link, 320)
+    finally:
+        app.config['THUMBNAIL_MAX_SOURCE_BYTES'] = limit
+    assert response.status_code == 302
+
+
+def test_too_many_pixels_are_refused(client, artist_with_image, app, monkeypatch):
+    artist_id, link = artist_with_image('/large.png')
+    monkeypatch.setitem(app.config, 'THUMBNAIL_MAX_PIXELS', 1600 * 1200 - 1)
+    with app.test_request_context(), pytest.raises(thumbnails.ThumbnailError, match='pixels'):
+        thumbnails.get_thumbnail(link, 320)
+
+
+@pytest.mark.parametrize('url', ['/img/band/1/320', '/img/artist/1/333', '/img/artist/999/320'])
+def test_unknown_thumbnails_are_not_found(client, url):
+    assert client.get(url).status_code == 404
+
+
+def test_cache_files_are_content_addressed(client, artist_with_image, app):
+    artist_id, link = artist_with_image('/wide.png')
+    etag = _thumbnail(client, 'artist', artist_id, link, 640).get_etag()[0]
+    digest = etag.rsplit('-', 1)[0]
+    assert os.path.exists(os.path.join(app.config['THUMBNAIL_DIR'], 'objects',
+                                       digest[:2], f'{digest}-640.jpg'))
+
+
+@pytest.mark.parametrize('link', [
+    'http://169.254.169.254/latest/meta-data/',
+    'http://10.0.0.1/image.png',
+    'http://[::1]/image.png',
+    'http://localhost/image.png',
+    'file:///etc/passwd',
+])
+def test_private_and_non_http_sources_are_refused(app, monkeypatch, link):
+    monkeypatch.setitem(app.config, 'THUMBNAIL_ALLOWED_NETWORKS', ())
+    with app.test_request_context(), pytest.raises(thumbnails.UnsafeSourceError):
+        thumbnails.get_thumbnail(link, 320)
+
+
+def test_loopback_origin_is_refused_by_default(app, monkeypatch, seed, origin):
+    monkeypatch.setitem(app.config, 'THUMBNAIL_ALLOWED_NETWORKS', ())
+    with app.test_request_context(), pytest.raises(thumbnails.UnsafeSourceError):
+        thumbnails.get_thumbnail(origin.url('/private.png'), 320)
+    assert '/private.png' not in origin.hits
+
+
+@pytest.mark.parametrize('path', ['/to-metadata.png', '/to-ftp.png'])
+def test_redirects_are_checked(app, seed, origin, path):
+    with app.test_request_context(), pytest.raises(thumbnails.UnsafeSourceError):
+        thumbnails.get_thumbnail(origin.url(path), 320)
+
+
+@pytest.mark.parametrize('link', ['javascript:alert(1)', 'http://169.254.169.254/latest/meta-data/'])
+def test_refused_source_is_not_redirected_to(client, seed, link):
+    artist_id = seed['artists'][0]
+    db.session.get(Artist, artist_id).image_link = link
+    db.session.commit()
+
+    response = _thumbnail(client, 'artist', artist_id, link, 320)
+    assert response.status_code == 404
+    assert response.location is None
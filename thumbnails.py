@@ -0,0 +1,273 @@
+"""
+Resized copies of artist and venue images, served from a local disk cache.
+
+Listing tiles used to embed each ``image_link`` as-is, often a full-size
+original from an image host. ``/img/<kind>/<id>/<width>`` instead serves a
+JPEG re-encoded at one of ``THUMBNAIL_SIZES`` widths.
+
+The first request for an image downloads the source once and writes every
+width into a content-addressed cache::
+
+    THUMBNAIL_DIR/objects/<sha[:2]>/<sha>-<width>.jpg   sha = SHA-256 of the source
+    THUMBNAIL_DIR/urls/<sha of the URL>                 -> sha of its content
+
+so two URLs serving the same bytes share their thumbnails. Thumbnail URLs
+carry a short hash of the ``image_link`` (``?v=``), which changes when the
+link does, so responses can be cached by browsers as immutable.
+
+Image links are user input, so sources are only fetched over http(s) from
+public addresses: every connection, redirects included, checks the
+addresses it resolves to and the one it reaches, refusing private,
+loopback, link-local and reserved ones outside THUMBNAIL_ALLOWED_NETWORKS.
+Sources are fetched directly, never through an HTTP(S)_PROXY, so that the
+checks see the origin itself.
+"""
+
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.error import URLError
+from urllib.parse import urlsplit
+from urllib.request import (HTTPHandler, HTTPRedirectHandler, HTTPSHandler, ProxyHandler,
+                            Request, build_opener)
+
+from flask import current_app, url_for
+
+from cache import TTLCache
+
+JPEG_QUALITY = 82
+
+# Source URLs that recently failed, so a broken link is not refetched for
+# every tile that shows it.
+failed_sources = TTLCache('thumbnail-failures', maxsize=1024, ttl=300)
+
+
+class ThumbnailError(Exception):
+    """The source image could not be fetched or decoded."""
+
+
+class UnsafeSourceError(ThumbnailError):
+    """The source URL is not http(s), or leads to a private or reserved address."""
+
+
+def link_version(image_link):
+    """Return the short hash of ``image_link`` used to version thumbnail URLs."""
+    return hashlib.sha256(image_link.encode()).hexdigest()[:12]
+
+
+def thumbnail_url(kind, obj_id, image_link, width):
+    """
+    Build the URL of a thumbnail.
+
+    Args:
+        kind (str): 'artist' or 'venue'.
+        obj_id (int): The artist or venue ID.
+        image_link (str): The current ``image_link``, used to version the URL.
+        width (int): One of ``THUMBNAIL_SIZES``.
+
+    Returns:
+        str: The thumbnail URL, or '' when there is no image.
+    """
+    if not image_link:
+        return ''
+    return url_for('main.thumbnail', kind=kind, obj_id=obj_id, width=width,
+                   v=link_version(image_link))
+
+
+def thumbnail_srcset(kind, obj_id, image_link):
+    """Build an ``srcset`` attribute value listing every thumbnail width."""
+    if not image_link:
+        return ''
+    return ', '.join(f'{thumbnail_url(kind, obj_id, image_link, width)} {width}w'
+                     for width in current_app.config['THUMBNAIL_SIZES'])
+
+
+def _cache_path(*parts):
+    return os.path.join(current_app.config['THUMBNAIL_DIR'], *parts)
+
+
+def _object_path(digest, width):
+    return _cache_path('objects', digest[:2], f'{digest}-{width}.jpg')
+
+
+def _write_atomic(path, data):
+    """Write ``data`` to ``path`` so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _public_address(address):
+    """Return True if sources may be fetched from IP ``address``."""
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    if any(ip in ipaddress.ip_network(network)
+           for network in current_app.config['THUMBNAIL_ALLOWED_NETWORKS']):
+        return True
+    return not (ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved
+                or ip.is_multicast or ip.is_unspecified)
+
+
+def _check_host(host, port):
+    """Raise UnsafeSourceError unless every address ``host`` resolves to is public."""
+    for *_, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        if not _public_address(sockaddr[0]):
+            raise UnsafeSourceError(f'{host} resolves to {sockaddr[0]}, which is not a '
+                                    'public address')
+
+
+class _CheckedHTTPConnection(HTTPConnection):
+    """An HTTP connection refusing hosts on private or reserved addresses."""
+
+    def connect(self):
+        _check_host(self.host, self.port)
+        super().connect()
+        # Checked again: the name may resolve differently the second time.
+        peer = self.sock.getpeername()[0]
+        if not _public_address(peer):
+            self.sock.close()
+            raise UnsafeSourceError(f'{self.host} connected to {peer}, which is not a '
+                                    'public address')
+
+
+class _CheckedHTTPSConnection(HTTPSConnection, _CheckedHTTPConnection):
+    """The HTTPS counterpart, checking the address before the TLS handshake."""
+
+
+class _CheckedHTTPHandler(HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_CheckedHTTPConnection, req)
+
+
+class _CheckedHTTPSHandler(HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_CheckedHTTPSConnection, req)
+
+
+class _CheckedRedirectHandler(HTTPRedirectHandler):
+    """Follow redirects to http(s) URLs only; the new host is checked on connect."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urlsplit(newurl).scheme not in ('http', 'https'):
+            raise UnsafeSourceError(f'{req.full_url} redirects to {newurl!r}')
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_opener = build_opener(ProxyHandler({}), _CheckedHTTPHandler, _CheckedHTTPSHandler,
+                       _CheckedRedirectHandler)
+
+
+def _fetch(image_link):
+    """Download the source image, refusing anything over THUMBNAIL_MAX_SOURCE_BYTES."""
+    if not image_link.startswith(('http://', 'https://')):
+        raise UnsafeSourceError(f'Unsupported image URL {image_link!r}')
+
+    limit = current_app.config['THUMBNAIL_MAX_SOURCE_BYTES']
+    request = Request(image_link, headers={'User-Agent': 'fyyur-thumbnails'})
+    try:
+        with _opener.open(request, timeout=current_app.config['THUMBNAIL_FETCH_TIMEOUT']) as response:
+            data = response.read(limit + 1)
+    except (URLError, OSError, ValueError) as exc:
+        raise ThumbnailError(f'Could not fetch {image_link}: {exc}') from exc
+    if len(data) > limit:
+        raise ThumbnailError(f'{image_link} is larger than {limit} bytes')
+    return data
+
+
+def _decode(source):
+    """Decode the source image into an upright RGB image, refusing more than THUMBNAIL_MAX_PIXELS."""
+    # Only the thumbnail route needs Pillow.
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    limit = current_app.config['THUMBNAIL_MAX_PIXELS']
+    try:
+        with Image.open(io.BytesIO(source)) as image:
+            # Opening reads only the header; a small, highly compressible
+            # source can still decode to hundreds of megabytes.
+            if image.width * image.height > limit:
+                raise ThumbnailError(f'Image of {image.width}x{image.height} is larger '
+                                     f'than {limit} pixels')
+            return ImageOps.exif_transpose(image).convert('RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        raise ThumbnailError(f'Could not decode image: {exc}') from exc
+
+
+def _encode(image, width):
+    """Resize ``image`` to ``width`` pixels wide (never upscaling) and encode it as JPEG."""
+    from PIL import Image
+
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def get_thumbnail(image_link, width):
+    """
+    Return the cached thumbnail of ``image_link``, creating it on first use.
+
+    Args:
+        image_link (str): Source image URL.
+        width (int): One of ``THUMBNAIL_SIZES``.
+
+    Returns:
+        tuple: Path of the JPEG file and its content digest (for the ETag).
+
+    Raises:
+        UnsafeSourceError: If the source URL is refused.
+        ThumbnailError: If the source cannot be fetched or decoded.
+    """
+    url_index = _cache_path('urls', hashlib.sha256(image_link.encode()).hexdigest())
+    try:
+        with open(url_index) as index_file:
+            digest = index_file.read().strip()
+    except FileNotFoundError:
+        digest = None
+
+    if digest and os.path.exists(_object_path(digest, width)):
+        return _object_path(digest, width), digest
+
+    failure = failed_sources.get(image_link)
+    if failure is not None:
+        raise failure(f'{image_link} failed recently')
+    try:
+        source = _fetch(image_link)
+        digest = hashlib.sha256(source).hexdigest()
+        missing = [size for size in current_app.config['THUMBNAIL_SIZES']
+                   if not os.path.exists(_object_path(digest, size))]
+        if missing:
+            image = _decode(source)
+    except ThumbnailError as exc:
+        # Undecodable or oversized sources too, so they are not downloaded
+        # again for every tile showing them.
+        failed_sources.set(image_link, type(exc))
+        raise
+    for size in missing:
+        _write_atomic(_object_path(digest, size), _encode(image, size))
+    _write_atomic(url_index, digest.encode())
+    return _object_path(digest, width), digest
+
+
+def init_app(app):
+    """
+    Expose the thumbnail URL helpers to templates.
+
+    Args:
+        app (Flask): The application being configured.
+    """
+    app.jinja_env.globals.update(thumbnail_url=thumbnail_url,
+                                 thumbnail_srcset=thumbnail_srcset)
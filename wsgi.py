@@ -0,0 +1,54 @@
+"""
+WSGI entry point for running Fyyur under a preforking server.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With ``preload_app`` the master imports this module once, so the warm-up
+below runs before any worker is forked and every worker starts with compiled
+templates, loaded locale data and configured mappers instead of paying for
+them on its first request.
+"""
+
+import gc
+
+from sqlalchemy.orm import configure_mappers
+
+from app import create_app
+from models import db
+
+
+def warm_up(application):
+    """
+    Do the one-off work every worker would otherwise repeat on first use.
+
+    Args:
+        application (Flask): The application to warm up.
+    """
+    # Compile every template into the Jinja cache.
+    jinja_env = application.jinja_env
+    for name in jinja_env.list_templates(extensions=('html',)):
+        jinja_env.get_template(name)
+
+    # Load the Babel locale data and dateutil parser used by the datetime filter.
+    jinja_env.filters['datetime']('2019-05-21T21:30:00', 'full')
+    jinja_env.filters['datetime']('2019-05-21T21:30:00', 'medium')
+
+    # Build the URL matcher.
+    application.url_map.bind('localhost').match('/')
+
+    # Resolve relationships and compile mapper state.
+    configure_mappers()
+
+    # Connections must never be shared between forked processes, including
+    # those of the region shard binds.
+    with application.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+app = create_app('production')
+warm_up(app)
+
+# Move everything created so far into the permanent generation, so the
+# collector in the workers never touches (and copies) these pages.
+gc.freeze()